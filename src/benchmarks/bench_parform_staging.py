@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# bench_parform_staging.py
+#
+# usage (from src directory):
+# python3 -m benchmarks.bench_parform_staging [-n REPEATS] [--paragraph_dir DIR] [--num_files N] [--save]
+#
+# Times the parform conversion done when staging NER/CoreNLP input: PubTator
+# files for chem_ner/gene_ner/disease_ner and plaintext files for prep_corenlp.
+# Each file is converted with:
+#
+#   readlines:  reformat.parse_parform_file + parform_to_pubtator/plaintext
+#               (the original path)
+#   mmap:       reformat.parform_file_to_pubtator/plaintext
+#   packed:     the same conversion, reading all documents from a single pack
+#               file (reformat.pack_parform_files) instead of one file each
+#
+# With --save, converted files are also saved to a temporary directory (with
+# util.save_file, or util.save_file_bytes for the mmap and packed paths)
+#
+# Uses a synthetic corpus unless --paragraph_dir is given, and checks that all
+# three paths produce identical output
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from glob import glob
+
+from preprocess import reformat
+from preprocess.util import (save_file,
+                             save_file_bytes)
+
+def create_synthetic_corpus(directory, num_files, seed=0):
+
+    ''' Writes num_files parform files (a title, usually an abstract and
+        5-30 paragraphs, 1 in 50 of which contains a pipe character) to
+        directory
+
+        Returns a list of the file paths
+    '''
+
+    rng = random.Random(seed)
+    words = ['protein', 'kinase', 'inhibitor', 'expression', 'cells', 'the',
+             'of', 'and', 'in', 'BRCA1', 'p53', '(PKC)', 'was', 'mice']
+
+    def sentence(n):
+        return ' '.join(rng.choice(words) for _ in range(n)).capitalize()+'.'
+
+    file_paths = []
+    for i in range(num_files):
+        lines = ['title\t'+sentence(12)]
+        if rng.random() < 0.9:
+            lines.append('abs\t'+' '.join(sentence(20) for _ in range(8)))
+        lines.extend('p\t'+' '.join(sentence(20) for _ in range(6))
+                     for _ in range(rng.randint(5, 30)))
+        lines = [line.replace(' of ', ' | ', 1) if rng.random() < 0.02 else line
+                 for line in lines]
+
+        file_path = os.path.join(directory, '10.1234%2Fsynthetic.{}'.format(i))
+        with open(file_path, 'w') as f:
+            f.write('\n'.join(lines)+'\n')
+        file_paths.append(file_path)
+
+    return file_paths
+
+# each converter yields (escaped_doi, file contents) for the documents in its
+# source, with file contents as they are passed to save_file (a list of lines)
+# or save_file_bytes (bytes)
+
+def readlines_pubtator(file_paths):
+    for file_path in file_paths:
+        parsed = reformat.parse_parform_file(file_path)
+        if parsed:
+            yield reformat.parform_to_pubtator(*parsed)
+
+def mmap_pubtator(file_paths):
+    for file_path in file_paths:
+        converted = reformat.parform_file_to_pubtator(file_path)
+        if converted:
+            yield converted
+
+def packed_pubtator(pack_path):
+    for escaped_doi, buf, start, end in reformat.iter_packed_parform(pack_path):
+        converted = reformat.parform_buffer_to_pubtator(escaped_doi, buf, start, end)
+        if converted:
+            yield converted
+
+def readlines_plaintext(file_paths):
+    for file_path in file_paths:
+        escaped_doi, title_line, body = reformat.parse_parform_file(file_path)
+        yield escaped_doi, reformat.parform_to_plaintext(title_line, body,
+                                                         newlines=True,
+                                                         period_following_title=True)
+
+def mmap_plaintext(file_paths):
+    for file_path in file_paths:
+        yield reformat.parform_file_to_plaintext(file_path,
+                                                 newlines=True,
+                                                 period_following_title=True)
+
+def packed_plaintext(pack_path):
+    for escaped_doi, buf, start, end in reformat.iter_packed_parform(pack_path):
+        yield escaped_doi, reformat.parform_buffer_to_plaintext(buf, start, end,
+                                                                newlines=True,
+                                                                period_following_title=True)
+
+def as_bytes(file_contents):
+    if isinstance(file_contents, bytes):
+        return file_contents
+    return ''.join(file_contents).encode('utf-8')
+
+def time_converter(converter, source, repeats, save=False):
+
+    ''' Return (best time in seconds, {escaped_doi: file bytes}) of `repeats`
+        runs of converter over source
+
+        With save=True, each converted document is also saved (with save_file
+        or save_file_bytes) to a new temporary directory in each run
+    '''
+
+    best = float('inf')
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory() as output_dir:
+            start = time.perf_counter()
+            if save:
+                for escaped_doi, file_contents in converter(source):
+                    if isinstance(file_contents, bytes):
+                        save_file_bytes(escaped_doi, file_contents, output_dir)
+                    else:
+                        save_file(escaped_doi, file_contents, output_dir)
+            else:
+                for _ in converter(source):
+                    pass
+            best = min(best, time.perf_counter() - start)
+
+    return best, {escaped_doi: as_bytes(file_contents)
+                  for escaped_doi, file_contents in converter(source)}
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark parform to PubTator/plaintext staging')
+    parser.add_argument('-n', '--repeats', type=int, default=5,
+                        help='number of timed runs (best run is reported) (default 5)')
+    parser.add_argument('--paragraph_dir',
+                        help='directory of parform files (default: synthetic corpus)')
+    parser.add_argument('--num_files', type=int, default=2000,
+                        help='number of synthetic parform files (default 2000)')
+    parser.add_argument('--save', action='store_true',
+                        help='also time saving the converted files (default: conversion only)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.paragraph_dir:
+            file_paths = sorted(f for f in glob(os.path.join(args.paragraph_dir, '**', '*'), recursive=True)
+                                if os.path.isfile(f))
+        else:
+            file_paths = create_synthetic_corpus(tmpdir, args.num_files)
+
+        assert file_paths, 'No parform files found in {}'.format(args.paragraph_dir)
+
+        pack_path = os.path.join(tmpdir, 'parform.pack')
+        reformat.pack_parform_files(file_paths, pack_path)
+        total_mb = os.path.getsize(pack_path)/1e6
+
+        print('{} files ({:.1f} MB), best of {} runs{}'.format(len(file_paths), total_mb, args.repeats,
+                                                               ', including saving files' if args.save else ''))
+
+        for output_format, converters in (('PubTator', (('readlines', readlines_pubtator, file_paths),
+                                                        ('mmap', mmap_pubtator, file_paths),
+                                                        ('packed', packed_pubtator, pack_path))),
+                                          ('plaintext', (('readlines', readlines_plaintext, file_paths),
+                                                         ('mmap', mmap_plaintext, file_paths),
+                                                         ('packed', packed_plaintext, pack_path)))):
+            print('{}:'.format(output_format))
+            outputs = []
+            for name, converter, source in converters:
+                seconds, output = time_converter(converter, source, args.repeats, args.save)
+                outputs.append(output)
+                print('  {:10} {:8.1f} files/s {:8.1f} MB/s'.format(name,
+                                                                    len(file_paths)/seconds,
+                                                                    total_mb/seconds))
+
+            if all(output == outputs[0] for output in outputs[1:]):
+                print('  output identical for all files')
+            else:
+                print('  OUTPUT DIFFERS')
+
+if __name__ == '__main__':
+    main()
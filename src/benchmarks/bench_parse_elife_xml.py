@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# bench_parse_elife_xml.py
+#
+# usage (from src directory):
+# python3 -m benchmarks.bench_parse_elife_xml [-n REPEATS] [--xml_dir DIR]
+#
+# Times the BeautifulSoup (preprocess.parse_elife_xml) and lxml
+# (preprocess.parse_elife_lxml) eLife parsers on the same articles:
+# reading each file plus extracting its DOI, title, abstract, executive summary
+# and main text (the work done per article by parse_elife_xml.main()).
+#
+# Uses the unit test sample article unless --xml_dir is given, and checks that
+# both parsers produce identical output
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import warnings
+from glob import glob
+
+from preprocess import (parse_elife_lxml,
+                        parse_elife_xml)
+from tests.elife_sample_article import xml_file_string as sample_xml
+
+def extract_all(parser_module, file_path):
+
+    ''' Parse file_path with parser_module and return everything that
+        parse_elife_xml.main() extracts from an article
+    '''
+
+    tree = parser_module.read_file(file_path)
+    return (parser_module.get_doi(tree),
+            parser_module.get_title(tree),
+            parser_module.get_abstract(tree),
+            parser_module.get_exec_summary(tree),
+            parser_module.get_main_article(tree, keep_references=False))
+
+def time_parser(parser_module, file_paths, repeats):
+
+    ''' Return the best total time (in seconds) of `repeats` runs of
+        extract_all() over file_paths
+    '''
+
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for file_path in file_paths:
+            extract_all(parser_module, file_path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark BeautifulSoup vs. lxml eLife XML parsers')
+    parser.add_argument('-n', '--repeats', type=int, default=5,
+                        help='number of timed runs (best run is reported) (default 5)')
+    parser.add_argument('--xml_dir',
+                        help='directory of eLife XML articles (default: unit test sample article)')
+    args = parser.parse_args()
+
+    # parse_elife_xml warns about parsing XML with an HTML parser, and both
+    # parsers log missing executive summaries
+    warnings.simplefilter('ignore')
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.xml_dir:
+            file_paths = sorted(glob(os.path.join(args.xml_dir, '*.xml')))
+        else:
+            file_paths = [os.path.join(tmpdir, 'sample.xml')]
+            with open(file_paths[0], 'w') as f:
+                f.write(sample_xml)
+
+        assert file_paths, 'No XML files found in {}'.format(args.xml_dir)
+
+        mismatches = [file_path for file_path in file_paths
+                      if extract_all(parse_elife_xml, file_path) != extract_all(parse_elife_lxml, file_path)]
+
+        bs4_time = time_parser(parse_elife_xml, file_paths, args.repeats)
+        lxml_time = time_parser(parse_elife_lxml, file_paths, args.repeats)
+
+    print('{} articles, best of {} runs'.format(len(file_paths), args.repeats))
+    print('BeautifulSoup: {:8.2f} ms/article'.format(1000 * bs4_time / len(file_paths)))
+    print('lxml:          {:8.2f} ms/article'.format(1000 * lxml_time / len(file_paths)))
+    print('speedup:       {:8.1f}x'.format(bs4_time / lxml_time))
+
+    if mismatches:
+        print('Output differs for {} articles:'.format(len(mismatches)))
+        for file_path in mismatches:
+            print(file_path)
+    else:
+        print('Output identical for all articles')
+
+if __name__ == '__main__':
+    main()
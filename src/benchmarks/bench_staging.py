@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+# bench_staging.py
+#
+# usage (from src directory):
+# python3 -m benchmarks.bench_staging [-n REPEATS] [--paragraph_dir DIR] [--num_files N] [--nfiles N]
+#
+# Times cluster job input staging (chem_ner_cluster/disease_ner_cluster) and
+# NER output reorganization (chem_ner/disease_ner):
+#
+#   staging:        input files are divided into sublists of --nfiles files
+#                   (util.create_sublists_sized_n), and each sublist is staged
+#                   with:
+#       subprocess:     one `ln -s` process per file (the original
+#                       util.create_sublist_symlinks)
+#       symlink:        util.create_sublist_symlinks (os.symlink, with the
+#                       subdirectories of each sublist created up front)
+#       file list:      util.write_file_list (--file_lists)
+#
+#   reorganizing:   a flat directory of --num_files files is divided into
+#                   subdirectories of 1000 files with:
+#       shutil.move:    the original util.reorganize_directory
+#       os.rename:      util.reorganize_directory
+#
+# Uses a synthetic corpus of empty files unless --paragraph_dir is given (only
+# the file names matter), and checks that each implementation stages the same
+# files
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from glob import iglob
+
+from preprocess import util
+
+def create_synthetic_corpus(directory, num_files):
+
+    ''' Creates num_files empty files in subdirectories of 1000 files of
+        directory
+
+        Returns a list of the file paths
+    '''
+
+    file_paths = []
+    for i in range(num_files):
+        if i % 1000 == 0:
+            subdir = os.path.join(directory, '{0:0>4}'.format(i//1000))
+            os.makedirs(subdir)
+        file_path = os.path.join(subdir, '10.1234%2Fsynthetic.{}'.format(i))
+        open(file_path, 'w').close()
+        file_paths.append(file_path)
+
+    return file_paths
+
+def subprocess_sublist_symlinks(sublist, input_dir, max_files=1000):
+
+    ''' util.create_sublist_symlinks before it used os.symlink '''
+
+    for file_num, file_path in enumerate(sublist):
+        if not file_path:
+            continue
+        if file_num % max_files == 0:
+            subdir_name = '{0:0>4}'.format(file_num//max_files)
+            current_subdir = os.path.join(input_dir, subdir_name)
+            util.ensure_path_exists(current_subdir)
+
+        subprocess.check_call(['ln', '-s', file_path, '.'], cwd=current_subdir)
+
+def shutil_reorganize_directory(file_path, max_files_per_subdir=1000):
+
+    ''' util.reorganize_directory before it used os.rename '''
+
+    for file_num, file_path in enumerate(list(iglob(os.path.join(file_path, '*')))):
+        if file_num % max_files_per_subdir == 0:
+            current_subdir = os.path.join(os.path.dirname(file_path),
+                                          '{0:0>4}'.format(file_num//max_files_per_subdir))
+            os.mkdir(current_subdir)
+        shutil.move(file_path, current_subdir)
+
+# each stager stages one sublist at sublist_path (as chem_ner_cluster does)
+
+def stage_subprocess(sublist, sublist_path):
+    os.mkdir(sublist_path)
+    subprocess_sublist_symlinks(sublist, sublist_path, 1000)
+
+def stage_symlink(sublist, sublist_path):
+    os.mkdir(sublist_path)
+    util.create_sublist_symlinks(sublist, sublist_path, 1000)
+
+def stage_file_list(sublist, sublist_path):
+    util.write_file_list(sublist, sublist_path+'.txt')
+
+def staged_files(input_directory):
+
+    ''' Returns a sorted list of the source paths staged in input_directory
+        (as symlinks or file lists)
+    '''
+
+    source_paths = []
+    for dirpath, _, names in os.walk(input_directory):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                source_paths.append(os.readlink(path))
+            else:
+                source_paths.extend(util.iter_input_files(path))
+
+    return sorted(source_paths)
+
+def time_stager(stager, file_paths, nfiles, repeats):
+
+    ''' Return (best time in seconds, staged source paths) of `repeats` runs
+        of stager over file_paths, in sublists of nfiles files
+    '''
+
+    best = float('inf')
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory() as input_directory:
+            start = time.perf_counter()
+            for sublist_num, sublist in enumerate(util.create_sublists_sized_n(file_paths, nfiles)):
+                stager(sublist, os.path.join(input_directory, 'sublist_{0:0>4}'.format(sublist_num)))
+            best = min(best, time.perf_counter() - start)
+            staged = staged_files(input_directory)
+
+    return best, staged
+
+def time_reorganizer(reorganizer, num_files, repeats):
+
+    ''' Return (best time in seconds, sorted relative paths of the
+        reorganized files) of `repeats` runs of reorganizer on a new
+        directory of num_files files
+    '''
+
+    best = float('inf')
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory() as output_directory:
+            for i in range(num_files):
+                open(os.path.join(output_directory, '{}.tmChem'.format(i)), 'w').close()
+            start = time.perf_counter()
+            reorganizer(output_directory, 1000)
+            best = min(best, time.perf_counter() - start)
+            reorganized = sorted(len(os.listdir(os.path.join(output_directory, subdir)))
+                                 for subdir in os.listdir(output_directory))
+
+    return best, reorganized
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark cluster job input staging and output reorganization')
+    parser.add_argument('-n', '--repeats', type=int, default=3,
+                        help='number of timed runs (best run is reported) (default 3)')
+    parser.add_argument('--paragraph_dir',
+                        help='directory of parform files to stage (default: synthetic corpus)')
+    parser.add_argument('--num_files', type=int, default=5000,
+                        help='number of synthetic files (and files reorganized) (default 5000)')
+    parser.add_argument('--nfiles', type=int, default=500,
+                        help='number of files per sublist (as chem_ner_cluster --nfiles) (default 500)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.paragraph_dir:
+            file_paths = [os.path.abspath(path) for path in util.iter_corpus_files(args.paragraph_dir)]
+        else:
+            file_paths = create_synthetic_corpus(tmpdir, args.num_files)
+
+        assert file_paths, 'No files found in {}'.format(args.paragraph_dir)
+
+        print('Staging {} files in sublists of {}, best of {} runs:'.format(len(file_paths),
+                                                                           args.nfiles,
+                                                                           args.repeats))
+        outputs = []
+        for name, stager in (('subprocess', stage_subprocess),
+                             ('symlink', stage_symlink),
+                             ('file list', stage_file_list)):
+            seconds, output = time_stager(stager, file_paths, args.nfiles, args.repeats)
+            outputs.append(output)
+            print('  {:12} {:8.3f} s {:10.1f} files/s'.format(name, seconds, len(file_paths)/seconds))
+        print('  same files staged by all' if all(output == outputs[0] for output in outputs[1:])
+              else '  STAGED FILES DIFFER')
+
+    print('Reorganizing {} files into subdirectories, best of {} runs:'.format(args.num_files, args.repeats))
+    outputs = []
+    for name, reorganizer in (('shutil.move', shutil_reorganize_directory),
+                              ('os.rename', util.reorganize_directory)):
+        seconds, output = time_reorganizer(reorganizer, args.num_files, args.repeats)
+        outputs.append(output)
+        print('  {:12} {:8.3f} s {:10.1f} files/s'.format(name, seconds, args.num_files/seconds))
+    print('  same subdirectory sizes for both' if outputs[0] == outputs[1]
+          else '  SUBDIRECTORIES DIFFER')
+
+if __name__ == '__main__':
+    main()
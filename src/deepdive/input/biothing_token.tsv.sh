@@ -2,14 +2,17 @@
 
 # generates biothing_token loader scripts
 # (run in parallel by deepdive framework)
+# each loader also writes its chunk's biothing_token_agg rows to
+# udf/biothing_agg_import/ba-[chunk].tsv (loaded by run.sh)
 
 MINCHUNK=$1
 MAXCHUNK=$2
 BIOTHING_DIR="udf/biothing_import"
-mkdir -p $BIOTHING_DIR
+BIOTHING_AGG_DIR="udf/biothing_agg_import"
+mkdir -p $BIOTHING_DIR $BIOTHING_AGG_DIR
 
 for i in `seq $MINCHUNK $MAXCHUNK`; do
-    echo udf/load_biothing_tokens.py $i $MAXCHUNK > $BIOTHING_DIR"/b-"$i".tsv.sh"
+    echo udf/load_biothing_tokens.py $i $MAXCHUNK $BIOTHING_AGG_DIR"/ba-"$i".tsv" > $BIOTHING_DIR"/b-"$i".tsv.sh"
 done
 
 chmod +x $BIOTHING_DIR/b-*.tsv.sh
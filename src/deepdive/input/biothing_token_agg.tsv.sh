@@ -0,0 +1,5 @@
+#!/bin/bash
+
+# biothing_token_agg rows are written by the biothing_token loaders in the
+# same pass as biothing_token (see biothing_token.tsv.sh), and loaded from
+# udf/biothing_agg_import/ba-*.tsv by run.sh, so there is nothing to generate
@@ -0,0 +1,6 @@
+#!/bin/bash
+
+# loads the train/dev/test split of each document
+# (from train_dev_test_ids_json in bioshovel_config.json)
+
+udf/load_doc_split.py
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+# for fetching the full text of an article whose `articles.content` column
+# holds a content reference (see 'article_content' in bioshovel_config.json)
+#
+# run using:
+# cd [bioshovel/src/deepdive]
+# `deepdive env python3 misc/get_article_content.py [doc_id]`
+
+import os
+os.chdir(os.environ['CURRENT_DD_APP'])
+import subprocess
+import sys
+from udf.util import read_article_content
+
+def get_article_row(doc_id):
+
+    ''' Return (article_archive, content) for doc_id from the articles table
+    '''
+
+    query = "SELECT article_archive, content FROM articles WHERE doc_id = '{}' LIMIT 1".format(doc_id.replace("'", "''"))
+    out = subprocess.check_output(['deepdive', 'sql', 'eval', query, 'format=tsv'])
+    line = out.decode('utf-8').rstrip('\n')
+    if not line:
+        return None
+
+    article_archive, content = line.split('\t', 1)
+    return article_archive, content
+
+def main():
+
+    assert len(sys.argv) == 2, 'Need a doc_id'
+    row = get_article_row(sys.argv[1])
+    if not row:
+        print('No article found for doc_id {}'.format(sys.argv[1]), file=sys.stderr)
+        sys.exit(1)
+
+    article_archive, content = row
+    if content.startswith('tar:'):
+        print(read_article_content(article_archive, content))
+    else:
+        # content was loaded inline
+        print(content)
+
+if __name__ == '__main__':
+    main()
@@ -42,6 +42,10 @@ deepdive do articles
 input/articles.tsv.sh $MINCHUNK $MAXCHUNK
 deepdive load articles udf/article_import/a-*.tsv.sh
 
+# load train/dev/test split (used for the calibration holdout set)
+deepdive do doc_split
+deepdive sql "CREATE INDEX doc_split_doc_id_idx ON doc_split (doc_id)"
+
 # load sentences
 deepdive do sentences
 input/sentences.tsv.sh $MINCHUNK $MAXCHUNK
@@ -52,6 +56,12 @@ deepdive do biothing_token
 input/biothing_token.tsv.sh $MINCHUNK $MAXCHUNK
 deepdive load biothing_token udf/biothing_import/b-*.tsv.sh
 
+# load per-sentence biothing_token aggregates (used for feature extraction),
+# written by the biothing_token loaders
+deepdive do biothing_token_agg
+deepdive load biothing_token_agg udf/biothing_agg_import/ba-*.tsv
+deepdive sql "CREATE INDEX biothing_token_agg_doc_sentence_idx ON biothing_token_agg (doc_id, sentence_index)"
+
 # create corenlp_token (from sentences table)
 deepdive do corenlp_token
 
@@ -61,6 +71,17 @@ deepdive do mention
 # create chemical_disease_candidate table
 deepdive do chemical_disease_candidate
 
+# prune candidates with the `candidate_filter` rules in bioshovel_config.json
+# (no statements are printed if the filter is disabled)
+FILTERSQL=`python3 udf/filter_chemical_disease_candidates.py`
+if [ -n "$FILTERSQL" ]; then
+    deepdive sql "SELECT COUNT(*) AS candidates_before_filter FROM chemical_disease_candidate"
+    while read -r STATEMENT; do
+        deepdive sql "$STATEMENT"
+    done <<< "$FILTERSQL"
+    deepdive sql "SELECT COUNT(*) AS candidates_after_filter FROM chemical_disease_candidate"
+fi
+
 # create chemical_disease_feature table and extract features using UDF
 deepdive do chemical_disease_feature
 
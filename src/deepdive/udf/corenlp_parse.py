@@ -161,9 +161,13 @@ class NLPParser(object):
 
         return single_row
 
-    def get_biothing_tokens(self):
+    def get_biothing_tokens(self, agg_rows=None):
 
         ''' A generator for associated biothing tokens
+
+            If agg_rows (a list) is given, a biothing_token_agg row is also
+            appended to it for each sentence with at least one matched
+            biothing, in the same pass over the sentences
         '''
 
         # biothing_token(
@@ -178,12 +182,20 @@ class NLPParser(object):
         #     pubtator_end_char   int
         # ).
 
+        # biothing_token_agg(
+        #     doc_id              text,
+        #     sentence_index      int,
+        #     types               text[],
+        #     token_ids           int[]
+        # ).
+
         if not self.pubtator_ner_updated:
             self.update_ner_pubtator()
 
         for sentence_row in self:
             biothings_for_sentence = self.pubtator.sentence_ner[self.sent_index]
-            for biothing in [bt for bt in biothings_for_sentence if bt.matched_corenlp_token]:
+            matched = [bt for bt in biothings_for_sentence if bt.matched_corenlp_token]
+            for biothing in matched:
                 bt_type = biothing.ner_type
                 for concept_id in biothing.concept_id:
                     row = '\t'.join([biothing.ner_type,
@@ -196,6 +208,13 @@ class NLPParser(object):
                                      str(biothing.start_char),
                                      str(biothing.end_char)])
                 yield row
+            if agg_rows is not None and matched:
+                types = '{'+','.join('"{}"'.format(bt.ner_type) for bt in matched)+'}'
+                token_ids = '{'+','.join(str(bt.matched_corenlp_token) for bt in matched)+'}'
+                agg_rows.append('\t'.join([self.doc_id,
+                                           str(self.sent_index),
+                                           types,
+                                           token_ids]))
 
     def get_cid_filtered_sentence_rows(self):
 
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import os
+os.chdir(os.environ['CURRENT_DD_APP'])
+from util import (load_config,
+                  printl)
+
+def quote(value):
+    return "'{}'".format(value.replace("'", "''"))
+
+def get_filter_statements(conf):
+
+    ''' Returns a list of SQL statements that delete the rows of the
+        'chemical_disease_candidate' table that fail the blocking rules in
+        the 'candidate_filter' section of the config:
+
+        max_token_distance (maximum number of tokens between the mentions)
+        mesh_ids (if non-empty, the MeSH IDs both mentions must be in)
+        deduplicate (keep one pair per chemical MeSH ID, disease MeSH ID,
+                     and sentence)
+
+        Returns an empty list if the section is missing or 'enabled' is false
+    '''
+
+    filter_conf = conf.get('candidate_filter', {})
+    if not filter_conf.get('enabled', False):
+        return []
+
+    statements = []
+
+    max_distance = filter_conf.get('max_token_distance')
+    if max_distance is not None:
+        statements.append(
+            'DELETE FROM chemical_disease_candidate c '
+            'USING mention chem, mention disease '
+            'WHERE chem.mention_id = c.chem_id '
+            'AND disease.mention_id = c.disease_id '
+            'AND GREATEST(disease.token_start_index - chem.token_end_index, '
+            'chem.token_start_index - disease.token_end_index, 0) > {:d}'.format(int(max_distance)))
+
+    mesh_ids = filter_conf.get('mesh_ids')
+    if mesh_ids:
+        mesh_id_list = ', '.join(quote(mesh_id) for mesh_id in sorted(set(mesh_ids)))
+        statements.append(
+            'DELETE FROM chemical_disease_candidate '
+            'WHERE chem_mesh_id NOT IN ({0}) '
+            'OR disease_mesh_id NOT IN ({0})'.format(mesh_id_list))
+
+    if filter_conf.get('deduplicate', False):
+        # keeps the first pair (by mention IDs) of each
+        # (doc_id, sentence_index, chem_mesh_id, disease_mesh_id)
+        statements.append(
+            'DELETE FROM chemical_disease_candidate '
+            'WHERE (chem_id, disease_id) IN ('
+            'SELECT chem_id, disease_id FROM ('
+            'SELECT c.chem_id, c.disease_id, ROW_NUMBER() OVER ('
+            'PARTITION BY c.doc_id, chem.sentence_index, c.chem_mesh_id, c.disease_mesh_id '
+            'ORDER BY c.chem_id, c.disease_id) AS pair_rank '
+            'FROM chemical_disease_candidate c '
+            'JOIN mention chem ON chem.mention_id = c.chem_id) ranked '
+            'WHERE pair_rank > 1)')
+
+    return statements
+
+def main(conf):
+
+    ''' Print the candidate filter SQL statements (see
+        get_filter_statements()), one per line, for run.sh to apply after
+        'chemical_disease_candidate' is created (nothing is printed if the
+        filter is disabled)
+    '''
+
+    statements = get_filter_statements(conf)
+    if statements:
+        printl('Candidate filter: {} blocking rules enabled'.format(len(statements)))
+    for statement in statements:
+        print(statement)
+
+if __name__ == '__main__':
+    conf = load_config()
+    main(conf)
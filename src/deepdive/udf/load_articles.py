@@ -10,8 +10,16 @@ import tempfile
 from pathlib import Path
 from util import (filter_files_from_tar,
                   load_config,
+                  make_content_reference,
                   printl)
 
+# values for the 'article_content' config option:
+#   'inline'    - full article text in the content column
+#   'null'      - content column left NULL
+#   'reference' - content column holds a byte-offset reference into the
+#                 article archive (see util.read_article_content)
+ARTICLE_CONTENT_MODES = ('inline', 'null', 'reference')
+
 def clean_string(contents, newline_replacement='//n'):
 
     ''' Replace tabs in contents with a single space
@@ -19,7 +27,7 @@ def clean_string(contents, newline_replacement='//n'):
 
     return contents.replace('\t', ' ').replace('\n', newline_replacement)
 
-def print_article_info(filepath, article_archive_path_str, train_dev_test_dict):
+def print_article_info(filepath, article_archive_path_str, train_dev_test_dict, content=None):
 
     ''' Given a filepath, print the file contents as a tab-delimited tuple:
 
@@ -27,6 +35,9 @@ def print_article_info(filepath, article_archive_path_str, train_dev_test_dict):
 
         where file_contents has all tabs replaced by spaces, and filepaths are relative
 
+        If content is given, it is printed instead of file_contents (and the
+        file at filepath is not read)
+
         This is for the 'articles' table schema:
 
         articles(
@@ -50,21 +61,45 @@ def print_article_info(filepath, article_archive_path_str, train_dev_test_dict):
     relative_pubtator_filepath_str = str(Path('pubtator')/filename_stem)
     # test_set = 'test' if filename_stem in test_set_pmids else 'traindev'
 
-    with open(filepath_str) as f:
-        print(filename_stem,
-              clean_string(f.read()),
-              article_archive_path_str,
-              relative_input_filepath_str,
-              relative_corenlp_filepath_str,
-              relative_pubtator_filepath_str,
-              train_dev_test_dict.get(filename_stem, ''), # returns 'train', 'test', 'dev', or empty string
-              sep='\t')
+    if content is None:
+        with open(filepath_str) as f:
+            content = clean_string(f.read())
+
+    print(filename_stem,
+          content,
+          article_archive_path_str,
+          relative_input_filepath_str,
+          relative_corenlp_filepath_str,
+          relative_pubtator_filepath_str,
+          train_dev_test_dict.get(filename_stem, ''), # returns 'train', 'test', 'dev', or empty string
+          sep='\t')
+
+def print_archive_article_info(tar, article_archive_path_str, train_dev_test_dict, content_mode):
+
+    ''' Print article info for all input_files in an open TarFile without
+        extracting them, with the content column set according to content_mode
+        ('null' or 'reference')
+    '''
+
+    for i, tfmem in enumerate(filter_files_from_tar(tar, 'input_files')):
+        if content_mode == 'reference':
+            content = make_content_reference(tfmem)
+        else:
+            content = '\\N' # PostgreSQL NULL
+        print_article_info(Path(tfmem.name), article_archive_path_str, train_dev_test_dict, content=content)
+        if i % 500 == 0:
+            printl('Processed file {} of chunk'.format(i))
 
 def main(conf, current_chunk, total_chunks):
 
     printl('Loading article data, Chunk {} of {}'.format(current_chunk,
                                                           total_chunks))
 
+    content_mode = conf.get('article_content', 'inline')
+    if content_mode not in ARTICLE_CONTENT_MODES:
+        printl('Article loader - unknown article_content mode: {}'.format(content_mode))
+        sys.exit(1)
+
     if conf['data_tgz']:
         article_list = glob.glob(os.path.join(conf['data_directory'], '*.tgz'))
     else:
@@ -85,6 +120,11 @@ def main(conf, current_chunk, total_chunks):
 
     for article_archive in article_chunk:
         printl(article_archive)
+        if content_mode != 'inline':
+            with tarfile.open(article_archive, "r:gz") as tar:
+                print_archive_article_info(tar, article_archive, train_dev_test_dict, content_mode)
+            continue
+
         with tarfile.open(article_archive, "r:gz") as tar, tempfile.TemporaryDirectory() as td:
             input_files = filter_files_from_tar(tar, 'input_files')
 
@@ -10,9 +10,17 @@ import tempfile
 from corenlp_parse import NLPParser
 from util import (filter_files_from_tar,
                   load_config,
+                  print_rows_from_pool,
                   printl)
 
-def parse_corenlp_output(conf, filepath, pubtator_file_path):
+def parse_corenlp_output(conf_filepaths_tuple):
+
+    ''' Return (biothing_token rows, biothing_token_agg rows) for a single
+        CoreNLP output file, from one pass over its sentences
+        (run in a process pool, see util.print_rows_from_pool)
+    '''
+
+    conf, filepath, pubtator_file_path = conf_filepaths_tuple
 
     if conf['fuzzy_ner_match']:
         fuzzy_ratio = conf['fuzzy_ratio']
@@ -25,12 +33,11 @@ def parse_corenlp_output(conf, filepath, pubtator_file_path):
     if pubtator_file_path:
         if not nlp_parser.update_ner_pubtator():
             printl('Unable to update generic NER with PubTator matches')
-    for row in nlp_parser.get_biothing_tokens():
-        print(row, flush=True)
+    agg_rows = []
+    rows = list(nlp_parser.get_biothing_tokens(agg_rows=agg_rows))
+    return rows, agg_rows
 
-    return None
-
-def main(conf, current_chunk, total_chunks):
+def main(conf, current_chunk, total_chunks, agg_path):
     # doc_id         text,
     # sentence_index int,
     # sentence_text  text,
@@ -54,6 +61,7 @@ def main(conf, current_chunk, total_chunks):
         printl('Sentence loader - Chunk {} - multiple files found: {} (importing anyway)'.format(current_chunk,
                                                                                                  str(article_chunk)))
 
+    agg_file = open(agg_path+'.part', 'w')
     for article_archive in article_chunk:
         printl(article_archive)
         with tarfile.open(article_archive, "r:gz") as tar, tempfile.TemporaryDirectory() as td:
@@ -84,12 +92,19 @@ def main(conf, current_chunk, total_chunks):
                 # pubtator_filepaths = [None for _ in output_filepaths]
                 sys.exit(1)
 
-            for i, (fp, pubtator_fp) in enumerate(zip(output_filepaths, pubtator_filepaths)):
-                parse_corenlp_output(conf, fp, pubtator_fp)
-                if i % 1000 == 0:
-                    printl('Processed file {} of chunk'.format(i))
+            print_rows_from_pool(parse_corenlp_output,
+                                 [(conf, fp, pubtator_fp) for fp, pubtator_fp in zip(output_filepaths, pubtator_filepaths)],
+                                 poolsize=conf.get('loader_poolsize', 1),
+                                 ordered=conf.get('loader_ordered_output', True),
+                                 side_file=agg_file)
+
+    # (renamed once complete, so a failed chunk's rows aren't loaded)
+    agg_file.close()
+    os.replace(agg_path+'.part', agg_path)
 
 if __name__ == '__main__':
     conf = load_config()
-    _, current_chunk, total_chunks = sys.argv
-    main(conf, int(current_chunk), int(total_chunks))
+    # biothing_token rows are printed, and biothing_token_agg rows are
+    # written to agg_path (loaded by run.sh)
+    _, current_chunk, total_chunks, agg_path = sys.argv
+    main(conf, int(current_chunk), int(total_chunks), agg_path)
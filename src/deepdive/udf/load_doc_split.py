@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import json
+import os
+os.chdir(os.environ['CURRENT_DD_APP'])
+from util import (load_config,
+                  printl)
+
+def main(conf):
+
+    ''' Print the train/dev/test split of each document as a tab-delimited
+        tuple for the 'doc_split' table:
+
+        doc_split(
+            doc_id  text,
+            split   text
+        ).
+    '''
+
+    with open(conf['train_dev_test_ids_json']) as f:
+        train_dev_test_dict = json.load(f)
+
+    printl('Loading train/dev/test split for {} documents'.format(len(train_dev_test_dict)))
+
+    for doc_id, split in sorted(train_dev_test_dict.items()):
+        print(doc_id, split, sep='\t')
+
+if __name__ == '__main__':
+    conf = load_config()
+    main(conf)
@@ -10,9 +10,16 @@ import tempfile
 from corenlp_parse import NLPParser
 from util import (filter_files_from_tar,
                   load_config,
+                  print_rows_from_pool,
                   printl)
 
-def parse_corenlp_output(conf, filepath, pubtator_file_path):
+def parse_corenlp_output(conf_filepaths_tuple):
+
+    ''' Parse a single CoreNLP output file and return its sentences table rows
+        (run in a process pool, see util.print_rows_from_pool)
+    '''
+
+    conf, filepath, pubtator_file_path = conf_filepaths_tuple
 
     if conf['fuzzy_ner_match']:
         fuzzy_ratio = conf['fuzzy_ratio']
@@ -25,10 +32,8 @@ def parse_corenlp_output(conf, filepath, pubtator_file_path):
     # if pubtator_file_path:
     #     if nlp_parser.update_ner_pubtator():
     #         printl('Updated generic NER with PubTator matches')
-    for i, row in enumerate(nlp_parser):
-        print(row, flush=True)
 
-    return None
+    return list(nlp_parser)
 
 def main(conf, current_chunk, total_chunks):
     # doc_id         text,
@@ -84,10 +89,10 @@ def main(conf, current_chunk, total_chunks):
             #     pubtator_filepaths = [None for _ in output_filepaths]
             pubtator_filepaths = [None for _ in output_filepaths]
 
-            for i, (fp, pubtator_fp) in enumerate(zip(output_filepaths, pubtator_filepaths)):
-                parse_corenlp_output(conf, fp, pubtator_fp)
-                if i % 1000 == 0:
-                    printl('Processed file {} of chunk'.format(i))
+            print_rows_from_pool(parse_corenlp_output,
+                                 [(conf, fp, pubtator_fp) for fp, pubtator_fp in zip(output_filepaths, pubtator_filepaths)],
+                                 poolsize=conf.get('loader_poolsize', 1),
+                                 ordered=conf.get('loader_ordered_output', True))
 
 if __name__ == '__main__':
     conf = load_config()
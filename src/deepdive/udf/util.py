@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
+import gzip
 import json
+import multiprocessing as mp
 import sys
 
 def load_config(filename='bioshovel_config.json'):
@@ -31,3 +33,68 @@ def filter_files_from_tar(tarfile_obj, filter_string):
     for tfmem in tarfile_obj.getmembers():
         if tfmem.isfile() and filter_string in tfmem.name:
             yield tfmem
+
+def make_content_reference(tarinfo_obj):
+
+    ''' Given a TarInfo object, return a reference string to the file's
+        contents within the (uncompressed) tar stream of its archive:
+
+        tar:[byte_offset]:[size_in_bytes]
+    '''
+
+    return 'tar:{}:{}'.format(tarinfo_obj.offset_data, tarinfo_obj.size)
+
+def read_article_content(article_archive, content_reference):
+
+    ''' Given the path to a .tgz article archive and a content reference
+        created by make_content_reference, return the referenced file contents
+        as a string
+
+        (seeks within the decompressed tar stream, so no other archive members
+         are extracted)
+    '''
+
+    prefix, offset, size = content_reference.split(':')
+    if prefix != 'tar':
+        raise ValueError('Not a content reference: {}'.format(content_reference))
+
+    with gzip.open(article_archive, 'rb') as f:
+        f.seek(int(offset))
+        return f.read(int(size)).decode('utf-8')
+
+def print_rows_from_pool(function, arg_tuples, poolsize=1, ordered=True, log_every=1000,
+                         side_file=None):
+
+    ''' Apply function to each item of arg_tuples (one per document) using a
+        process pool of size poolsize, and print the returned lists of table
+        rows to STDOUT from this process only (so output lines from different
+        documents are never interleaved)
+
+        If ordered is True, rows are printed in the order of arg_tuples.
+        Otherwise they are printed as soon as each document is done.
+
+        (poolsize of 1 runs everything in this process; None uses all cores)
+
+        With side_file (an open file), function returns a tuple of (rows,
+        side_rows) instead, and side_rows (rows of another table, produced
+        in the same pass) are written to side_file
+    '''
+
+    def write_rows(results):
+        for i, rows in enumerate(results):
+            if side_file is not None:
+                rows, side_rows = rows
+                if side_rows:
+                    side_file.write('\n'.join(side_rows)+'\n')
+            if rows:
+                sys.stdout.write('\n'.join(rows)+'\n')
+                sys.stdout.flush()
+            if i % log_every == 0:
+                printl('Processed file {} of chunk'.format(i))
+
+    if poolsize == 1:
+        write_rows(map(function, arg_tuples))
+    else:
+        with mp.Pool(poolsize) as pool:
+            pool_map = pool.imap if ordered else pool.imap_unordered
+            write_rows(pool_map(function, arg_tuples, chunksize=16))
@@ -5,9 +5,13 @@ import sys
 from time import sleep
 
 def fetch_page(url, params = None, rettype = "text",
-    MAX_RETRIES = 3, MAX_TIMEOUT = 5, RETRY_WAIT_TIME = 0.1):
+    MAX_RETRIES = 3, MAX_TIMEOUT = 5, RETRY_WAIT_TIME = 0.1,
+    rate_limiter = None):
     """Fetch the HTML of a URL.
 
+    If rate_limiter (a rate_limit.RateLimiter) is given, every attempt waits
+    for its host's rate limit, and response statuses are reported back to it.
+
     Returns a tuple:
         (error, html)
         Error will contain a string of the error type, html contains the webpage.
@@ -16,8 +20,13 @@ def fetch_page(url, params = None, rettype = "text",
     assert rettype in ["text", "json"]
 
     for i in range(MAX_RETRIES):
+        if rate_limiter is not None:
+            rate_limiter.wait(url)
+
         try:
             resp = requests.get(url, params = params, timeout = MAX_TIMEOUT)
+            if rate_limiter is not None:
+                rate_limiter.report(url, resp.status_code)
             # raise an exception if there was a problem
             resp.raise_for_status()
             resp.encoding = "utf-8"
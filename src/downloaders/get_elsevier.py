@@ -28,6 +28,8 @@ Steps:
 
 5. Download the articles using Elsevier's API.
 """
+import aiohttp
+import asyncio
 import logging
 import os
 import re
@@ -36,14 +38,31 @@ import string
 from bs4 import BeautifulSoup
 from collections import Counter
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from itertools import chain
 from itertools import islice
 
-from util import load_if_exist
+from rate_limit import default_rate_limiter
+from util import Cache
+from util import atomic_write
+from util import cached
+from web_util import async_fetch_and_map
 from web_util import fetch_and_map
+from web_util import fetch_page
 
 
-@load_if_exist("../../data/elsevier/bio_journal_titles.txt")
+# shared by all requests made by this module
+RATE_LIMITER = default_rate_limiter()
+
+# cached scraping results are refreshed after 30 days
+CACHE_DIR = "../../data/elsevier/cache"
+CACHE_TTL = 30 * 24 * 60 * 60
+
+JOURNAL_SITEMAP_URL = "http://api.elsevier.com/sitemap/page/sitemap/serial/journals/{}/{}.html"
+ARTICLE_DIR = "../../data/elsevier/articles/{}"
+
+
+@cached(CACHE_DIR, ttl = CACHE_TTL)
 def scrape_journal_titles():
     """Get the journal titles of only open access journals in the life or health
     sciences from ScienceDirect.
@@ -64,11 +83,11 @@ def scrape_journal_titles():
         for letter in string.ascii_lowercase
     }
 
-    info = fetch_and_map(get_titles, data, MAX_CONNECTIONS = 10, MAX_TIMEOUT = 10)
+    info = fetch_and_map(get_titles, data, MAX_CONNECTIONS = 10, MAX_TIMEOUT = 10, rate_limiter = RATE_LIMITER)
     return sorted(chain.from_iterable(info.values()))
 
 
-@load_if_exist("../../data/elsevier/all_journal_issns.txt")
+@cached(CACHE_DIR, ttl = CACHE_TTL)
 def scrape_all_journal_issns():
     """Use the Elsevier sitemap of all publications (books, journals) to
     determine the ISSNs of all journals.
@@ -96,7 +115,7 @@ def scrape_all_journal_issns():
         for letter in string.ascii_lowercase
     }
 
-    info = fetch_and_map(get_issns, data, MAX_CONNECTIONS = 8)
+    info = fetch_and_map(get_issns, data, MAX_CONNECTIONS = 8, rate_limiter = RATE_LIMITER)
     res = {}
     for val in info.values():
         res.update(val)
@@ -104,7 +123,7 @@ def scrape_all_journal_issns():
     return res
 
 
-@load_if_exist("../../data/elsevier/english_journals.txt")
+@cached(CACHE_DIR, ttl = CACHE_TTL)
 def get_open_eng_bio_journals():
     """Return a dictionary of all English language biological science journals
     that are open access, along with their ISSNs.
@@ -148,7 +167,7 @@ def get_open_eng_bio_journals():
         for title, issn in journals.items()
     }
 
-    nlm_uids = fetch_and_map(get_nlm_uid, data, rettype = "json", MAX_CONNECTIONS = 8)
+    nlm_uids = fetch_and_map(get_nlm_uid, data, rettype = "json", MAX_CONNECTIONS = 8, rate_limiter = RATE_LIMITER)
 
     # look up the language of each open journal with a NLM identifier
     url = "http://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
@@ -157,7 +176,7 @@ def get_open_eng_bio_journals():
         for title, uid in nlm_uids.items() if uid is not None
     }
 
-    langs = fetch_and_map(get_language, data, MAX_CONNECTIONS = 8)
+    langs = fetch_and_map(get_language, data, MAX_CONNECTIONS = 8, rate_limiter = RATE_LIMITER)
 
     return {
         title: journals[title]
@@ -165,39 +184,65 @@ def get_open_eng_bio_journals():
     }
 
 
-@load_if_exist("../../data/elsevier/open_english_bio_articles.txt")
-def find_articles(journals):
-    """Find the article links of the given list of journals."""
+def are_piis(links):
+    """Are these links to actual articles?"""
+    return all("article/pii" in link for link in links)
+
+
+def get_sitemap_links(html):
+    """Get the links on an Elsevier sitemap page.
+
+    Skip the first link because it's self-referential.
+    """
+    soup = BeautifulSoup(html, "lxml")
+    return [link["href"] for link in islice(soup.find_all("a"), 1, None)]
+
+
+def get_journal_sitemap_url(title, issn):
+    return JOURNAL_SITEMAP_URL.format(title[0].lower(), issn.replace("-", ""))
 
-    def are_piis(links):
-        """Are these links to actual articles?"""
-        return all("article/pii" in link for link in links)
 
+def get_journal_links_cache():
+    """Cache of the article links of each journal, keyed on (title, ISSN)."""
+    return Cache(os.path.join(CACHE_DIR, "journal_article_links"), ttl = CACHE_TTL)
+
+
+@cached(CACHE_DIR, ttl = CACHE_TTL)
+def find_articles(journals):
+    """Find the article links of the given list of journals.
+
+    The article links of each journal are cached as soon as they are found,
+    so an interrupted search only has to look up the remaining journals.
+    """
     # find the volumes/issues in each journal
     def get_links(key, html):
-        """Skip the first link because it's self-referential."""
-        soup = BeautifulSoup(html, "lxml")
-        return [link["href"] for link in islice(soup.find_all("a"), 1, None)]
+        return get_sitemap_links(html)
+
+    journal_links = get_journal_links_cache()
+    articles = {}
+    for title, issn in journals.items():
+        links = journal_links.get((title, issn))
+        if links is not None:
+            articles[title] = links
 
-    url = "http://api.elsevier.com/sitemap/page/sitemap/serial/journals/{}/{}.html"
     data = {
-        title: (url.format(title[0].lower(), issn.replace("-", "")), None)
-        for title, issn in journals.items()
+        title: (get_journal_sitemap_url(title, issn), None)
+        for title, issn in journals.items() if title not in articles
     }
 
-    issues = fetch_and_map(get_links, data, MAX_CONNECTIONS = 8)
+    issues = fetch_and_map(get_links, data, MAX_CONNECTIONS = 8, rate_limiter = RATE_LIMITER)
 
 #-------------------------------------------------------------------------------
 
-    articles = {}
     for journal, links in issues.items():
         data = {link: (link, None) for link in links}
 
-        res = fetch_and_map(get_links, data, MAX_CONNECTIONS = 8)
+        res = fetch_and_map(get_links, data, MAX_CONNECTIONS = 8, rate_limiter = RATE_LIMITER)
 
         temp = sorted(chain.from_iterable(res.values()))
         assert are_piis(temp), "{}'s articles are >2 links deep".format(journal)
         articles[journal] = temp
+        journal_links[(journal, journals[journal])] = temp
 
     return articles
 
@@ -208,9 +253,46 @@ def get_elsevier_apikey():
         return fin.read().rstrip("\n")
 
 
+def get_api_params(data_type):
+    """HTTP parameters for downloading an article in the given format."""
+    return {
+        "httpAccept": "text/{}".format("xml" if data_type == "xml" else "plain"),
+        "APIKey": get_elsevier_apikey()
+    }
+
+
+def get_PII(article_link):
+    """Extract the PII of an article from its link."""
+    return article_link[article_link.rfind("/") + 1 : ]
+
+
+def get_fname(article_url, data_type):
+    """Get the filename of the place where we will store the article."""
+    return os.path.abspath(
+        os.path.join(ARTICLE_DIR.format(data_type),
+        "{}.{}".format(get_PII(article_url), data_type))
+    )
+
+
+def get_missing_links(links, data_type):
+    """Return the article links whose articles haven't been saved to disk."""
+    return [link for link in links if not os.path.isfile(get_fname(link, data_type))]
+
+
+def prettify_xml(text):
+    """Pretty-print an XML article (slow, so run in a process pool)."""
+    return BeautifulSoup(text, "lxml").prettify()
+
+
+def write_article(fname, text):
+    atomic_write(fname, lambda fout: fout.write("{}\n".format(text)))
+
+
 def download_articles(article_urls, data_type):
     """Download the actual articles from Elsevier and save to disk.
 
+    Articles which have already been saved are skipped.
+
     In order to provide accurate statistics about how many articles were
     successfully downloaded, the list of article URLs should be unique!
 
@@ -221,25 +303,13 @@ def download_articles(article_urls, data_type):
     assert data_type in ["xml", "txt"], "Incorrect Elsevier download format!"
     assert len(set(article_urls)) == len(article_urls), "URLs are not unique!"
 
-    def get_PII(article_link):
-        """Extract the PII of an article from its link."""
-        return article_link[article_link.rfind("/") + 1 : ]
-
-    def get_fname(article_url):
-        """Get the filename of the place where we will store the article."""
-        return os.path.abspath(
-            os.path.join("../../data/elsevier/articles/{}".format(data_type),
-            "{}.{}".format(get_PII(article_url), data_type))
-        )
-
     def get_saver(data_type):
         def save_article(key, html):
             try:
-                with open(key, "w") as fout:
-                    if data_type == "txt":
-                        fout.write("{}\n".format(html))
-                    else:
-                        fout.write("{}\n".format(BeautifulSoup(html, "lxml").prettify()))
+                if data_type == "txt":
+                    write_article(key, html)
+                else:
+                    write_article(key, prettify_xml(html))
 
                 return True
             except Exception as exc:
@@ -249,27 +319,207 @@ def download_articles(article_urls, data_type):
 
         return save_article
 
-    params = {
-        "httpAccept": "text/{}".format("xml" if data_type == "xml" else "plain"),
-        "APIKey": get_elsevier_apikey()
-    }
+    params = get_api_params(data_type)
 
     data = {
-        get_fname(url): (url, params)
+        get_fname(url, data_type): (url, params)
         for url in article_urls
     }
 
+    logger = logging.getLogger(__name__)
+    done = [fname for fname in data if os.path.isfile(fname)]
+    for fname in done:
+        del data[fname]
+    logger.info("Skipping {} articles already on disk".format(len(done)))
+
     # seems like the max speed of retrieving files is 2 articles / second
-    res = fetch_and_map(get_saver(data_type), data, MAX_CONNECTIONS = 8)
+    res = fetch_and_map(get_saver(data_type), data, MAX_CONNECTIONS = 8, rate_limiter = RATE_LIMITER)
 
-    logger = logging.getLogger(__name__)
     logger.info("Successfully downloaded {} of {} articles".format(
-        Counter(res.values())[True], len(article_urls))
+        Counter(res.values())[True], len(data))
     )
 
     return res
 
 
+async def async_download_journals(journals, data_type, params,
+    MAX_CONNECTIONS = 8, QUEUE_SIZE = 1000, JOURNAL_WORKERS = 2,
+    SAVE_WORKERS = 2, prettify = True):
+    """Find and download the articles of the given journals as a pipeline.
+
+    Three stages run concurrently, connected by bounded queues:
+
+    1. discovery: JOURNAL_WORKERS workers find the article links of each
+       journal (cached per journal, like find_articles()) and queue every
+       article not already saved to disk (checked in a thread).
+    2. download: MAX_CONNECTIONS workers fetch queued articles using one
+       shared connection pool.
+    3. save: SAVE_WORKERS workers prettify XML articles in a process pool
+       (if prettify is set) and write them to disk in a thread, so neither
+       blocks the event loop.
+
+    A full queue makes the stage before it wait, so at most QUEUE_SIZE
+    article links or bodies are held in memory per queue.
+
+    If a worker raises, every stage is cancelled and the exception is
+    raised here.
+
+    Returns a Counter of the number of articles saved, skipped (already on
+    disk) and failed.
+    """
+    logger = logging.getLogger(__name__)
+    loop = asyncio.get_running_loop()
+
+    stats = Counter()
+    journal_links = get_journal_links_cache()
+    journal_items = iter(journals.items())
+
+    article_queue = asyncio.Queue(QUEUE_SIZE)
+    save_queue = asyncio.Queue(QUEUE_SIZE)
+
+    os.makedirs(ARTICLE_DIR.format(data_type), exist_ok = True)
+
+    async def find_journal_articles(session, title, issn):
+        links = journal_links.get((title, issn))
+        if links is not None:
+            return links
+
+        url = get_journal_sitemap_url(title, issn)
+        _, html = await fetch_page(session, title, url, rate_limiter = RATE_LIMITER)
+        if html is None:
+            return None
+
+        issue_links = get_sitemap_links(html)
+        issues = await async_fetch_and_map(
+            lambda key, html: get_sitemap_links(html),
+            {link: (link, None) for link in issue_links},
+            MAX_CONNECTIONS = MAX_CONNECTIONS, session = session,
+            progress = False, rate_limiter = RATE_LIMITER
+        )
+
+        links = sorted(chain.from_iterable(issues.values()))
+        if not are_piis(links):
+            logger.warning("{}'s articles are >2 links deep".format(title))
+            return None
+
+        # only cache the complete list of a journal's articles
+        if len(issues) == len(issue_links):
+            journal_links[(title, issn)] = links
+
+        return links
+
+    async def discover(session):
+        for title, issn in journal_items:
+            links = await find_journal_articles(session, title, issn)
+            if links is None:
+                logger.warning("Could not find the articles of {}".format(title))
+                stats["journals failed"] += 1
+                continue
+
+            # check the whole journal's files in a thread, not one stat()
+            # call at a time on the event loop
+            missing = await loop.run_in_executor(None, get_missing_links, links, data_type)
+            stats["skipped"] += len(links) - len(missing)
+            for link in missing:
+                await article_queue.put(link)
+
+    async def download(session):
+        while True:
+            link = await article_queue.get()
+            if link is None:
+                return
+
+            _, text = await fetch_page(
+                session, link, link, params = params, MAX_TIMEOUT = 30,
+                rate_limiter = RATE_LIMITER
+            )
+
+            if text is None:
+                stats["failed"] += 1
+            else:
+                await save_queue.put((get_fname(link, data_type), text))
+
+    async def save(pool):
+        while True:
+            item = await save_queue.get()
+            if item is None:
+                return
+
+            fname, text = item
+            try:
+                if data_type == "xml" and prettify:
+                    text = await loop.run_in_executor(pool, prettify_xml, text)
+                await loop.run_in_executor(None, write_article, fname, text)
+            except Exception as exc:
+                logger.warning("Fetched {} but failed to save to disk: {!r}".format(fname, exc))
+                stats["failed"] += 1
+                continue
+
+            stats["saved"] += 1
+            if stats["saved"] % 1000 == 0:
+                logger.info("Saved {} articles ({} skipped, {} failed)".format(
+                    stats["saved"], stats["skipped"], stats["failed"])
+                )
+
+    async def run_stage(workers, next_queue = None, next_workers = 0):
+        """Wait for a stage's workers, then tell the next stage's workers to
+        stop once they have emptied their queue."""
+        await asyncio.gather(*workers)
+        for _ in range(next_workers):
+            await next_queue.put(None)
+
+    connector = aiohttp.TCPConnector(limit = MAX_CONNECTIONS)
+    async with aiohttp.ClientSession(connector = connector) as session:
+        with ProcessPoolExecutor(SAVE_WORKERS) as pool:
+            stages = [
+                asyncio.ensure_future(run_stage(
+                    [discover(session) for _ in range(JOURNAL_WORKERS)],
+                    article_queue, MAX_CONNECTIONS
+                )),
+                asyncio.ensure_future(run_stage(
+                    [download(session) for _ in range(MAX_CONNECTIONS)],
+                    save_queue, SAVE_WORKERS
+                )),
+                asyncio.ensure_future(run_stage(
+                    [save(pool) for _ in range(SAVE_WORKERS)]
+                )),
+            ]
+
+            try:
+                await asyncio.gather(*stages)
+            except:
+                for stage in stages:
+                    stage.cancel()
+                raise
+
+    return stats
+
+
+def download_journals(journals, data_type, **kwargs):
+    """Find and download all articles of the given journals.
+
+    See async_download_journals() for the keyword arguments.
+    """
+    assert data_type in ["xml", "txt"], "Incorrect Elsevier download format!"
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    try:
+        stats = loop.run_until_complete(async_download_journals(
+            journals, data_type, get_api_params(data_type), **kwargs
+        ))
+    finally:
+        loop.close()
+
+    logger = logging.getLogger(__name__)
+    logger.info("Successfully downloaded {} articles ({} already on disk, {} failed)".format(
+        stats["saved"], stats["skipped"], stats["failed"])
+    )
+
+    return stats
+
+
 def main():
     log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     logging.basicConfig(
@@ -284,14 +534,11 @@ def main():
     eng_journals = get_open_eng_bio_journals()
     logger.info("Finished filtering journals to English ones only")
 
-    articles = find_articles(eng_journals)
-    logger.info("Finished finding article links")
-
-    docset = list(chain.from_iterable(articles.values()))
-
     data_type = "xml"
-    logger.info("Beginning to retrieve {} documents (type: {})".format(len(docset), data_type))
-    download_articles(docset, data_type)
+    logger.info("Beginning to find and retrieve the articles of {} journals (type: {})".format(
+        len(eng_journals), data_type)
+    )
+    download_journals(eng_journals, data_type)
 
     logger.info("Elsevier scraper completed successfully with no errors")
 
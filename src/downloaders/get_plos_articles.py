@@ -6,8 +6,19 @@
 # from lists generated by get_plos_lists.py
 
 # usage: 
-# cd downloaders && python3 get_plos_articles.py
+# cd downloaders && python3 get_plos_articles.py [--connections N]
 
+# articles are fetched N at a time (--connections 0 fetches them one by one),
+# and each download is recorded in a manifest (plos_manifest.jsonl by default)
+# so that a restarted run skips DOIs which were already saved
+
+# requests to journals.plos.org are rate limited to 1/s with a burst of 2
+# (rate_limit.HOST_LIMITS), so concurrent connections only help by overlapping
+# slow responses: the default N is the burst, and more connections don't
+# download any faster
+
+import argparse
+import json
 import logging
 import os
 import re
@@ -16,8 +27,12 @@ from bs4 import BeautifulSoup
 from collections import defaultdict
 from glob import glob
 from fetch_page import fetch_page
-from random import random
-from time import sleep
+from rate_limit import (HOST_LIMITS,
+                        default_rate_limiter)
+from web_util import fetch_and_map
+
+# one connection for each request the PLOS host limit allows at once
+DEFAULT_CONNECTIONS = HOST_LIMITS['journals.plos.org'][1]
 
 def parse_filename(filename):
 
@@ -97,10 +112,13 @@ def count_total_unique_dois(doi_file_dict):
 
     return doi_file_dict_counts
 
-def save_documents(base_url, doi_list, data_dir):
+def save_documents(base_url, doi_list, data_dir, rate_limiter=None):
 
     ''' save XML documents from the web to data_dir
 
+        requests are throttled by rate_limiter (a rate_limit.RateLimiter,
+        created with the default per-host limits if not given)
+
         input:
 
         base_url is a format string of this form:
@@ -111,6 +129,9 @@ def save_documents(base_url, doi_list, data_dir):
         data_dir is a writable path for saving data files
     '''
 
+    if rate_limiter is None:
+        rate_limiter = default_rate_limiter()
+
     for doi in doi_list:
         # check for plos identifier
         if '10.1371' not in doi:
@@ -118,7 +139,8 @@ def save_documents(base_url, doi_list, data_dir):
             continue
         enc_doi = doi.replace('/', '%2F')
         full_url = base_url.format(doi=enc_doi)
-        error, result = fetch_page(full_url, MAX_RETRIES=10, RETRY_WAIT_TIME=1)
+        error, result = fetch_page(full_url, MAX_RETRIES=10, RETRY_WAIT_TIME=1,
+                                   rate_limiter=rate_limiter)
         if error:
             logging.critical('Error retrieving {}'.format(full_url))
         else:
@@ -126,10 +148,146 @@ def save_documents(base_url, doi_list, data_dir):
             with open(doi_filename, 'w') as f:
                 soup = BeautifulSoup(result, 'html.parser')
                 f.write(soup.prettify())
-        sleep(random()*5)
+
+def load_manifest(manifest_path):
+
+    ''' Reads a download manifest (one JSON object per line) and
+        returns a dict of the latest entry for each DOI:
+
+        {doi: {'doi': doi, 'status': 'done' or 'failed',
+               'bytes': file size or None}}
+
+        (returns an empty dict if the manifest doesn't exist)
+    '''
+
+    manifest = {}
+    if not os.path.isfile(manifest_path):
+        return manifest
+
+    with open(manifest_path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # last line may be incomplete if a previous run was killed
+                logging.warning('Skipped bad manifest line: {!r}'.format(line))
+                continue
+            manifest[entry['doi']] = entry
+
+    return manifest
+
+def end_manifest_line(manifest_path):
+
+    ''' Ends the last line of the manifest at manifest_path if it's
+        incomplete (a previous run was killed while writing it), so that
+        the next entry appended isn't joined to it
+    '''
+
+    if not os.path.isfile(manifest_path) or not os.path.getsize(manifest_path):
+        return
+
+    with open(manifest_path, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b'\n':
+            f.write(b'\n')
+
+def write_manifest_entry(manifest_file, doi, status, nbytes=None):
+
+    ''' Appends one entry to an open manifest file and flushes it,
+        so the manifest is up to date if the download is interrupted
+    '''
+
+    entry = {'doi': doi, 'status': status, 'bytes': nbytes}
+    manifest_file.write(json.dumps(entry) + '\n')
+    manifest_file.flush()
+
+def get_pending_dois(doi_list, data_dir, manifest):
+
+    ''' Returns the DOIs in doi_list that still have to be downloaded,
+        i.e. those not marked 'done' in the manifest with their file
+        present in data_dir (malformed DOIs are skipped)
+    '''
+
+    pending = []
+    for doi in doi_list:
+        # check for plos identifier
+        if '10.1371' not in doi:
+            logging.warning('Skipped malformed DOI: {}'.format(doi))
+            continue
+        entry = manifest.get(doi)
+        enc_doi = doi.replace('/', '%2F')
+        if (entry and entry['status'] == 'done'
+                and os.path.isfile(os.path.join(data_dir, enc_doi))):
+            continue
+        pending.append(doi)
+
+    return pending
+
+def save_documents_concurrent(base_url, doi_list, data_dir, manifest_path,
+                              connections=DEFAULT_CONNECTIONS, rate_limiter=None):
+
+    ''' save XML documents from the web to data_dir, fetching up to
+        `connections` documents at a time
+
+        DOIs already marked as done in the manifest at manifest_path are
+        skipped; every other DOI gets a 'done' (with its size)
+        or 'failed' entry appended to the manifest
+
+        XML is saved exactly as served (not prettified), and written to a
+        temporary file first so that an interrupted download never leaves a
+        partial document behind
+
+        returns the number of documents saved
+
+        (arguments are otherwise the same as save_documents())
+    '''
+
+    if rate_limiter is None:
+        rate_limiter = default_rate_limiter()
+
+    pending = get_pending_dois(doi_list, data_dir, load_manifest(manifest_path))
+    logging.warning('{} of {} DOIs left to download'.format(len(pending), len(doi_list)))
+
+    urls = [(doi, (base_url.format(doi=doi.replace('/', '%2F')), None)) for doi in pending]
+    saved = set()
+
+    end_manifest_line(manifest_path)
+    with open(manifest_path, 'a') as manifest_file:
+
+        def save(doi, response):
+            content, _ = response
+            doi_filename = os.path.join(data_dir, doi.replace('/', '%2F'))
+            with open(doi_filename + '.part', 'wb') as f:
+                f.write(content)
+            os.replace(doi_filename + '.part', doi_filename)
+
+            write_manifest_entry(manifest_file, doi, 'done', nbytes=len(content))
+            saved.add(doi)
+
+        fetch_and_map(lambda doi, response: response, urls, MAX_CONNECTIONS=connections,
+                      callback=save, rettype='raw', MAX_RETRIES=10, RETRY_WAIT_TIME=1,
+                      MAX_TIMEOUT=60, rate_limiter=rate_limiter)
+
+        for doi in pending:
+            if doi not in saved:
+                logging.critical('Error retrieving {}'.format(doi))
+                write_manifest_entry(manifest_file, doi, 'failed')
+
+    return len(saved)
 
 def main():
 
+    parser = argparse.ArgumentParser(description='Download PLOS articles in XML format '
+                                                 'from the newest DOI lists')
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS,
+                        help='number of articles to download concurrently '
+                             '(0 downloads them one at a time) (default {}, the burst '
+                             'of the PLOS rate limit)'.format(DEFAULT_CONNECTIONS))
+    parser.add_argument('--manifest', default='plos_manifest.jsonl',
+                        help='download manifest, used to skip already downloaded '
+                             'articles on restart (default plos_manifest.jsonl)')
+    args = parser.parse_args()
+
     doi_list_files = glob('plos*.txt')
     timestamp_groups = get_timestamp_groups(doi_list_files)
     doi_file_dict_counts = count_total_unique_dois(timestamp_groups)
@@ -166,11 +324,18 @@ def main():
     # http://journals.plos.org/plospathogens/article/asset?id=10.1371%2Fjournal.ppat.1005499.XML
     base_url = 'http://journals.plos.org/{abbrev}/article/asset?id={doi}.XML'
 
+    rate_limiter = default_rate_limiter()
     for doi_list_file in timestamp_groups[chosen_timestamp]:
         parsed = parse_filename(doi_list_file)
         unique_dois = get_dois(doi_list_file, unique=True)
         logging.warning('Accessing {} unique DOIs in file {}'.format(len(unique_dois), doi_list_file))
-        save_documents(base_url.format(abbrev=parsed['journal'], doi='{doi}'), unique_dois, data_dir)
+        journal_url = base_url.format(abbrev=parsed['journal'], doi='{doi}')
+        if args.connections > 0:
+            saved = save_documents_concurrent(journal_url, unique_dois, data_dir, args.manifest,
+                                              args.connections, rate_limiter)
+            logging.warning('Saved {} documents from {}'.format(saved, doi_list_file))
+        else:
+            save_documents(journal_url, unique_dois, data_dir, rate_limiter)
 
     logging.warning('All done')
 
@@ -3,24 +3,56 @@
 # get_plos_lists.py
 #
 # For getting PLOS DOIs from the plos.org website
+#
+# usage:
+# python3 get_plos_lists.py [--connections N] [--poolsize P]
+#     (crawl all journals, N pages at a time if N > 0)
+# python3 get_plos_lists.py [--connections N] get_plos_lists_[timestamp].log
+#     (retry URLs that failed in a previous run)
+#
+# the concurrent crawler records each page whose DOIs have been written in
+# get_plos_lists_[timestamp].done, so that retries skip pages that succeeded
 
+import argparse
 from bs4 import BeautifulSoup
 from datetime import datetime
 import logging
+import multiprocessing as mp
+import os
 import random
 import requests
 import re
-import sys
 import time
 
+from rate_limit import default_rate_limiter
+from web_util import fetch_and_map
+
+# shared by all requests made by this module
+RATE_LIMITER = default_rate_limiter()
+
+# as of 3/7/16, PLOS One list view for Biological
+# Sciences articles goes up to 10909 "list" pages
+PLOS_ONE_PAGE_TOTAL = 10909
+PLOS_ONE_INDEX_URL = 'http://journals.plos.org/plosone/browse/biology_and_life_sciences?resultView=list&page={}'
+PLOS_ONE_PARSE_DICT = {'data-metricsurl': '/plosone/article/metrics'}
+
+PLOS_JOURNALS = ('plosbiology',
+                 'ploscompbiol',
+                 'plosgenetics',
+                 'plosmedicine',
+                 'plosntds',
+                 'plospathogens')
+
 def get_single_page(url):
 
-    ''' Get url with requests. Return HTML text if
+    ''' Get url with requests (throttled by RATE_LIMITER). Return HTML text if
         successful or False if unsuccessful
     '''
 
+    RATE_LIMITER.wait(url)
     try:
         r = requests.get(url, timeout=10)
+        RATE_LIMITER.report(url, r.status_code)
         r.raise_for_status()
         return r.text
     except requests.exceptions.ConnectionError:
@@ -50,7 +82,7 @@ def get_html(url):
         requests_remaining -= 1
         time.sleep(random.random())
 
-    logging.critical('URL get_html failed after 3 attempts: {}'.format(url))
+    log_failed_url(url)
     return False
 
 def parse_text_plos_one(html_page_string, parse_dict):
@@ -90,19 +122,13 @@ def get_plos_one_dois(timestamp):
 
     with open(plos_one_output_filename, 'w') as f:
 
-        # as of 3/7/16, PLOS One list view for Biological 
-        # Sciences articles goes up to 10909 "list" pages
-        page_total = 10909
+        page_total = PLOS_ONE_PAGE_TOTAL
         for i in range(1,page_total+1):
-            base_url = 'http://journals.plos.org/plosone/browse/biology_and_life_sciences?resultView=list&page={}'
-            html_string = get_html(base_url.format(i))
+            html_string = get_html(PLOS_ONE_INDEX_URL.format(i))
 
-            dois = parse_text_plos_one(html_string, {'data-metricsurl': '/plosone/article/metrics'})
+            dois = parse_text_plos_one(html_string, PLOS_ONE_PARSE_DICT)
             f.write('\n'.join(dois)+'\n')
 
-            # wait a few ms before continuing...
-            time.sleep(random.random())
-
             if i % 1000 == 0:
                 print('Getting page {} of {}...'.format(i, page_total))
 
@@ -138,7 +164,15 @@ def get_issue_dois(issue_url):
         (for all PLOS journals except PLOS ONE)
     '''
 
-    html_string = get_html(issue_url)
+    return parse_issue_dois(get_html(issue_url))
+
+def parse_issue_dois(html_string):
+
+    ''' Parse the HTML of a journal issue page
+        and return a list of its DOIs
+        (for all PLOS journals except PLOS ONE)
+    '''
+
     if not html_string: # if empty string or False
         return []
 
@@ -147,7 +181,7 @@ def get_issue_dois(issue_url):
 
     return [match.text.split('|')[1].strip() for match in matches]
 
-def get_plos_dois(timestamp, journal_abbrev, issue_url=None):
+def get_plos_dois(timestamp, journal_abbrev, issue_urls=None):
 
     ''' For use with all PLOS journals except PLOS ONE.
 
@@ -172,35 +206,211 @@ def get_plos_dois(timestamp, journal_abbrev, issue_url=None):
     output_filename = '{}_dois_{}.txt'.format(journal_abbrev, timestamp)
     with open(output_filename, 'w') as f:
         for issue_url in issue_urls:
-            time.sleep(random.random())
             f.write('\n'.join(get_issue_dois(issue_url))+'\n')
 
     return output_filename
 
-def get_failed_urls(log_filename):
+def log_failed_url(url, step='get_html', attempts=3, exc=None):
 
-    ''' Return a list of failed downloads from 
-        log_filename
+    ''' Log a page that couldn't be fetched (step 'get_html') or parsed
+        (step 'parse'), in the format read by get_failed_urls()
+        (with exc, its traceback follows on the next lines)
     '''
 
+    logging.critical('URL {} failed after {} attempts: {}'.format(step, attempts, url),
+                     exc_info=exc)
+
+def get_page_type(url):
+
+    ''' Returns 'plosone' for a PLOS ONE index page URL,
+        or 'issue' for a journal issue URL (None otherwise)
+    '''
+
+    if '/plosone/browse/' in url:
+        return 'plosone'
+    if 'issue' in url:
+        return 'issue'
+    return None
+
+def parse_page(page):
+
+    ''' Worker pool function: parse a (page_type, html_string) tuple
+        fetched by crawl_pages() and return a list of DOIs
+    '''
+
+    page_type, html_string = page
+    if page_type == 'plosone':
+        return parse_text_plos_one(html_string, PLOS_ONE_PARSE_DICT)
+    return parse_issue_dois(html_string)
+
+def load_checkpoint(checkpoint_filename):
+
+    ''' Return the set of page URLs recorded as completed
+        in checkpoint_filename (empty if it doesn't exist)
+    '''
+
+    if not os.path.isfile(checkpoint_filename):
+        return set()
+
+    with open(checkpoint_filename) as f:
+        return set(line.rstrip('\n') for line in f if line.strip())
+
+def crawl_pages(pages, checkpoint_filename, connections=8, poolsize=4):
+
+    ''' Fetch pages concurrently (with up to `connections` pooled async
+        requests, throttled by RATE_LIMITER), parse them in a worker pool
+        of size poolsize, and append each page's DOIs to its output file
+        as soon as it has been parsed
+
+        pages is a dict: {url: (page_type, output_filename)}
+        (see get_page_type() for page types)
+
+        Pages already listed in checkpoint_filename are skipped. Each page
+        is added to the checkpoint once its DOIs have been written, and
+        pages that can't be fetched or parsed are logged in the format read
+        by get_failed_urls()
+
+        Returns the number of pages completed
+    '''
+
+    completed = load_checkpoint(checkpoint_filename)
+    pending = {url: page for url, page in pages.items() if url not in completed}
+    if len(pending) < len(pages):
+        print('Skipping {} completed pages'.format(len(pages) - len(pending)))
+
+    output_files = {}
+    done = set()
+    parse_failed = set()
+    pool = mp.Pool(poolsize)
+
+    with open(checkpoint_filename, 'a') as checkpoint:
+
+        # pool callbacks all run in the pool's single result handler thread,
+        # so output files are only ever written from one thread
+        def write_dois(url, dois):
+            output_filename = pending[url][1]
+            if output_filename not in output_files:
+                output_files[output_filename] = open(output_filename, 'a')
+            f = output_files[output_filename]
+            if dois:
+                f.write('\n'.join(dois)+'\n')
+            f.flush()
+
+            checkpoint.write(url+'\n')
+            checkpoint.flush()
+            done.add(url)
+
+            if len(done) % 1000 == 0:
+                print('Parsed {} of {} pages...'.format(len(done), len(pending)))
+
+        def parse_failed_url(url, exc):
+            parse_failed.add(url)
+            log_failed_url(url, step='parse', attempts=1, exc=exc)
+
+        def parse_in_pool(url, html_string):
+            pool.apply_async(parse_page, ((pending[url][0], html_string),),
+                             callback=lambda dois: write_dois(url, dois),
+                             error_callback=lambda exc: parse_failed_url(url, exc))
+
+        try:
+            fetch_and_map(lambda url, html_string: html_string,
+                          {url: (url, None) for url in pending},
+                          MAX_CONNECTIONS=connections, callback=parse_in_pool,
+                          MAX_TIMEOUT=10, rate_limiter=RATE_LIMITER)
+            pool.close()
+            pool.join()
+        finally:
+            pool.terminate()
+            for f in output_files.values():
+                f.close()
+
+    for url in pending:
+        if url not in done and url not in parse_failed:
+            log_failed_url(url)
+
+    return len(done)
+
+def get_all_pages(timestamp):
+
+    ''' Return a dict of all issue pages (all PLOS journals except
+        PLOS ONE) and all PLOS ONE index pages, in the format used by
+        crawl_pages(): {url: (page_type, output_filename)}
+    '''
+
+    pages = {}
+    for journal_abbrev in PLOS_JOURNALS:
+        journal_archive_url = 'http://journals.plos.org/{}/volume'.format(journal_abbrev)
+        output_filename = '{}_dois_{}.txt'.format(journal_abbrev, timestamp)
+        for issue_url in get_issue_urls(journal_archive_url) or []:
+            pages[issue_url] = ('issue', output_filename)
+
+    plos_one_output_filename = 'plosone_dois_{}.txt'.format(timestamp)
+    for i in range(1, PLOS_ONE_PAGE_TOTAL+1):
+        pages[PLOS_ONE_INDEX_URL.format(i)] = ('plosone', plos_one_output_filename)
+
+    return pages
+
+def get_failed_urls(log_filename, completed=None):
+
+    ''' Return a list of failed downloads (pages that couldn't be
+        fetched or parsed, see log_failed_url()) from log_filename
+
+        (URLs in the set `completed`, i.e. pages which have
+         succeeded since, are left out, and URLs that failed
+         more than once are only listed once)
+    '''
+
+    skip = set(completed or ())
+
     failed_urls = []
     with open(log_filename) as f:
         for line in f:
-            regex_match = re.match(r'(^CRITICAL.*URL get_html failed after [0-9]+ attempts:\s)(.*)(\n)', line)
-            if regex_match:
+            regex_match = re.match(r'(^CRITICAL.*URL (?:get_html|parse) failed after [0-9]+ attempts:\s)(.*)(\n)', line)
+            if regex_match and regex_match.group(2) not in skip:
                 failed_urls.append(regex_match.group(2))
+                skip.add(regex_match.group(2))
     return failed_urls
 
 def main():
 
+    parser = argparse.ArgumentParser(description='Get lists of PLOS DOIs from plos.org')
+    parser.add_argument('log_filename', nargs='?',
+                        help='log file of a previous run (get_plos_lists_[timestamp].log) '
+                             'to retry its failed URLs')
+    parser.add_argument('--connections', type=int, default=0,
+                        help='crawl pages concurrently with this many connections '
+                             '(0 crawls pages one at a time) (default 0)')
+    parser.add_argument('--poolsize', type=int, default=4,
+                        help='number of processes parsing pages in concurrent mode (default 4)')
+    args = parser.parse_args()
+
     # if retrying failed downloads...
     # (if script was run with logfile as argument)
-    if len(sys.argv) == 2:
-        log_filename = sys.argv[1]
+    if args.log_filename:
+        log_filename = args.log_filename
         filename_regex = re.compile(r'(^get_plos_lists_)(.*)(\.log$)')
-        regex_match = re.match(filename_regex, log_filename)
+        regex_match = re.match(filename_regex, os.path.basename(log_filename))
         assert regex_match, 'input file {} not a log file'.format(log_filename)
         timestamp = regex_match.group(2)
+
+        if args.connections > 0:
+            # pages that fail again are logged to the same log file, and
+            # pages that succeed are checkpointed, so this can be rerun
+            # until nothing fails
+            logging.basicConfig(filename=log_filename, level=logging.WARNING)
+            checkpoint_filename = re.sub(r'\.log$', '.done', log_filename)
+            failed_urls = get_failed_urls(log_filename, load_checkpoint(checkpoint_filename))
+            pages = {}
+            for url in failed_urls:
+                page_type = get_page_type(url)
+                if page_type:
+                    # e.g. http://journals.plos.org/plosgenetics/issue?id=...
+                    journal_abbrev = url.split('/')[3]
+                    pages[url] = (page_type, '{}_dois_{}.txt'.format(journal_abbrev, timestamp))
+            completed = crawl_pages(pages, checkpoint_filename, args.connections, args.poolsize)
+            print('Retried {} failed pages, {} succeeded'.format(len(pages), completed))
+            return
+
         failed_urls = get_failed_urls(log_filename)
 
         # only handling failed 'issue' links for now...
@@ -219,18 +429,21 @@ def main():
 
         return
 
-    assert len(sys.argv) == 1, 'too many arguments'
-
     timestamp = datetime.now().strftime('%m-%d-%Y_%H-%M-%S')
     log_filename = 'get_plos_lists_{}.log'.format(timestamp)
     logging.basicConfig(filename=log_filename,level=logging.WARNING)
 
-    for plos_journal in ('plosbiology',
-                         'ploscompbiol',
-                         'plosgenetics',
-                         'plosmedicine',
-                         'plosntds',
-                         'plospathogens'):
+    if args.connections > 0:
+        checkpoint_filename = 'get_plos_lists_{}.done'.format(timestamp)
+        pages = get_all_pages(timestamp)
+        completed = crawl_pages(pages, checkpoint_filename, args.connections, args.poolsize)
+        print('DOIs from {} of {} pages saved to *_dois_{}.txt'.format(completed, len(pages), timestamp))
+        print('Completed pages saved to {}'.format(checkpoint_filename))
+        print()
+        print('Log file saved to {}'.format(log_filename))
+        return
+
+    for plos_journal in PLOS_JOURNALS:
         output_filename = get_plos_dois(timestamp, plos_journal)
         if output_filename:
             print('{} DOIs saved to {}'.format(plos_journal, output_filename))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Per-host token bucket rate limiting shared by all downloaders.
+
+Each host gets a bucket that refills at `rate` requests per second and holds
+at most `burst` requests. A request takes one token, waiting first if the
+bucket is empty. When a host responds with 429 (Too Many Requests) or 503
+(Service Unavailable), its rate is cut and then recovers gradually with each
+successful response.
+"""
+import asyncio
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+
+# HTTP statuses indicating that we are requesting too quickly
+SLOW_DOWN_STATUSES = {429, 503}
+
+# (requests/second, burst) for the hosts our downloaders use
+HOST_LIMITS = {
+    # PLOS journal pages and article XML
+    "journals.plos.org": (1, 2),
+
+    # Elsevier sitemap and article API (~2 articles/second in practice)
+    "api.elsevier.com": (2, 4),
+    "www.sciencedirect.com": (2, 4),
+
+    # NCBI E-utilities allow 3 requests/second without an API key
+    "eutils.ncbi.nlm.nih.gov": (3, 3),
+}
+
+
+class TokenBucket(object):
+    """Token bucket for a single host with an adaptive refill rate."""
+
+    def __init__(self, rate, burst, min_rate = None, backoff_factor = 0.5,
+        recovery_step = 0.1, clock = time.monotonic):
+        assert rate > 0 and burst >= 1, "Bad rate limit: {}/s, burst {}".format(rate, burst)
+
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.backoff_factor = backoff_factor
+        self.recovery_step = recovery_step
+        self.clock = clock
+
+        self.tokens = burst
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take one token and return how long (in seconds) the caller has to
+        wait before making its request.
+
+        Tokens may go negative, which queues up callers in order of
+        reservation.
+        """
+        self._refill()
+        self.tokens -= 1
+
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def slow_down(self):
+        """Cut the rate and drain the bucket (after a 429/503 response)."""
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+        self.tokens = min(self.tokens, 0)
+
+    def speed_up(self):
+        """Recover part of the original rate (after a successful response)."""
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery_step)
+
+
+class RateLimiter(object):
+    """Rate limiter that keeps one TokenBucket per host.
+
+    Usage:
+        limiter = RateLimiter(2, 4, host_limits = {"example.org": (10, 10)})
+
+        limiter.wait(url)               # blocking code
+        await limiter.async_wait(url)   # asyncio code
+        limiter.report(url, status)     # after each response
+    """
+
+    def __init__(self, rate, burst = 1, host_limits = None, **bucket_kwargs):
+        """rate (requests/second) and burst apply to any host not listed in
+        host_limits, a dictionary of {host: (rate, burst)}.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.host_limits = host_limits or {}
+        self.bucket_kwargs = bucket_kwargs
+
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            rate, burst = self.host_limits.get(host, (self.rate, self.burst))
+            self.buckets[host] = TokenBucket(rate, burst, **self.bucket_kwargs)
+
+        return self.buckets[host]
+
+    def reserve(self, url):
+        with self.lock:
+            return self.get_bucket(url).reserve()
+
+    def wait(self, url):
+        """Block until a request to url is allowed."""
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def async_wait(self, url):
+        """Wait (without blocking the event loop) until a request to url is
+        allowed.
+        """
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def report(self, url, status):
+        """Adapt the host's rate to the HTTP status of a response."""
+        with self.lock:
+            bucket = self.get_bucket(url)
+            if status in SLOW_DOWN_STATUSES:
+                bucket.slow_down()
+            elif status < 400:
+                bucket.speed_up()
+
+
+def default_rate_limiter():
+    """Return a RateLimiter using HOST_LIMITS, and one request per second for
+    any other host.
+    """
+    return RateLimiter(1, 1, host_limits = HOST_LIMITS)
@@ -1,8 +1,13 @@
 # Tong Shu Li
 
+import functools
+import gzip
+import hashlib
 import json
 import os
 import pytz
+import tempfile
+import time
 
 from datetime import datetime
 
@@ -38,3 +43,184 @@ def load_if_exist(file_loc):
         return wrapper
 
     return decorator
+
+
+def atomic_write(file_loc, write, mode = "w"):
+    """Write a file atomically by calling write(file_object) on a temporary
+    file in the same directory, then renaming it to file_loc.
+
+    A crash mid-write never leaves a truncated file behind.
+    """
+    dirname = os.path.dirname(os.path.abspath(file_loc))
+    os.makedirs(dirname, exist_ok = True)
+
+    fd, temp_loc = tempfile.mkstemp(dir = dirname, prefix = ".tmp-")
+    try:
+        with os.fdopen(fd, mode) as fout:
+            write(fout)
+        os.replace(temp_loc, file_loc)
+    except:
+        os.remove(temp_loc)
+        raise
+
+
+def hash_args(*args, **kwargs):
+    """Return a stable hash of JSON-serializable function arguments."""
+    key = json.dumps([args, kwargs], sort_keys = True, default = repr)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class Cache(object):
+    """A directory of cached values, one gzipped compact JSON file per key.
+
+    Each entry records when it was created (also kept as its file's
+    modification time). Entries older than ttl seconds are treated as
+    missing. Expired entries are deleted every evict_every writes, and
+    whenever there are more than max_entries entries, the oldest ones are
+    deleted. Eviction only lists the directory; it never opens entries.
+
+    Values are written individually, so long-running jobs can cache each
+    partial result as soon as it is available:
+
+        links = Cache("../../data/elsevier/cache/article_links")
+        if journal not in links:
+            links[journal] = get_article_links(journal)
+    """
+
+    def __init__(self, cache_dir, ttl = None, max_entries = None,
+        clock = time.time, evict_every = 100):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.evict_every = evict_every
+
+        # number of entries (counted at the first write) and writes since
+        # the last eviction
+        self.num_entries = None
+        self.writes = 0
+
+    def path(self, key):
+        digest = hashlib.sha1(str(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "{}.json.gz".format(digest))
+
+    def read_entry(self, file_loc):
+        """Return the entry stored in file_loc, or None if the file is
+        missing, unreadable or expired."""
+        try:
+            with gzip.open(file_loc, "rt", encoding = "utf-8") as fin:
+                entry = json.load(fin)
+        except (OSError, EOFError, ValueError):
+            return None
+
+        if self.is_expired(entry["_created"]):
+            return None
+
+        return entry
+
+    def is_expired(self, created):
+        return self.ttl is not None and self.clock() - created > self.ttl
+
+    def __contains__(self, key):
+        return self.read_entry(self.path(key)) is not None
+
+    def get(self, key, default = None):
+        entry = self.read_entry(self.path(key))
+        return default if entry is None else entry["data"]
+
+    def __getitem__(self, key):
+        entry = self.read_entry(self.path(key))
+        if entry is None:
+            raise KeyError(key)
+        return entry["data"]
+
+    def __setitem__(self, key, data):
+        created = self.clock()
+        timestamp = datetime.fromtimestamp(created, pytz.utc).strftime("%Y-%m-%d %H:%M %Z")
+        entry = {"_timestamp": timestamp, "_created": created, "key": str(key), "data": data}
+
+        def write(fout):
+            with gzip.open(fout, "wt", encoding = "utf-8") as gz:
+                json.dump(entry, gz, separators = (",", ":"))
+
+        file_loc = self.path(key)
+        is_new = not os.path.exists(file_loc)
+        atomic_write(file_loc, write, mode = "wb")
+
+        # entries are expired and ordered by their modification time
+        os.utime(file_loc, (created, created))
+
+        self.writes += 1
+        if self.num_entries is None:
+            self.evict()
+        elif is_new:
+            self.num_entries += 1
+
+        if (self.writes >= self.evict_every or
+            (self.max_entries is not None and self.num_entries > self.max_entries)):
+            self.evict()
+
+    def entries(self):
+        """Return (modification time, file location) of all entries, oldest
+        first."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        with os.scandir(self.cache_dir) as it:
+            entries = [
+                (dir_entry.stat().st_mtime, dir_entry.path)
+                for dir_entry in it if dir_entry.name.endswith(".json.gz")
+            ]
+        return sorted(entries)
+
+    def evict(self):
+        """Delete expired entries (by modification time), and the oldest
+        entries beyond max_entries."""
+        locs = []
+        for mtime, loc in self.entries():
+            if self.is_expired(mtime):
+                os.remove(loc)
+            else:
+                locs.append(loc)
+
+        if self.max_entries is not None:
+            for loc in locs[ : max(0, len(locs) - self.max_entries)]:
+                os.remove(loc)
+            locs = locs[-self.max_entries : ] if self.max_entries else []
+
+        self.num_entries = len(locs)
+        self.writes = 0
+
+
+def cached(cache_dir, ttl = None, max_entries = None, version = 1):
+    """Cache a function's results on disk, keyed on its arguments.
+
+    Unlike load_if_exist(), each distinct set of (JSON-serializable)
+    arguments gets its own entry in cache_dir/<function name>/. Bumping
+    version invalidates all existing entries of the function. See Cache for
+    ttl and max_entries.
+
+    The cache for the function is available as wrapper.cache.
+    """
+    def decorator(function):
+        store = Cache(
+            os.path.join(cache_dir, function.__name__),
+            ttl = ttl, max_entries = max_entries
+        )
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            key = "v{}-{}".format(version, hash_args(*args, **kwargs))
+
+            entry = store.read_entry(store.path(key))
+            if entry is not None:
+                return entry["data"]
+
+            data = function(*args, **kwargs)
+            store[key] = data
+            return data
+
+        wrapper.cache = store
+        return wrapper
+
+    return decorator
@@ -3,76 +3,168 @@
 import aiohttp
 import asyncio
 import logging
+import random
 
 from tqdm import tqdm
 
 
-@asyncio.coroutine
-def fetch_page(key, semaphore, url, params = None, rettype = "text",
-    MAX_RETRIES = 3, MAX_TIMEOUT = 5, RETRY_WAIT_TIME = 0.1, *args, **kwargs):
-    """Fetch a webpage asynchronously and return the result.
+# HTTP status codes that may succeed if the request is retried later
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-    Results are indexed by a unique key.
+
+def backoff_delay(attempt, base, cap):
+    """Return a randomized exponential backoff delay (in seconds) to wait
+    before retry number `attempt` (starting from 0).
+
+    Uses "full jitter": a uniform random delay between 0 and
+    min(cap, base * 2**attempt), so that failed requests don't all retry
+    at once.
     """
-    with (yield from semaphore): # limit number of concurrent requests
-        for i in range(MAX_RETRIES):
-            with aiohttp.Timeout(MAX_TIMEOUT), aiohttp.ClientSession() as session:
-                try:
-                    resp = yield from session.get(url, params = params)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
 
-                    if rettype == "text":
-                        return (key, (yield from resp.text(encoding = "utf-8")))
-                    else:
-                        return (key, (yield from resp.json()))
 
-                except Exception as exc:
-                    logger = logging.getLogger(__name__)
-                    logger.warn("Failed to fetch {}:{}({}) on try #{}/{}: {}".format(
-                        key, url, params, i+1, MAX_RETRIES, str(exc)
-                    ))
+async def fetch_page(session, key, url, params = None, rettype = "text",
+    MAX_RETRIES = 3, MAX_TIMEOUT = 5, RETRY_WAIT_TIME = 0.1,
+    MAX_RETRY_WAIT_TIME = 10, rate_limiter = None):
+    """Fetch a webpage asynchronously using a shared aiohttp session and
+    return the result.
 
-                    yield from asyncio.sleep(RETRY_WAIT_TIME)
+    Results are indexed by a unique key. Failed requests are retried with
+    exponential backoff, except for client errors (4xx other than 429),
+    which won't succeed on a retry.
 
-        return (key, None)
+    If rate_limiter (a rate_limit.RateLimiter) is given, every attempt waits
+    for its host's rate limit, and response statuses are reported back to it.
 
+    rettype is one of "text", "json", or "raw" (the undecoded response body
+    as bytes, along with the response headers).
 
-def fetch_and_map(function, data, MAX_CONNECTIONS = 4, *args, **kwargs):
-    """Asychronously fetch and apply a function to the content of a dictionary
-    of URLs.
+    Returns: (key, text or json or (bytes, headers)) or (key, None) on failure
+    (including a response body that can't be decoded as rettype)
+    """
+    logger = logging.getLogger(__name__)
+    timeout = aiohttp.ClientTimeout(total = MAX_TIMEOUT)
 
-    Results are returned as a dictionary. Args and kwargs are passed to the
-    fetch_page() function to set the HTML request parameters.
+    for i in range(MAX_RETRIES):
+        if rate_limiter is not None:
+            await rate_limiter.async_wait(url)
 
-    Input: F = function(), data = {key: (url, params)}
-    Returns: {key: F(fetch_url(url))}
+        try:
+            async with session.get(url, params = params, timeout = timeout) as resp:
+                if rate_limiter is not None:
+                    rate_limiter.report(url, resp.status)
+
+                resp.raise_for_status()
+
+                if rettype == "text":
+                    return (key, await resp.text(encoding = "utf-8"))
+                elif rettype == "raw":
+                    return (key, (await resp.read(), resp.headers))
+                else:
+                    return (key, await resp.json(content_type = None))
+
+        except aiohttp.ClientResponseError as exc:
+            logger.warning("Failed to fetch {}:{}({}) on try #{}/{}: HTTP {}".format(
+                key, url, params, i+1, MAX_RETRIES, exc.status
+            ))
+
+            if exc.status not in RETRY_STATUSES:
+                break
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            logger.warning("Failed to fetch {}:{}({}) on try #{}/{}: {!r}".format(
+                key, url, params, i+1, MAX_RETRIES, exc
+            ))
+
+        except (ValueError, UnicodeDecodeError) as exc:
+            # a body that isn't valid JSON (json.JSONDecodeError) or UTF-8
+            # won't be any different on a retry
+            logger.warning("Failed to fetch {}:{}({}) on try #{}/{}: bad response body {!r}".format(
+                key, url, params, i+1, MAX_RETRIES, exc
+            ))
+            break
+
+        if i + 1 < MAX_RETRIES:
+            await asyncio.sleep(backoff_delay(i, RETRY_WAIT_TIME, MAX_RETRY_WAIT_TIME))
+
+    return (key, None)
+
+
+async def async_fetch_and_map(function, data, MAX_CONNECTIONS = 4,
+    callback = None, session = None, progress = True, **kwargs):
+    """Coroutine version of fetch_and_map(), for use inside a running event
+    loop.
+
+    If session is given, it is used (and left open) instead of creating a new
+    session for this call.
     """
+    logger = logging.getLogger(__name__)
 
-    @asyncio.coroutine
-    def process(semaphore):
-        tasks = [
-            fetch_page(key, semaphore, url, params = params, *args, **kwargs)
-            for key, (url, params) in data.items()
-        ]
+    total = len(data) if hasattr(data, "__len__") else None
+    items = iter(data.items() if isinstance(data, dict) else data)
 
-        res = {}
-        for coroutine in tqdm(asyncio.as_completed(tasks), total = len(tasks)):
-            key, val = yield from coroutine
+    res = {} if callback is None else None
+    pbar = tqdm(total = total, disable = not progress)
 
-            if val is not None:
-                res[key] = function(key, val)
+    async def worker(session):
+        # all workers share one iterator, so only MAX_CONNECTIONS requests
+        # exist at any time, no matter how many URLs there are
+        for key, (url, params) in items:
+            key, val = await fetch_page(session, key, url, params = params, **kwargs)
+            pbar.update()
+
+            if val is None:
+                logger.warning("Could not process {}:{}".format(key, url))
+                continue
+
+            result = function(key, val)
+            if callback is None:
+                res[key] = result
             else:
-                logger = logging.getLogger(__name__)
-                logging.warn("Could not process {}:{}".format(key, data[key]))
+                callback(key, result)
+
+    async def run(session):
+        await asyncio.gather(*(worker(session) for _ in range(MAX_CONNECTIONS)))
+
+    try:
+        if session is not None:
+            await run(session)
+        else:
+            connector = aiohttp.TCPConnector(limit = MAX_CONNECTIONS)
+            async with aiohttp.ClientSession(connector = connector) as session:
+                await run(session)
+    finally:
+        pbar.close()
+
+    return res
+
+
+def fetch_and_map(function, data, MAX_CONNECTIONS = 4, callback = None,
+    **kwargs):
+    """Asychronously fetch and apply a function to the content of a dictionary
+    of URLs.
+
+    All requests share one connection pool of size MAX_CONNECTIONS, so
+    repeated requests to the same host reuse open connections. Kwargs are
+    passed to the fetch_page() function to set the HTML request parameters.
+
+    data may also be an iterable of (key, (url, params)) pairs, which is
+    consumed lazily.
 
-        return res
+    If callback is given, callback(key, F(fetch_url(url))) is called as soon
+    as each page is processed and no results are kept in memory.
 
+    Input: F = function(), data = {key: (url, params)}
+    Returns: {key: F(fetch_url(url))} (None if callback is given)
+    """
     # using asyncio.get_event_loop() means it grabs the main event loop, which,
     # when closed, stops all other event loops from working
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
 
-    semaphore = asyncio.Semaphore(MAX_CONNECTIONS, loop = loop)
-    res = loop.run_until_complete(process(semaphore))
-    loop.close()
-
-    return res
+    try:
+        return loop.run_until_complete(async_fetch_and_map(
+            function, data, MAX_CONNECTIONS, callback = callback, **kwargs
+        ))
+    finally:
+        loop.close()
@@ -7,25 +7,50 @@
 import argparse
 import os
 import subprocess
+import sys
 import textwrap
-from pathlib import Path
 from tqdm import tqdm
 
 from preprocess.util import (create_sublists_sized_n,
                              create_sublist_symlinks,
                              ensure_path_exists,
-                             file_exists_or_exit)
+                             file_exists_or_exit,
+                             add_corpus_arguments,
+                             iter_corpus_files,
+                             iter_input_files,
+                             parse_shards,
+                             write_file_list)
 
-from preprocess.cluster.util import submit_pbs_job
+from preprocess.cluster.executors import (add_executor_arguments,
+                                          get_executor,
+                                          print_job_summary)
+from preprocess.cluster.util import (get_array_range,
+                                     get_array_task_lines,
+                                     write_chunk_manifest)
 
-def create_job_file(job_dir, sublist_dir, output_directory, chunk_num, args):
+def strip_suffix(name, suffix):
 
-    ''' Create PBS job file in job_dir
+    ''' Returns name without suffix, if it ends with suffix '''
+
+    return name[:-len(suffix)] if name.endswith(suffix) else name
+
+def get_chunk_directories(output_directory, chunk_num, args):
+
+    ''' Returns (output directory, log directory) for chunk chunk_num,
+        creating the log directory
     '''
 
     job_log_directory = os.path.join(args.logdir, 'sublist_{}'.format(chunk_num))
     ensure_path_exists(job_log_directory)
-    cust_dict = {'output_dir': os.path.join(output_directory, 'chunk_{}'.format(chunk_num)),
+    return os.path.join(output_directory, 'chunk_{}'.format(chunk_num)), job_log_directory
+
+def create_job_file(job_dir, sublist_dir, output_directory, chunk_num, args):
+
+    ''' Create PBS job file in job_dir
+    '''
+
+    chunk_output_directory, job_log_directory = get_chunk_directories(output_directory, chunk_num, args)
+    cust_dict = {'output_dir': chunk_output_directory,
                  'chunk_num': chunk_num,
                  'bioshovel_dir': args.bioshovel,
                  'tmchem': args.tmchem,
@@ -73,6 +98,60 @@ def create_job_file(job_dir, sublist_dir, output_directory, chunk_num, args):
 
     return job_file_path
 
+def create_array_job_file(job_dir, manifest_path, num_chunks, args):
+
+    ''' Create a PBS array job file in job_dir with one task per chunk in the
+        chunk manifest at manifest_path (see write_chunk_manifest())
+    '''
+
+    cust_dict = {'array_range': get_array_range(num_chunks, args.max_running),
+                 'array_task_lines': get_array_task_lines(manifest_path,
+                                                          ('CHUNK_NUM', 'INPUT_DIR', 'OUTPUT_DIR', 'LOG_DIR')),
+                 'bioshovel_dir': args.bioshovel,
+                 'tmchem': args.tmchem,
+                 'poolsize': args.poolsize,
+                 'walltime_hours': 240,
+                 'memgb': args.memgb
+                 }
+
+    pbs_jobfile = textwrap.dedent('''
+        #!/bin/bash
+        #PBS -l nodes=1:ppn={poolsize}
+        #PBS -l cput=960:00:00
+        #PBS -l walltime={walltime_hours}:00:00
+        #PBS -j oe
+        #PBS -l mem={memgb}gb
+        #PBS -N "tmchem"
+        #PBS -t {array_range}
+        #PBS -m n
+
+        {array_task_lines}
+
+        # python 3.4+ required
+        module load python/3.5.1
+
+        # move to bioshovel directory and activate venv
+        cd {bioshovel_dir}
+        source venv/bin/activate
+
+        # run preprocess.chem_ner
+        cd src
+        python3 -m preprocess.chem_ner "$INPUT_DIR" "$OUTPUT_DIR" --tmchem {tmchem} --logdir "$LOG_DIR" --notqdm --poolsize {poolsize}
+
+        STATUS=$?
+        if [ $STATUS -ne 0 ]; then
+          echo "Chem NER (tmChem) failed for chunk $CHUNK_NUM"; exit $STATUS
+        else
+          echo "Finished chunk $CHUNK_NUM successfully!"
+        fi
+        ''').strip('\n').format(**cust_dict)
+
+    job_file_path = os.path.join(job_dir, 'chem_ner_array.job')
+    with open(job_file_path, 'w') as f:
+        f.write(pbs_jobfile)
+
+    return job_file_path
+
 def main(args):
 
     # make all paths absolute (to simplify things later)
@@ -100,11 +179,17 @@ def main(args):
 
         print('Reading previously completed files...')
         # this set may use a lot of RAM if args.resume path contains a ton of files...
-        done_files = set(p.name.rstrip('.tmChem') for p in tqdm(Path(args.resume).glob('**/*')) if p.is_file())
+        done_files = set(strip_suffix(os.path.basename(path), '.tmChem')
+                         for path in tqdm(iter_corpus_files(args.resume)))
 
-        all_files = (str(f) for f in tqdm(Path(args.paragraph_path).glob('**/*')) if f.is_file() and f.name not in done_files)
+        all_files = (path for path in tqdm(iter_input_files(args.paragraph_path,
+                                                             shards=parse_shards(args.shards),
+                                                             listing_file=args.file_listing))
+                     if os.path.basename(path) not in done_files)
     else:
-        all_files = (str(f) for f in tqdm(Path(args.paragraph_path).glob('**/*')) if f.is_file())
+        all_files = tqdm(iter_input_files(args.paragraph_path,
+                                           shards=parse_shards(args.shards),
+                                           listing_file=args.file_listing))
 
     # divide list into chunks of size n
     filelist_with_sublists = create_sublists_sized_n(all_files, args.nfiles)
@@ -118,30 +203,53 @@ def main(args):
     output_directory = os.path.join(args.output_directory, 'output')
     for path in (base_input_directory, job_dir, output_directory):
         ensure_path_exists(path)
-    job_file_paths_failed = []
-    jobs_submitted_success = 0
-    for sublist_num, sublist in enumerate(filelist_with_sublists):
-        sublist_dir = os.path.join(base_input_directory, 
-                                   'sublist_{0:0>4}'.format(sublist_num))
-        ensure_path_exists(sublist_dir)
-        create_sublist_symlinks(sublist, sublist_dir, 1000)
-        job_file_path = create_job_file(job_dir, sublist_dir, output_directory, sublist_num, args)
-        if args.submit:
-            result = submit_pbs_job(job_file_path, queue=args.queue)
-            if result:
-                jobs_submitted_success += 1
+
+    def create_sublists():
+        for sublist_num, sublist in enumerate(filelist_with_sublists):
+            sublist_dir = os.path.join(base_input_directory,
+                                       'sublist_{0:0>4}'.format(sublist_num))
+            if args.file_lists:
+                # chem_ner reads the file list in place of a directory
+                sublist_dir += '.txt'
+                write_file_list(sublist, sublist_dir)
             else:
-                job_file_paths_failed.append(job_file_path)
+                ensure_path_exists(sublist_dir)
+                create_sublist_symlinks(sublist, sublist_dir, 1000)
+            yield sublist_num, sublist_dir
 
-    print('Successfully submitted {} jobs with {} failed submissions'.format(jobs_submitted_success,
-                                                                             len(job_file_paths_failed)))
-    for path in job_file_paths_failed:
-        print('FAILED TO SUBMIT', path)
+    if args.array:
+        # one array job, with a task for each line of the chunk manifest
+        manifest_path = os.path.join(job_dir, 'chunk_manifest.tsv')
+        chunks = ((sublist_num, sublist_dir)+get_chunk_directories(output_directory, sublist_num, args)
+                  for sublist_num, sublist_dir in create_sublists())
+        num_chunks = write_chunk_manifest(manifest_path, chunks)
+        if not num_chunks:
+            print('No input files found')
+            return
+
+        job_file_paths = [create_array_job_file(job_dir, manifest_path, num_chunks, args)]
+        print('Created array job file {} for {} chunks'.format(job_file_paths[0], num_chunks))
+    else:
+        job_file_paths = (create_job_file(job_dir, sublist_dir, output_directory, sublist_num, args)
+                          for sublist_num, sublist_dir in create_sublists())
+
+    # submit (or run) each job as soon as its job file is created
+    executor = get_executor(args)
+    for job_file_path in job_file_paths:
+        if args.submit:
+            executor.submit(job_file_path)
+
+    if args.submit:
+        results = executor.wait()
+        print_job_summary(results)
+        # (so that callers, like a pipeline job, can tell that a job failed)
+        if any(r.status for r in results):
+            sys.exit(1)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run preprocess.chem_ner as a collection of cluster jobs')
     parser.add_argument('paragraph_path',
-                        help='Directory of parsed paragraph files')
+                        help='Directory of parsed paragraph files (or a file listing their paths, one per line)')
     parser.add_argument('output_directory',
                         help='Final output directory')
     parser.add_argument('--tmchem',
@@ -153,11 +261,14 @@ if __name__ == '__main__':
     parser.add_argument('--bioshovel',
                         help='Path to bioshovel directory',
                         default='/gpfs/group/su/sandip/bioshovel')
-    parser.add_argument('--queue',
-                        help='Cluster queue for job submission',
-                        default='new')
+    add_executor_arguments(parser)
+    add_corpus_arguments(parser)
     parser.add_argument('--submit',
-                        help='Submit jobs after creating job files',
+                        help='Submit (or with --executor local, run) jobs after creating job files',
+                        action='store_true')
+    parser.add_argument('--file_lists',
+                        help='Write a list of input file paths for each chunk (input_files/sublist_NNNN.txt) '
+                             'instead of a directory of symlinks',
                         action='store_true')
     parser.add_argument('--nfiles',
                         help='Number of files per PBS job',
@@ -171,6 +282,13 @@ if __name__ == '__main__':
                         help='Amount of RAM to allocate per PBS job (GB)',
                         type=int,
                         default=47)
+    parser.add_argument('--array',
+                        help='Create (and submit) a single PBS array job with one task per chunk, '
+                             'instead of one job per chunk',
+                        action='store_true')
+    parser.add_argument('--max_running',
+                        help='With --array, maximum number of array tasks running at once',
+                        type=int)
     parser.add_argument('--resume',
                         help='Resume job submission based on a previous output directory',
                         type=str)
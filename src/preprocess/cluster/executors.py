@@ -0,0 +1,267 @@
+''' Execution backends for PBS job files
+
+    The cluster scripts (preprocess.chem_ner_cluster, preprocess.prep_corenlp)
+    write a PBS job file per chunk of work (or one array job file, with a task
+    per chunk) and hand each file to an executor:
+
+    PBSExecutor     submits job files to a PBS queue with `qsub`
+    LocalExecutor   runs job files with bash on this machine, no more than
+                    max_jobs at once, recording exit status and timings
+
+    executor = get_executor(args)   # see add_executor_arguments()
+    job_id = executor.submit(job_file_path)
+    executor.submit(next_job_file_path, dependencies=[job_id])
+    results = executor.wait()
+
+    A job submitted with dependencies only runs once those jobs have finished
+    successfully (PBS `afterok`), see preprocess.pipeline
+'''
+
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import (Future,
+                                ThreadPoolExecutor)
+
+from preprocess.cluster.util import submit_pbs_job
+
+# one result per job (or per array job task)
+#   job_id:     PBS job ID, or a local ID (None if submission failed)
+#   task:       $PBS_ARRAYID of an array job task (None for other jobs)
+#   status:     exit status (None if unknown, e.g. a job submitted to PBS)
+#   seconds:    wall time (None if unknown)
+#   log_path:   file with the job's output (None if unknown)
+#   skipped:    True if the job didn't run because a dependency failed
+JobResult = namedtuple('JobResult', ['job_file_path', 'job_id', 'task',
+                                     'status', 'seconds', 'log_path',
+                                     'skipped'])
+JobResult.__new__.__defaults__ = (False,)
+
+ARRAY_RANGE_REGEX = re.compile(r'^#PBS\s+-t\s+(\d+)-(\d+)', re.MULTILINE)
+
+def get_array_tasks(job_file_path):
+
+    ''' Returns the list of array task IDs ($PBS_ARRAYID values) in the
+        `#PBS -t` line of a job file ([None] if it isn't an array job)
+    '''
+
+    with open(job_file_path) as f:
+        match = ARRAY_RANGE_REGEX.search(f.read())
+
+    if not match:
+        return [None]
+    first, last = (int(n) for n in match.groups())
+    return list(range(first, last+1))
+
+class Executor(object):
+
+    ''' Interface for running PBS job files
+
+        submit() returns a job ID (None if the job couldn't be submitted),
+        wait() returns a list of JobResults for all submitted jobs (once they
+        have finished, for executors that can tell)
+
+        A job submitted with dependencies (a list of job IDs returned by
+        submit()) runs only after all of those jobs finished successfully
+    '''
+
+    def submit(self, job_file_path, dependencies=()):
+        raise NotImplementedError
+
+    def wait(self):
+        raise NotImplementedError
+
+class PBSExecutor(Executor):
+
+    ''' Submits job files to a PBS queue (jobs run asynchronously, so their
+        status and timings are unknown)
+    '''
+
+    def __init__(self, queue='new'):
+        self.queue = queue
+        self.results = []
+
+    def submit(self, job_file_path, dependencies=()):
+        if None in dependencies:
+            # a dependency wasn't submitted, so this job could never run
+            job_id = None
+        else:
+            job_id = submit_pbs_job(job_file_path, queue=self.queue,
+                                    dependencies=dependencies)
+        self.results.append(JobResult(job_file_path, job_id, None, None, None, None))
+        return job_id
+
+    def wait(self):
+        return list(self.results)
+
+class LocalExecutor(Executor):
+
+    ''' Runs job files with bash on this machine, using a pool of max_jobs
+        threads (so no more than max_jobs jobs run at once)
+
+        Each task of an array job runs separately, with $PBS_ARRAYID set.
+        Jobs run in the directory of their job file (like `qsub` from that
+        directory, see submit_pbs_job()), with their output saved to
+        [job_file_path].out (or [job_file_path].[task].out)
+
+        Jobs with dependencies are queued once their dependencies have
+        finished (so they don't take up one of the max_jobs threads while
+        waiting), or skipped if any of them failed
+    '''
+
+    def __init__(self, max_jobs=os.cpu_count(), shell='bash'):
+        self.shell = shell
+        self.pool = ThreadPoolExecutor(max_jobs)
+        self.futures = []
+        self.job_futures = {}
+        self.num_submitted = 0
+
+    def run_job(self, job_file_path, job_id, task):
+
+        ''' Runs one job (or array job task) and returns its JobResult
+        '''
+
+        job_dir = os.path.dirname(os.path.abspath(job_file_path))
+        env = dict(os.environ, PBS_JOBID=job_id, PBS_O_WORKDIR=job_dir)
+        if task is None:
+            log_path = job_file_path+'.out'
+        else:
+            env['PBS_ARRAYID'] = str(task)
+            log_path = '{}.{}.out'.format(job_file_path, task)
+
+        start = time.perf_counter()
+        with open(log_path, 'w') as log:
+            status = subprocess.call([self.shell, os.path.abspath(job_file_path)],
+                                     cwd=job_dir,
+                                     env=env,
+                                     stdout=log,
+                                     stderr=subprocess.STDOUT)
+
+        return JobResult(job_file_path, job_id, task, status,
+                         time.perf_counter() - start, log_path)
+
+    def run_after(self, dependency_futures, job_file_path, job_id, task):
+
+        ''' Returns a future for the JobResult of a job (or array job task)
+            that is queued once all dependency_futures are done, if their jobs
+            all succeeded (otherwise the job is skipped)
+        '''
+
+        if not dependency_futures:
+            return self.pool.submit(self.run_job, job_file_path, job_id, task)
+
+        future = Future()
+        remaining = [len(dependency_futures)]
+        lock = threading.Lock()
+
+        def copy_result(job_future):
+            if job_future.exception():
+                future.set_exception(job_future.exception())
+            else:
+                future.set_result(job_future.result())
+
+        def dependency_done(dependency_future):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if all(job_succeeded(f) for f in dependency_futures):
+                self.pool.submit(self.run_job, job_file_path, job_id, task).add_done_callback(copy_result)
+            else:
+                future.set_result(JobResult(job_file_path, job_id, task,
+                                            None, None, None, skipped=True))
+
+        for dependency_future in dependency_futures:
+            dependency_future.add_done_callback(dependency_done)
+
+        return future
+
+    def submit(self, job_file_path, dependencies=()):
+        tasks = get_array_tasks(job_file_path)
+        self.num_submitted += 1
+        job_id = 'local{}'.format(self.num_submitted)
+        if tasks != [None]:
+            job_id += '[]'
+
+        # (every task of an array job dependency has to finish)
+        dependency_futures = [future
+                              for dependency in dependencies
+                              for future in self.job_futures[dependency]]
+        self.job_futures[job_id] = [self.run_after(dependency_futures, job_file_path, job_id, task)
+                                    for task in tasks]
+        self.futures.extend(self.job_futures[job_id])
+
+        return job_id
+
+    def wait(self):
+        results = [future.result() for future in self.futures]
+        self.pool.shutdown()
+        return results
+
+def job_succeeded(future):
+
+    ''' True if the job (or array job task) with this (done) future ran and
+        exited with status 0
+    '''
+
+    return not future.exception() and future.result().status == 0
+
+def add_executor_arguments(parser):
+
+    ''' Adds --executor (and --queue/--max_jobs) arguments to an
+        argparse parser, see get_executor()
+    '''
+
+    parser.add_argument('--executor', choices=('pbs', 'local'), default='pbs',
+                        help='Submit jobs to a PBS queue, or run them on this machine (default pbs)')
+    parser.add_argument('--queue', help='Cluster queue for job submission (default new)',
+                        default='new')
+    parser.add_argument('--max_jobs', type=int, default=1,
+                        help='With --executor local, number of jobs run at once (default 1)')
+
+def get_executor(args):
+
+    ''' Returns the executor selected by the arguments from
+        add_executor_arguments()
+    '''
+
+    if args.executor == 'local':
+        return LocalExecutor(max_jobs=args.max_jobs)
+    return PBSExecutor(queue=args.queue)
+
+def print_job_summary(results):
+
+    ''' Prints a summary of a list of JobResults: failed submissions, and
+        for jobs that ran, failures and timings
+    '''
+
+    failed_submissions = [r for r in results if r.job_id is None]
+    # (array jobs have a result per task)
+    submitted = set((r.job_file_path, r.job_id) for r in results if r.job_id is not None)
+    finished = [r for r in results if r.status is not None]
+    failed = [r for r in finished if r.status != 0]
+    skipped = [r for r in results if r.skipped]
+
+    print('Successfully submitted {} jobs with {} failed submissions'.format(len(submitted),
+                                                                             len(failed_submissions)))
+    for result in failed_submissions:
+        print('FAILED TO SUBMIT', result.job_file_path)
+
+    if finished:
+        seconds = [r.seconds for r in finished]
+        print('{} jobs (or array tasks) finished, {} failed: '
+              '{:.1f}s total, {:.1f}s mean, {:.1f}s max job time'.format(len(finished),
+                                                                         len(failed),
+                                                                         sum(seconds),
+                                                                         sum(seconds)/len(seconds),
+                                                                         max(seconds)))
+    for result in failed:
+        print('FAILED (exit status {}): {} (see {})'.format(result.status,
+                                                           result.job_file_path if result.task is None else
+                                                           '{} task {}'.format(result.job_file_path, result.task),
+                                                           result.log_path))
+    if skipped:
+        print('{} jobs (or array tasks) not run because a job they depend on failed'.format(len(skipped)))
@@ -1,22 +1,91 @@
 import subprocess
 import sys
+import textwrap
 from pathlib import Path
 
-def submit_pbs_job(job_file_path, queue='new'):
+def get_pbs_dependency(job_ids):
 
-    ''' Submits a PBS job file at job_file_path to queue
+    ''' Returns a `qsub -W depend=` value that holds a job until all job_ids
+        have finished successfully (afterok, or afterokarray for array job
+        IDs like 1234[])
+    '''
+
+    jobs = [job_id for job_id in job_ids if not job_id.endswith('[]')]
+    array_jobs = [job_id for job_id in job_ids if job_id.endswith('[]')]
+
+    dependency = []
+    if jobs:
+        dependency.append(':'.join(['afterok']+jobs))
+    if array_jobs:
+        dependency.append(':'.join(['afterokarray']+array_jobs))
+    return ','.join(dependency)
+
+def submit_pbs_job(job_file_path, queue='new', dependencies=None):
+
+    ''' Submits a PBS job file at job_file_path to queue, optionally held
+        until the jobs with IDs in dependencies have finished successfully
 
         Returns new PBS job ID if successful or None if unsuccessful
     '''
 
     path = Path(job_file_path)
+    command = ['qsub', '-q', queue]
+    if dependencies:
+        command += ['-W', 'depend='+get_pbs_dependency(dependencies)]
     try:
-        out = subprocess.check_output(['qsub', '-q',
-                                       queue,
-                                       path.name],
-                                       cwd=str(path.parent))
+        out = subprocess.check_output(command+[path.name],
+                                      cwd=str(path.parent))
         return out.decode('utf-8').rstrip('\n').split('.')[0]
     except subprocess.CalledProcessError as err:
         string_error = err.output.decode(encoding='UTF-8').rstrip('\n')
         print(string_error, file=sys.stderr)
-        return None
\ No newline at end of file
+        return None
+
+def write_chunk_manifest(manifest_path, chunks):
+
+    ''' Writes a chunk manifest for a PBS array job to manifest_path: one
+        tab-separated line of fields per chunk, where chunks is an iterable of
+        tuples of fields (which can't contain tabs or newlines)
+
+        The task with $PBS_ARRAYID i processes the chunk on line i+1 (see
+        get_array_task_lines())
+
+        Returns the number of chunks written
+    '''
+
+    num_chunks = 0
+    with open(manifest_path, 'w') as f:
+        for fields in chunks:
+            f.write('\t'.join(str(field) for field in fields)+'\n')
+            num_chunks += 1
+
+    return num_chunks
+
+def get_array_range(num_chunks, max_running=None):
+
+    ''' Returns the `#PBS -t` range for an array job with one task per
+        chunk, optionally limiting the number of tasks running at once
+    '''
+
+    array_range = '0-{}'.format(num_chunks-1)
+    if max_running:
+        array_range += '%{}'.format(max_running)
+    return array_range
+
+def get_array_task_lines(manifest_path, field_names):
+
+    ''' Returns lines of bash (a string) for an array job script that read
+        this task's chunk (line $PBS_ARRAYID+1) from the chunk manifest at
+        manifest_path into shell variables named field_names, exiting if there
+        is no such line
+    '''
+
+    return textwrap.dedent('''
+        # read this task's chunk from the chunk manifest
+        CHUNK_LINE=$(sed -n "$((PBS_ARRAYID + 1))p" {manifest_path})
+        if [ -z "$CHUNK_LINE" ]; then
+          echo "No chunk $PBS_ARRAYID in {manifest_path}"; exit 1
+        fi
+        IFS=$'\\t' read -r {variables} <<< "$CHUNK_LINE"
+        ''').strip('\n').format(manifest_path=manifest_path,
+                                 variables=' '.join(field_names))
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+'''corenlp_annotate.py
+
+Annotates plaintext files with Stanford CoreNLP running in server mode
+
+Starts a pool of persistent CoreNLP servers on this machine (or uses servers
+that are already running, see --server_url) and streams documents to them over
+HTTP, with a bounded number of requests in flight. Models are loaded once per
+server, instead of once per corenlp.sh run.
+
+Output is one JSON file per input file, saved as
+[output_directory]/[input_filename].json -- the same layout as
+`corenlp.sh -outputFormat json -outputDirectory [output_directory]`, which is
+what deepdive/udf/load_sentences.py reads. Files that already have output are
+skipped, so an interrupted run can be restarted.
+
+usage:
+cd bioshovel/src # this is the parent directory of this script file
+python3 -m preprocess.corenlp_annotate [output_directory] --input_directory [plaintext_directory] --corenlp [path/to/corenlp]
+python3 -m preprocess.corenlp_annotate [output_directory] --filelist [file_list] --server_url http://localhost:9000
+
+Run `python3 -m preprocess.corenlp_annotate -h` for options
+'''
+
+import argparse
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import (FIRST_COMPLETED,
+                                ThreadPoolExecutor,
+                                wait)
+from itertools import cycle
+from tqdm import tqdm
+
+from preprocess.util import (ensure_path_exists,
+                             file_exists_or_exit)
+
+DEFAULT_ANNOTATORS = 'tokenize,ssplit,pos,lemma,ner,parse'
+
+class CoreNLPServer(object):
+
+    ''' A CoreNLP server process (StanfordCoreNLPServer) on a local port
+
+        Use as a context manager to start the server, wait until it is ready
+        and stop it afterwards:
+
+        with CoreNLPServer(corenlp_dir, port=9000) as server:
+            annotate_text(server.url, text)
+    '''
+
+    def __init__(self, corenlp_dir, port=9000, threads=4, memory='4g',
+                 annotators=DEFAULT_ANNOTATORS, timeout=60, java='java'):
+        self.corenlp_dir = corenlp_dir
+        self.port = port
+        self.threads = threads
+        self.memory = memory
+        self.annotators = annotators
+        self.timeout = timeout
+        self.java = java
+        self.process = None
+
+    @property
+    def url(self):
+        return 'http://localhost:{}'.format(self.port)
+
+    def get_command(self):
+
+        ''' Returns the command (a list) that starts this server
+        '''
+
+        return [self.java,
+                '-mx{}'.format(self.memory),
+                '-cp', os.path.join(self.corenlp_dir, '*'),
+                'edu.stanford.nlp.pipeline.StanfordCoreNLPServer',
+                '-port', str(self.port),
+                '-threads', str(self.threads),
+                '-timeout', str(self.timeout*1000),
+                '-preload', self.annotators]
+
+    def start(self, log_file=subprocess.DEVNULL):
+        self.process = subprocess.Popen(self.get_command(),
+                                        stdout=log_file,
+                                        stderr=subprocess.STDOUT)
+
+    def wait_until_ready(self, startup_timeout=300, poll_interval=1):
+
+        ''' Waits until the server answers HTTP requests (preloading models
+            can take a few minutes)
+
+            Raises RuntimeError if the server exits or isn't ready after
+            startup_timeout seconds
+        '''
+
+        deadline = time.monotonic() + startup_timeout
+        while time.monotonic() < deadline:
+            if self.process and self.process.poll() is not None:
+                raise RuntimeError('CoreNLP server on port {} exited with status {}'.format(self.port,
+                                                                                           self.process.returncode))
+            if server_is_ready(self.url):
+                return
+            time.sleep(poll_interval)
+
+        raise RuntimeError('CoreNLP server on port {} not ready after {}s'.format(self.port,
+                                                                                 startup_timeout))
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def __enter__(self):
+        self.start()
+        try:
+            self.wait_until_ready()
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def get_free_port():
+
+    ''' Returns a local TCP port that is currently free
+    '''
+
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+def server_is_ready(url):
+
+    ''' True if the CoreNLP server at url answers its /ready endpoint
+        (servers older than /ready answer with a 404, which also counts)
+    '''
+
+    try:
+        with urllib.request.urlopen(url.rstrip('/')+'/ready', timeout=5):
+            return True
+    except urllib.error.HTTPError as e:
+        return e.code < 500
+    except (urllib.error.URLError, OSError):
+        return False
+
+def annotate_text(url, text, annotators=DEFAULT_ANNOTATORS, timeout=60):
+
+    ''' Annotates text (a string) with the CoreNLP server at url
+
+        Returns the server's JSON output (bytes)
+
+        Raises urllib.error.URLError (or HTTPError) if the request fails
+    '''
+
+    properties = json.dumps({'annotators': annotators,
+                             'outputFormat': 'json'})
+    request_url = '{}/?{}'.format(url.rstrip('/'),
+                                  urllib.parse.urlencode({'properties': properties}))
+    request = urllib.request.Request(request_url,
+                                     data=text.encode('utf-8'),
+                                     headers={'Content-Type': 'text/plain; charset=utf-8'})
+
+    # (the server's own timeout is per document, so allow for queueing)
+    with urllib.request.urlopen(request, timeout=timeout*2) as response:
+        return response.read()
+
+def get_output_path(input_file, output_dir):
+
+    ''' Returns the output path for input_file: [output_dir]/[filename].json
+        (like corenlp.sh -outputDirectory)
+    '''
+
+    return os.path.join(output_dir, os.path.basename(input_file)+'.json')
+
+def annotate_file(input_file, output_dir, url, annotators=DEFAULT_ANNOTATORS,
+                  timeout=60, retries=2, retry_wait=1):
+
+    ''' Annotates one plaintext file with the CoreNLP server at url and saves
+        its JSON output (see get_output_path())
+
+        Failed requests are retried up to `retries` times
+
+        Returns a tuple (input_file, error), error is None if successful
+    '''
+
+    try:
+        with open(input_file) as f:
+            text = f.read()
+    except OSError as e:
+        return input_file, repr(e)
+
+    for attempt in range(retries+1):
+        try:
+            output = annotate_text(url, text, annotators, timeout)
+            json.loads(output.decode('utf-8'), strict=False)
+            break
+        except Exception as e:
+            error = repr(e)
+            if attempt < retries:
+                time.sleep(retry_wait * 2**attempt)
+    else:
+        return input_file, error
+
+    # write to a temporary file first, so that a file only ever has complete
+    # output (and restarted runs don't skip partially written files)
+    output_path = get_output_path(input_file, output_dir)
+    with open(output_path+'.part', 'wb') as f:
+        f.write(output)
+    os.replace(output_path+'.part', output_path)
+
+    return input_file, None
+
+def annotate_files(input_files, output_dir, server_urls, concurrency=None,
+                   annotators=DEFAULT_ANNOTATORS, timeout=60, retries=2,
+                   retry_wait=1, skip_existing=True, quiet=False):
+
+    ''' Annotates input_files (an iterable of plaintext file paths) with the
+        CoreNLP servers at server_urls, saving JSON output to output_dir
+
+        Requests are sent to servers in turn, with no more than `concurrency`
+        requests in flight (default 4 per server), and input_files is only
+        read as fast as documents are annotated (failed requests are retried,
+        see annotate_file())
+
+        Returns a Counter with the number of 'annotated', 'skipped' and
+        'failed' files
+    '''
+
+    if concurrency is None:
+        concurrency = 4*len(server_urls)
+
+    ensure_path_exists(output_dir)
+    urls = cycle(server_urls)
+    stats = Counter()
+    pbar = tqdm(unit='files', disable=quiet)
+
+    def record(future):
+        input_file, error = future.result()
+        if error:
+            stats['failed'] += 1
+            logging.error('CoreNLP failed for {}: {}'.format(input_file, error))
+        else:
+            stats['annotated'] += 1
+        pbar.update()
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        in_flight = set()
+        for input_file in input_files:
+            if skip_existing and os.path.isfile(get_output_path(input_file, output_dir)):
+                stats['skipped'] += 1
+                pbar.update()
+                continue
+
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(future)
+
+            in_flight.add(executor.submit(annotate_file, input_file, output_dir, next(urls),
+                                          annotators, timeout, retries, retry_wait))
+
+        for future in wait(in_flight).done:
+            record(future)
+
+    pbar.close()
+    return stats
+
+def iter_input_files(args):
+
+    ''' Yields input file paths from args.filelist (one path per line) or
+        args.input_directory
+    '''
+
+    if args.filelist:
+        with open(args.filelist) as f:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+    else:
+        for entry in sorted(os.scandir(args.input_directory), key=lambda entry: entry.name):
+            if entry.is_file():
+                yield entry.path
+
+def main(args):
+
+    if args.filelist:
+        file_exists_or_exit(args.filelist)
+    else:
+        file_exists_or_exit(args.input_directory)
+
+    servers = []
+    if args.server_url:
+        server_urls = args.server_url
+    else:
+        file_exists_or_exit(args.corenlp)
+        servers = [CoreNLPServer(args.corenlp,
+                                 port=args.port+i if args.port else get_free_port(),
+                                 threads=args.threads,
+                                 memory=args.memory,
+                                 annotators=args.annotators,
+                                 timeout=args.timeout)
+                   for i in range(args.servers)]
+        server_urls = [server.url for server in servers]
+
+    try:
+        # start all servers before waiting, so that they load models in parallel
+        for server in servers:
+            server.start()
+        for server in servers:
+            server.wait_until_ready()
+        print('Using CoreNLP server(s) at {}'.format(', '.join(server_urls)))
+
+        start = time.perf_counter()
+        stats = annotate_files(iter_input_files(args),
+                               args.output_directory,
+                               server_urls,
+                               concurrency=args.concurrency or args.threads*len(server_urls),
+                               annotators=args.annotators,
+                               timeout=args.timeout,
+                               quiet=args.notqdm)
+        elapsed = time.perf_counter() - start
+    finally:
+        for server in servers:
+            server.stop()
+
+    print('{} files annotated, {} skipped, {} failed in {:.1f}s ({:.2f} files/s)'.format(stats['annotated'],
+                                                                                       stats['skipped'],
+                                                                                       stats['failed'],
+                                                                                       elapsed,
+                                                                                       stats['annotated']/max(elapsed, 1e-9)))
+    if stats['failed']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Annotate plaintext files with CoreNLP servers, saving JSON output')
+    parser.add_argument('output_directory', help='Output directory for CoreNLP JSON files')
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument('--input_directory', help='Directory of plaintext input files')
+    input_group.add_argument('--filelist', help='File with one input file path per line')
+    parser.add_argument('--corenlp', help='CoreNLP installation directory (containing the CoreNLP jars)',
+                        default=os.getcwd())
+    parser.add_argument('--server_url', action='append',
+                        help='Use an already running CoreNLP server instead of starting servers '
+                             '(can be given more than once)')
+    parser.add_argument('--servers', type=int, default=1,
+                        help='Number of CoreNLP servers to start (default 1)')
+    parser.add_argument('--port', type=int, default=9000,
+                        help='Port of the first CoreNLP server started, or 0 to use any free ports '
+                             '(e.g. when other jobs share the node) (default 9000)')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='Annotation threads per server (default 4)')
+    parser.add_argument('--memory', default='4g',
+                        help='Java heap size per server (default 4g)')
+    parser.add_argument('--concurrency', type=int,
+                        help='Maximum number of requests in flight (default: threads x servers)')
+    parser.add_argument('--annotators', default=DEFAULT_ANNOTATORS,
+                        help='CoreNLP annotators (default {})'.format(DEFAULT_ANNOTATORS))
+    parser.add_argument('--timeout', type=int, default=60,
+                        help='Per-document annotation timeout in seconds (default 60)')
+    parser.add_argument('--notqdm', help='Disable tqdm progress bar output',
+                        action='store_true')
+    args = parser.parse_args()
+    main(args)
@@ -1,26 +1,137 @@
 #!/usr/bin/env python3
 ''' create_medline_subset.py
 
-    for creating a subset of medline based on a list of PMIDs read in from a 
-    plain text file (one PMID per line)
+    for creating a subset of medline based on a list of PMIDs read in from a
+    plain text file (one PMID per line), or a PMID set file built from one
+    with preprocess.pmid_set
+
+    files are copied with a pool of threads, or with --link, hard linked (or
+    reflinked) where possible, so the subset takes no extra storage
+
+    with --archive, the subset is written to a single archive instead (a tar
+    archive, or a parform pack file, see preprocess.reformat.pack_parform_files)
 '''
 
 import argparse
+import fcntl
+import os
 import shutil
-from pathlib import Path
+import tarfile
+from collections import Counter
+from concurrent.futures import (FIRST_COMPLETED,
+                                ThreadPoolExecutor,
+                                wait)
 from tqdm import tqdm
 
+from preprocess.pmid_set import PMIDSet
+from preprocess.reformat import pack_parform_files
 from preprocess.util import (ensure_path_exists,
-                             file_exists_or_exit)
+                             file_exists_or_exit,
+                             scandir_files)
+
+# Linux ioctl that shares the source file's data blocks with the destination
+# (copy-on-write, on filesystems such as Btrfs and XFS)
+FICLONE = 0x40049409
+
+ARCHIVE_EXTENSIONS = {'tar': '.tar', 'tgz': '.tar.gz', 'pack': '.pack'}
 
 def get_pmid_set(args):
 
-    ''' Return a set of PMIDs from args.pmid_file
-        (items are strings, not ints)
+    ''' Return a PMIDSet of PMIDs from args.pmid_file (membership can be
+        tested with strings, e.g. file names)
+    '''
+
+    return PMIDSet(args.pmid_file)
+
+def reflink_file(source_path, new_file_path):
+
+    ''' Creates new_file_path as a copy-on-write clone of source_path
+
+        Raises OSError if the filesystem can't (or the files are on
+        different filesystems)
+    '''
+
+    with open(source_path, 'rb') as source, open(new_file_path, 'wb') as new_file:
+        fcntl.ioctl(new_file.fileno(), FICLONE, source.fileno())
+
+LINK_FUNCTIONS = {'hard': os.link,
+                  'reflink': reflink_file}
+
+def link_or_copy_file(source_path, new_file_path, link=None):
+
+    ''' Links source_path to new_file_path (link: 'hard' or 'reflink'),
+        falling back to a copy if it can't be linked (e.g. across
+        filesystems), or just copies it if link is None
+
+        Returns 'linked' or 'copied'
+    '''
+
+    if link:
+        if os.path.lexists(new_file_path):
+            os.remove(new_file_path)
+        try:
+            LINK_FUNCTIONS[link](source_path, new_file_path)
+            return 'linked'
+        except OSError:
+            pass
+
+    shutil.copyfile(source_path, new_file_path)
+    return 'copied'
+
+def get_subset_paths(source_paths, output_directory):
+
+    ''' Yields (source path, new file path) tuples for source_paths, saved in
+        subdirectories of output_directory of 1000 files each
     '''
 
-    with open(args.pmid_file) as f:
-        return set(line.rstrip('\n') for line in f.readlines())
+    for found_count, source_path in enumerate(source_paths):
+        if found_count % 1000 == 0:
+            current_subdir = os.path.join(output_directory, '{0:0>4}'.format(found_count))
+            ensure_path_exists(current_subdir)
+        yield source_path, os.path.join(current_subdir, os.path.basename(source_path))
+
+def create_subset_directory(source_paths, output_directory, link=None, threads=8):
+
+    ''' Copies (or links, see link_or_copy_file()) source_paths to
+        output_directory with a pool of threads (no more than a few files per
+        thread are queued at once, so source_paths can be a generator)
+
+        Returns a Counter of the number of files 'linked' and 'copied'
+    '''
+
+    counts = Counter()
+    with ThreadPoolExecutor(threads) as pool:
+        in_flight = set()
+        for source_path, new_file_path in get_subset_paths(source_paths, output_directory):
+            if len(in_flight) >= threads*4:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                counts.update(future.result() for future in done)
+            in_flight.add(pool.submit(link_or_copy_file, source_path, new_file_path, link))
+
+        counts.update(future.result() for future in wait(in_flight).done)
+
+    return counts
+
+def create_subset_archive(source_paths, archive_path, archive_format):
+
+    ''' Writes source_paths to a single archive at archive_path:
+        a parform pack file ('pack'), or a tar archive ('tar', or 'tgz' for
+        gzip compression) with the same layout as create_subset_directory()
+
+        Returns the number of files written
+    '''
+
+    if archive_format == 'pack':
+        return pack_parform_files(source_paths, archive_path)
+
+    count = 0
+    with tarfile.open(archive_path, 'w:gz' if archive_format == 'tgz' else 'w') as tar:
+        for count, source_path in enumerate(source_paths, 1):
+            arcname = os.path.join('{0:0>4}'.format((count-1)//1000*1000),
+                                   os.path.basename(source_path))
+            tar.add(source_path, arcname=arcname)
+
+    return count
 
 def main(args):
 
@@ -30,24 +141,40 @@ def main(args):
 
     pmids_of_interest = get_pmid_set(args)
     print('Reading input files...')
-    all_files = (f for f in Path(args.medline_paragraph_path).glob('**/*') if f.is_file())
+    source_paths = (entry.path
+                    for entry in tqdm(scandir_files(args.medline_paragraph_path), disable=args.notqdm)
+                    if entry.name in pmids_of_interest)
 
-    found_count = 0
-    for medline_file in tqdm(all_files):
-        if medline_file.name in pmids_of_interest:
-            if found_count % 1000 == 0:
-                current_subdir = '{0:0>4}'.format(found_count)
-                ensure_path_exists(str(Path(args.output_directory) / current_subdir))
-            found_count += 1
-            new_file_path = str(Path(args.output_directory) / current_subdir / medline_file.name)
-            shutil.copyfile(str(medline_file), new_file_path)
+    if args.archive:
+        archive_path = os.path.join(args.output_directory,
+                                    'subset'+ARCHIVE_EXTENSIONS[args.archive])
+        count = create_subset_archive(source_paths, archive_path, args.archive)
+        print('Saved {} files (by PMID) to archive {}'.format(count, archive_path))
+        return
 
-    print('Copied {} files (by PMID) to directory {}'.format(found_count, args.output_directory))
+    counts = create_subset_directory(source_paths,
+                                     args.output_directory,
+                                     link=args.link,
+                                     threads=args.threads)
+    print('Copied {} and linked {} files (by PMID) to directory {}'.format(counts['copied'],
+                                                                          counts['linked'],
+                                                                          args.output_directory))
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Creates a subset of MEDLINE based on a list of PMIDs')
-    parser.add_argument('pmid_file', help='File of PMIDs to match')
+    parser.add_argument('pmid_file', help='File of PMIDs to match (or a PMID set file, see preprocess.pmid_set)')
     parser.add_argument('medline_paragraph_path', help='Directory of parsed MEDLINE paragraph files')
     parser.add_argument('output_directory', help='Final output directory')
+    parser.add_argument('--link', choices=sorted(LINK_FUNCTIONS),
+                        help='Hard link (or reflink, on filesystems that support it) files into the subset '
+                             'instead of copying them, where possible (hard linked files share their contents '
+                             'with the original files)')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='Number of threads copying (or linking) files (default 8)')
+    parser.add_argument('--archive', choices=sorted(ARCHIVE_EXTENSIONS),
+                        help='Write the subset to a single archive in output_directory instead '
+                             '(subset.tar, subset.tar.gz or a parform pack file subset.pack)')
+    parser.add_argument('--notqdm', help='Disable tqdm progress bar output',
+                        action='store_true')
     args = parser.parse_args()
-    main(args)
\ No newline at end of file
+    main(args)
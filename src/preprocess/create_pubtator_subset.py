@@ -9,18 +9,23 @@
 
     creates another directory with only the abstracts saved in parsed/paragraph
     format for use with other bioshovel.preprocess modules
+
+    also reads a directory of the bioconcepts file split by PMID (see
+    preprocess.split_pubtator) in place of the bioconcepts file, and then only
+    reads the split files that cover the PMIDs in the input file
 '''
 
 import argparse
 import os
 import sys
+from bisect import bisect_right
 from pathlib import Path
 from tqdm import tqdm
 
+from preprocess.pmid_set import PMIDSet
 from preprocess.reformat import (pubtator_to_parform,)
 from preprocess.util import (ensure_path_exists,
                              file_exists_or_exit,
-                             get_file_lines_set,
                              save_file)
 
 def produce_records(bioconcepts_file_path):
@@ -35,17 +40,48 @@ def produce_records(bioconcepts_file_path):
             stripped = line.rstrip('\n')
             if stripped:
                 record_chunk.append(stripped)
-            else:
+            elif record_chunk:
                 yield record_chunk
                 record_chunk = []
+        if record_chunk:
+            yield record_chunk
+
+def get_split_files(split_directory, pmids):
+
+    ''' Returns the sorted paths of the files in split_directory (see
+        preprocess.split_pubtator) that hold the records of pmids (a sorted
+        iterable of int PMIDs, like a PMIDSet)
+    '''
+
+    names = sorted((name for name in os.listdir(split_directory) if name.isdigit()), key=int)
+    starts = [int(name) for name in names]
+    file_nums = []
+    for pmid in pmids:
+        file_num = bisect_right(starts, pmid) - 1
+        if file_num >= 0 and (not file_nums or file_nums[-1] != file_num):
+            file_nums.append(file_num)
+
+    return [os.path.join(split_directory, names[file_num]) for file_num in file_nums]
+
+def produce_split_records(split_directory, pmids):
+
+    ''' Like produce_records(), for the records of the files in
+        split_directory that cover pmids (see get_split_files())
+    '''
+
+    for split_file in get_split_files(split_directory, pmids):
+        yield from produce_records(split_file)
 
 def main(args):
 
     file_exists_or_exit(args.pmid_file)
     file_exists_or_exit(args.bioconcepts_file)
-    pmids_set = get_file_lines_set(args.pmid_file)
+    pmids_set = PMIDSet(args.pmid_file)
 
-    records = produce_records(args.bioconcepts_file)
+    if os.path.isdir(args.bioconcepts_file):
+        records = produce_split_records(args.bioconcepts_file, pmids_set)
+    else:
+        records = produce_records(args.bioconcepts_file)
     print('Found {} distinct PMIDs in file {}'.format(len(pmids_set),
                                                       args.bioconcepts_file))
 
@@ -85,8 +121,9 @@ def main(args):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Creates a subset of the PubTator offsets download based on a list of PMIDs from an input file')
-    parser.add_argument('pmid_file', help='File of PMIDs to match')
-    parser.add_argument('bioconcepts_file', help='PubTator bioconcepts2pubtator_offsets download file')
+    parser.add_argument('pmid_file', help='File of PMIDs to match (or a PMID set file, see preprocess.pmid_set)')
+    parser.add_argument('bioconcepts_file', help='PubTator bioconcepts2pubtator_offsets download file '
+                                                 '(or a directory of it split by PMID, see preprocess.split_pubtator)')
     parser.add_argument('output_directory', help='Final output directory')
     parser.add_argument('-c', help='Count # PMIDs matching and exit', action='store_true')
     args = parser.parse_args()
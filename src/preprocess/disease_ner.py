@@ -28,14 +28,16 @@ from itertools import repeat
 import multiprocessing as mp
 from tqdm import tqdm
 
-from preprocess.util import (save_file,
+from preprocess.util import (save_file_bytes,
                              calc_dnorm_num_processes,
                              create_n_sublists,
                              logging_thread,
                              file_exists_or_exit,
-                             reorganize_directory)
-from preprocess.reformat import (parse_parform_file,
-                                 parform_to_pubtator)
+                             reorganize_directory,
+                             add_corpus_arguments,
+                             iter_input_files,
+                             parse_shards)
+from preprocess.reformat import parform_file_to_pubtator
 
 def process_and_run_chunk(filepaths_args_tuple):
 
@@ -52,15 +54,12 @@ def process_and_run_chunk(filepaths_args_tuple):
     qh = logging.handlers.QueueHandler(q)
     l = logging.getLogger()
 
-    parsed_files = [parse_parform_file(file_path)
-                    for file_path in list_of_file_paths]
+    reformatted_files = [parform_file_to_pubtator(file_path)
+                         for file_path in list_of_file_paths]
 
-    # filter out files with no title line 
-    # (for which parse_parform_file returned None)
-    parsed_files = [f for f in parsed_files if f]
-
-    reformatted_files = [parform_to_pubtator(escaped_doi, title_line, body)
-                         for escaped_doi, title_line, body in parsed_files]
+    # filter out files with no title line
+    # (for which parform_file_to_pubtator returned None)
+    reformatted_files = [f for f in reformatted_files if f]
 
     reqs = {'banner_ncbidisease': os.path.join(args.dnorm,
                                                'config', 
@@ -79,7 +78,7 @@ def process_and_run_chunk(filepaths_args_tuple):
 
     with tempfile.TemporaryDirectory() as input_tempdir, tempfile.TemporaryDirectory() as output_tempdir, tempfile.TemporaryDirectory() as dnorm_tempdir:
         for doi_filename, file_info in reformatted_files:
-            save_file(doi_filename, file_info, input_tempdir)
+            save_file_bytes(doi_filename, file_info, input_tempdir)
 
             try:
                 out = subprocess.check_output(['bash',
@@ -112,7 +111,9 @@ def main(args):
     
     file_exists_or_exit(os.path.join(args.dnorm, 'ApplyDNorm.sh'))
 
-    all_files = glob(os.path.join(args.paragraph_path, '*'))
+    all_files = list(iter_input_files(args.paragraph_path,
+                                       shards=parse_shards(args.shards),
+                                       listing_file=args.file_listing))
     filelist_with_sublists = create_n_sublists(all_files, mp.cpu_count()*10)
 
     # check if save_directory exists and create if necessary
@@ -166,7 +167,7 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Run DNorm on a directory of paragraph files')
     parser.add_argument('paragraph_path',
-                        help='Directory of parsed paragraph files')
+                        help='Directory of parsed paragraph files (or a file listing their paths, one per line)')
     parser.add_argument('output_directory',
                         help='Final output directory')
     parser.add_argument('--dnorm',
@@ -181,5 +182,6 @@ if __name__ == '__main__':
                         default=mp.cpu_count())
     parser.add_argument('--notqdm', help='Disable tqdm progress bar output',
                         action='store_true')
+    add_corpus_arguments(parser)
     args = parser.parse_args()
     main(args)
\ No newline at end of file
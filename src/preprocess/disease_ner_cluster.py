@@ -16,7 +16,8 @@ from preprocess.util import (calc_dnorm_num_processes,
                              create_sublists_sized_n,
                              create_sublist_symlinks,
                              ensure_path_exists,
-                             file_exists_or_exit)
+                             file_exists_or_exit,
+                             write_file_list)
 
 from preprocess.cluster.util import submit_pbs_job
 
@@ -133,8 +134,13 @@ def main(args):
     for sublist_num, sublist in enumerate(filelist_with_sublists):
         sublist_dir = os.path.join(base_input_directory, 
                                    'sublist_{0:0>4}'.format(sublist_num))
-        ensure_path_exists(sublist_dir)
-        create_sublist_symlinks(sublist, sublist_dir, 1000)
+        if args.file_lists:
+            # disease_ner reads the file list in place of a directory
+            sublist_dir += '.txt'
+            write_file_list(sublist, sublist_dir)
+        else:
+            ensure_path_exists(sublist_dir)
+            create_sublist_symlinks(sublist, sublist_dir, 1000)
         job_file_path = create_job_file(job_dir, sublist_dir, output_directory, sublist_num, args)
         if args.submit:
             result = submit_pbs_job(job_file_path, queue=args.queue)
@@ -168,6 +174,10 @@ if __name__ == '__main__':
     parser.add_argument('--submit',
                         help='Submit jobs after creating job files',
                         action='store_true')
+    parser.add_argument('--file_lists',
+                        help='Write a list of input file paths for each chunk (input_files/sublist_NNNN.txt) '
+                             'instead of a directory of symlinks',
+                        action='store_true')
     parser.add_argument('--nfiles',
                         help='Number of files per PBS job',
                         type=int,
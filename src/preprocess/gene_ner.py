@@ -26,12 +26,14 @@ from itertools import repeat
 import multiprocessing as mp
 from tqdm import tqdm
 
-from preprocess.util import (save_file,
+from preprocess.util import (save_file_bytes,
                              create_n_sublists,
                              logging_thread,
-                             file_exists_or_exit)
-from preprocess.reformat import (parse_parform_file, 
-                                 parform_to_pubtator)
+                             file_exists_or_exit,
+                             add_corpus_arguments,
+                             iter_input_files,
+                             parse_shards)
+from preprocess.reformat import parform_file_to_pubtator
 
 def process_and_run_chunk(filepaths_args_tuple):
 
@@ -48,19 +50,16 @@ def process_and_run_chunk(filepaths_args_tuple):
     qh = logging.handlers.QueueHandler(q)
     l = logging.getLogger()
 
-    parsed_files = [parse_parform_file(file_path)
-                    for file_path in list_of_file_paths]
+    reformatted_files = [parform_file_to_pubtator(file_path)
+                         for file_path in list_of_file_paths]
 
-    # filter out files with no title line 
-    # (for which parse_parform_file returned None)
-    parsed_files = [f for f in parsed_files if f]
-
-    reformatted_files = [parform_to_pubtator(escaped_doi, title_line, body)
-                         for escaped_doi, title_line, body in parsed_files]
+    # filter out files with no title line
+    # (for which parform_file_to_pubtator returned None)
+    reformatted_files = [f for f in reformatted_files if f]
 
     with tempfile.TemporaryDirectory() as input_tempdir, tempfile.TemporaryDirectory() as output_tempdir:
         for doi_filename, file_info in reformatted_files:
-            save_file(doi_filename, file_info, input_tempdir)
+            save_file_bytes(doi_filename, file_info, input_tempdir)
 
         try:
             out = subprocess.check_output(['perl', 
@@ -89,7 +88,9 @@ def main(args):
     
     file_exists_or_exit(os.path.join(args.gnormplus, 'GNormPlus.pl'))
 
-    all_files = glob(os.path.join(args.paragraph_path, '*'))
+    all_files = list(iter_input_files(args.paragraph_path,
+                                       shards=parse_shards(args.shards),
+                                       listing_file=args.file_listing))
     filelist_with_sublists = create_n_sublists(all_files, mp.cpu_count()*10)
 
     # check if save_directory exists and create if necessary
@@ -127,9 +128,10 @@ def main(args):
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Run GNormPlus on a directory of paragraph files')
-    parser.add_argument('paragraph_path', help='Directory of parsed paragraph files')
+    parser.add_argument('paragraph_path', help='Directory of parsed paragraph files (or a file listing their paths, one per line)')
     parser.add_argument('output_directory', help='Final output directory')
     parser.add_argument('--gnormplus', help='Directory (absolute path) where GNormPlus.pl is located', default=os.getcwd())
     parser.add_argument('--logdir', help='Directory where logfile should be stored', default='../logs')
+    add_corpus_arguments(parser)
     args = parser.parse_args()
     main(args)
\ No newline at end of file
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+# parse_elife_lxml.py
+#
+# lxml/XPath versions of the preprocess.parse_elife_xml extractors
+#
+# Functions take an lxml element tree (from read_file() below) instead of a
+# BeautifulSoup object and return exactly the same output as their
+# parse_elife_xml counterparts. Articles are parsed with the same libxml2 HTML
+# parser that BeautifulSoup(..., 'lxml') uses, so both see the same tree, but
+# elements are only read (never unwrapped or decomposed), and each paragraph's
+# text is collected in a single pass
+
+# usage:
+# from preprocess import parse_elife_lxml
+# tree = parse_elife_lxml.read_file(file_path)
+# doi = parse_elife_lxml.get_doi(tree)
+
+import logging
+import re
+from lxml import etree
+from unidecode import unidecode
+
+from preprocess.parse_elife_xml import (clean,
+                                        remove_doi_lines)
+
+# tags removed (including their text) by get_main_article(keep_references=False)
+REFERENCE_TAGS = frozenset(('xref', 'fig-group', 'caption', 'table-wrap'))
+
+# (), (;), (,-), etc. left behind by removing reference tags
+REFERENCE_DEBRIS_REGEX = re.compile(r'(\s+\([;|,|-]*\))')
+
+NON_ASCII_REGEX = re.compile(r'[^\x00-\x7f]+')
+
+def read_file(file_path):
+
+    ''' Reads in data from an XML file at file_path and returns the root
+        element of its lxml tree
+
+        Converts any Unicode to ASCII and replaces <body> tags with
+        <bodyreplaced>, like parse_elife_xml.read_file()
+    '''
+
+    with open(file_path) as f:
+        return parse_string(f.read())
+
+def parse_string(xml_data):
+
+    ''' Same as read_file(), for XML data that has already been read
+        into a string
+    '''
+
+    # unidecode transliterates character by character, so only passing it
+    # the (rare) non-ASCII runs gives the same result much faster
+    xml_data = NON_ASCII_REGEX.sub(lambda match: unidecode(match.group()), xml_data)
+
+    replacements = (('<body>',  '<bodyreplaced>'),
+                    ('</body>', '</bodyreplaced>'),
+                   )
+
+    for orig, new in replacements:
+        xml_data = xml_data.replace(orig, new)
+
+    parser = etree.HTMLParser(encoding='utf-8')
+    return etree.fromstring(xml_data.encode('utf-8'), parser)
+
+def find_first(tree, xpath):
+
+    ''' Returns the first element matching xpath (or None)
+    '''
+
+    matches = tree.xpath(xpath)
+    return matches[0] if matches else None
+
+def iter_text(element, skip_tags=frozenset()):
+
+    ''' Yields the text nodes in element (in document order), leaving out
+        comments and any element whose tag is in skip_tags (but not the
+        text that follows it)
+    '''
+
+    if element.text:
+        yield element.text
+    for child in element:
+        # comments and processing instructions don't have string tags
+        if isinstance(child.tag, str) and child.tag not in skip_tags:
+            yield from iter_text(child, skip_tags)
+        if child.tail:
+            yield child.tail
+
+def get_text(element):
+
+    ''' Same as BeautifulSoup's tag.get_text()
+    '''
+
+    return ''.join(iter_text(element))
+
+def get_doi(tree, escape_slash=True):
+
+    ''' Given an lxml tree for an eLife XML article, return the
+        article's DOI (escape the forward slash if necessary)
+    '''
+
+    doi_tag = find_first(tree, '//article-id[@pub-id-type="doi"]')
+    if doi_tag is None:
+        return ''
+
+    cleaned_doi = clean(doi_tag.text or '').lower()
+
+    if escape_slash:
+        return cleaned_doi.replace('/', '%2F')
+    else:
+        return cleaned_doi
+
+def get_title(tree):
+
+    ''' Given an lxml tree for an eLife XML article, return the
+        article's title (return None if no title available)
+    '''
+
+    title_tag = find_first(tree, '//article-title')
+    if title_tag is None:
+        logging.warning('No title for article {}'.format(get_doi(tree,
+                                                         escape_slash=False)))
+        return None
+
+    # compress multiple spaces left by style tags:
+    return ' '.join(clean(get_text(title_tag)).split())
+
+def get_abstract(tree):
+
+    ''' Given an lxml tree for an eLife XML article, return the
+        article's abstract (return None if no abstract available)
+    '''
+
+    abs_tag = find_first(tree, '(//abstract)[1]//p')
+    if abs_tag is None:
+        logging.warning('No abstract for article {}'.format(
+            get_doi(tree, escape_slash=False)))
+        return None
+
+    # compress multiple spaces left by style tags:
+    return ' '.join(clean(get_text(abs_tag)).split())
+
+def get_exec_summary(tree):
+
+    ''' Given an lxml tree for an eLife XML article, return the
+        article's executive summary as a list (return None if none available)
+    '''
+
+    exec_summary = find_first(tree, '//abstract[@abstract-type="executive-summary"]')
+    if exec_summary is None:
+        logging.warning('No executive summary for article {}'.format(
+            get_doi(tree, escape_slash=False)))
+        return None
+
+    paragraphs = (get_text(p) for p in exec_summary.iterdescendants('p'))
+    return remove_doi_lines([clean(p) for p in paragraphs if p])
+
+def is_inside_removed_reference(p, section):
+
+    ''' True if paragraph p is inside a reference tag (see REFERENCE_TAGS)
+        which is itself inside another paragraph of section
+
+        (parse_elife_xml.get_main_article() empties such paragraphs when it
+         decomposes the reference tags of the enclosing paragraph)
+    '''
+
+    found_reference_tag = False
+    for ancestor in p.iterancestors():
+        if ancestor is section:
+            return False
+        if ancestor.tag in REFERENCE_TAGS:
+            found_reference_tag = True
+        elif ancestor.tag == 'p' and found_reference_tag:
+            return True
+
+    return False
+
+def get_main_article(tree, keep_references=True):
+
+    ''' Given an lxml tree for an eLife XML article, return the
+        article's main text as a list of paragraphs
+
+        keep_references is a flag that can be set to False to remove article and
+        figure references from the output paragraphs
+    '''
+
+    main_article = tree.xpath('//bodyreplaced')[0]
+    sections = main_article.xpath('sec')
+
+    if sections:
+        # normal article
+        section_paragraphs = [(section, section.iterdescendants('p'))
+                              for section in sections]
+    else:
+        # not a normal article. probably a correction-type brief "article"
+        section_paragraphs = [(main_article, main_article.xpath('p'))]
+
+    if keep_references:
+        cleaned_paragraphs = [clean(''.join(s.strip() for s in iter_text(p)))
+                              for _, paragraphs in section_paragraphs
+                              for p in paragraphs]
+        cleaned_paragraphs = remove_doi_lines(cleaned_paragraphs)
+        if not cleaned_paragraphs:
+            logging.critical('No main text paragraphs for {}'.format(get_doi(tree)))
+        return cleaned_paragraphs
+
+    cleaned_paragraphs = []
+    for section, paragraphs in section_paragraphs:
+        for p in paragraphs:
+            if is_inside_removed_reference(p, section):
+                continue
+            text = ''.join(s.strip() for s in iter_text(p, REFERENCE_TAGS))
+            cleaned_paragraphs.append(clean(text))
+
+    cleaned_paragraphs = remove_doi_lines(cleaned_paragraphs)
+    cleaned_paragraphs = [REFERENCE_DEBRIS_REGEX.sub('', p) for p in cleaned_paragraphs]
+
+    # remove empty "paragraphs"
+    cleaned_paragraphs = [p for p in cleaned_paragraphs if p.strip()]
+
+    if not cleaned_paragraphs:
+        logging.critical('No main text paragraphs for {}'.format(get_doi(tree)))
+
+    return cleaned_paragraphs
@@ -13,6 +13,10 @@
 # Files are saved with filename [extracted_DOI]
 # with one paragraph per line, including abstract and
 # executive summary, if available
+#
+# (files are saved in numbered subdirectories of ../../data/elife/paragraphs
+#  by preprocess.parse_jats_xml, which also writes a per-article report to
+#  ../../data/elife/paragraphs_report.tsv)
 
 # Sandip Chatterjee
 
@@ -21,9 +25,7 @@ import os
 import re
 import sys
 from bs4 import BeautifulSoup
-from glob import glob
 from itertools import chain
-from tqdm import tqdm
 from unidecode import unidecode
 
 def read_file(file_path):
@@ -259,50 +261,21 @@ def save_file(output_file_lines, save_file_path):
 
 def main():
 
-    xml_directory = sys.argv[1]
-    save_directory = os.path.join(xml_directory, '../paragraphs')
-
-    # check if save_directory exists and create if necessary
-    if not os.path.isdir(save_directory):
-        os.makedirs(save_directory)
-
-    xml_files = glob(os.path.join(xml_directory, '*.xml'))
-
-    for file_path in tqdm(xml_files):
-
-        output_file_lines = []
-
-        soup = read_file(file_path)
-        
-        escaped_doi = get_doi(soup)
-        if not escaped_doi:
-            logging.critical('No DOI found in {}'.format(file_path))
-            continue
-        logging.warning('Processing {}'.format(escaped_doi))
-        
-        title = get_title(soup)
-        if not title:
-            logging.critical('No title for {}'.format(file_path))
-        else:
-            output_file_lines.append(('title', title))
-        
-        abstract = get_abstract(soup)
-        if abstract:
-            output_file_lines.append(('abs', abstract))
-
-        exec_summary = get_exec_summary(soup)
-        if exec_summary:
-            for paragraph in exec_summary:
-                output_file_lines.append(('p', paragraph))
+    ''' Converts all eLife articles in the XML directory with
+        preprocess.parse_jats_xml (using the lxml versions of the functions
+        above, see preprocess.parse_elife_lxml)
+    '''
 
-        article_paragraphs = get_main_article(soup, keep_references=False)
+    # (imported here because parse_jats_xml imports this module)
+    from preprocess.parse_jats_xml import convert_articles
 
-        for paragraph in article_paragraphs:
-            output_file_lines.append(('p', paragraph))
+    xml_directory = sys.argv[1]
+    save_directory = os.path.join(xml_directory, '../paragraphs')
 
-        save_file(output_file_lines, os.path.join(save_directory, escaped_doi))
+    stats = convert_articles(xml_directory, save_directory, article_format='elife')
 
-    logging.warning('All finished')
+    logging.warning('All finished: {} articles converted, {} failed'.format(stats['converted'],
+                                                                           stats['failed']))
 
 if __name__ == '__main__':
     assert len(sys.argv) == 2, 'Need an XML directory'
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+'''parse_jats_xml.py
+
+Converts JATS XML articles (eLife .xml, PubMed Central .nxml, ...) to parform
+files using a process pool
+
+Input is either a directory tree or a (optionally compressed) tar archive of
+articles, such as a PMC bulk download. Output files are named by escaped DOI
+and saved in subdirectories of no more than --files_per_shard files:
+
+    [output_directory]/0000/[doi]
+    [output_directory]/0001/[doi]
+    ...
+
+A tab-delimited report of each article's output file, conversion time and
+error (if any) is saved next to the output directory, to
+[output_directory]_report.tsv
+
+usage:
+cd bioshovel/src # this is the parent directory of this script file
+python3 -m preprocess.parse_jats_xml [input_directory_or_archive] [output_directory] --format [elife|pmc]
+
+Run `python3 -m preprocess.parse_jats_xml -h` for options
+'''
+
+import argparse
+import multiprocessing as mp
+import os
+import tarfile
+import time
+from collections import Counter
+from itertools import islice
+from tqdm import tqdm
+
+from preprocess import parse_elife_lxml
+from preprocess.util import (ensure_path_exists,
+                             file_exists_or_exit,
+                             save_file)
+
+# number of articles read ahead per pool worker (archive contents are passed
+# to workers in memory, so this bounds memory use)
+BATCH_SIZE_PER_WORKER = 64
+
+def get_elife_lines(tree):
+
+    ''' Return (file_name, parform lines) for an eLife article, with the same
+        lines as parse_elife_xml has always produced: title, abstract,
+        executive summary paragraphs and main text paragraphs
+        (file_name is None if the article has no DOI)
+    '''
+
+    escaped_doi = parse_elife_lxml.get_doi(tree)
+    if not escaped_doi:
+        return None, []
+
+    output_file_lines = []
+
+    title = parse_elife_lxml.get_title(tree)
+    if title:
+        output_file_lines.append(('title', title))
+
+    abstract = parse_elife_lxml.get_abstract(tree)
+    if abstract:
+        output_file_lines.append(('abs', abstract))
+
+    exec_summary = parse_elife_lxml.get_exec_summary(tree)
+    if exec_summary:
+        for paragraph in exec_summary:
+            output_file_lines.append(('p', paragraph))
+
+    for paragraph in parse_elife_lxml.get_main_article(tree, keep_references=False):
+        output_file_lines.append(('p', paragraph))
+
+    return escaped_doi, output_file_lines
+
+def get_pmc_lines(tree):
+
+    ''' Return (file_name, parform lines) for a PubMed Central article: title,
+        abstract (all paragraphs of the main abstract) and main text paragraphs
+
+        Articles are named by escaped DOI, or by PMC ID if they have no DOI
+        (file_name is None if the article has neither)
+    '''
+
+    file_name = parse_elife_lxml.get_doi(tree)
+    if not file_name:
+        pmcid = parse_elife_lxml.find_first(tree, '//article-id[@pub-id-type="pmc"]')
+        if pmcid is None or not pmcid.text:
+            return None, []
+        file_name = 'PMC' + parse_elife_lxml.clean(pmcid.text)
+
+    output_file_lines = []
+
+    title = parse_elife_lxml.get_title(tree)
+    if title:
+        output_file_lines.append(('title', title))
+
+    # skip graphical abstracts, author summaries, etc.
+    abstract = parse_elife_lxml.find_first(tree, '//abstract[not(@abstract-type)]')
+    if abstract is not None:
+        paragraphs = (parse_elife_lxml.get_text(p) for p in abstract.iterdescendants('p'))
+        abstract_text = ' '.join(' '.join(paragraphs).split())
+        if abstract_text:
+            output_file_lines.append(('abs', abstract_text))
+
+    if tree.xpath('//bodyreplaced'):
+        for paragraph in parse_elife_lxml.get_main_article(tree, keep_references=False):
+            output_file_lines.append(('p', paragraph))
+
+    return file_name, output_file_lines
+
+# {format name: (input file extensions, function returning (file_name, lines))}
+ARTICLE_FORMATS = {
+    'elife': (('.xml',), get_elife_lines),
+    'pmc': (('.nxml', '.xml'), get_pmc_lines),
+}
+
+def iter_directory_sources(input_dir, extensions):
+
+    ''' Yield (source_name, file_path) for each file in the input_dir tree
+        with one of the given extensions
+    '''
+
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for file_name in sorted(files):
+            if file_name.endswith(extensions):
+                file_path = os.path.join(root, file_name)
+                yield os.path.relpath(file_path, input_dir), file_path
+
+def iter_archive_sources(archive_path, extensions):
+
+    ''' Yield (source_name, file_contents) for each file in the tar archive at
+        archive_path with one of the given extensions
+
+        (the archive is read sequentially, so compressed archives are only
+         decompressed once)
+    '''
+
+    with tarfile.open(archive_path, 'r:*') as tar:
+        for member in tar:
+            if member.isfile() and member.name.endswith(extensions):
+                yield member.name, tar.extractfile(member).read()
+
+def convert_source(source_args_tuple):
+
+    ''' Worker pool function: convert one article to parform lines
+
+        Takes a tuple (article_format, source_name, source), where source is a
+        file path or the file's contents (bytes) and returns a tuple:
+
+        (source_name, file_name, file_lines, seconds, error)
+
+        file_lines include newlines, error is None if the conversion succeeded
+    '''
+
+    article_format, source_name, source = source_args_tuple
+    get_lines = ARTICLE_FORMATS[article_format][1]
+
+    start = time.perf_counter()
+    try:
+        if isinstance(source, bytes):
+            tree = parse_elife_lxml.parse_string(source.decode('utf-8'))
+        else:
+            tree = parse_elife_lxml.read_file(source)
+        file_name, lines = get_lines(tree)
+        error = None if file_name else 'no article ID'
+    except Exception as e:
+        file_name, lines, error = None, [], repr(e)
+
+    file_lines = ['\t'.join(line)+'\n' for line in lines]
+    return source_name, file_name, file_lines, time.perf_counter() - start, error
+
+def get_report_path(output_directory):
+
+    ''' Return the path of the conversion report for output_directory
+        (kept outside output_directory, which should only contain parform files)
+    '''
+
+    return os.path.abspath(output_directory).rstrip(os.sep)+'_report.tsv'
+
+def iter_batches(iterable, batch_size):
+
+    ''' Yield lists of up to batch_size items from iterable
+    '''
+
+    iterator = iter(iterable)
+    batch = list(islice(iterator, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, batch_size))
+
+def convert_articles(input_path, output_directory, article_format='elife',
+                     poolsize=mp.cpu_count(), files_per_shard=10000, quiet=False):
+
+    ''' Convert all articles in input_path (a directory or tar archive) to
+        parform files in sharded subdirectories of output_directory, writing a
+        per-article report to get_report_path(output_directory)
+
+        Returns a Counter with the number of 'converted' and 'failed' articles
+        and the total conversion 'seconds'
+    '''
+
+    extensions, _ = ARTICLE_FORMATS[article_format]
+    if os.path.isdir(input_path):
+        sources = iter_directory_sources(input_path, extensions)
+    else:
+        sources = iter_archive_sources(input_path, extensions)
+
+    ensure_path_exists(output_directory)
+    report_path = get_report_path(output_directory)
+
+    stats = Counter()
+    with mp.Pool(poolsize) as pool, open(report_path, 'w') as report:
+        report.write('\t'.join(('source', 'output_file', 'seconds', 'error'))+'\n')
+
+        # Pool.imap() reads its whole input ahead, so articles are handed to
+        # the pool in batches
+        source_args = ((article_format, name, source) for name, source in sources)
+        results = (result
+                   for batch in iter_batches(source_args, poolsize*BATCH_SIZE_PER_WORKER)
+                   for result in pool.imap(convert_source, batch, chunksize=16))
+
+        # only this process writes files, so output order (and sharding) is
+        # the same as the input order
+        for source_name, file_name, file_lines, seconds, error in tqdm(results, disable=quiet):
+            stats['seconds'] += seconds
+            if error:
+                stats['failed'] += 1
+                output_path = ''
+            else:
+                shard = os.path.join(output_directory,
+                                     '{0:0>4}'.format(stats['converted']//files_per_shard))
+                if stats['converted'] % files_per_shard == 0:
+                    ensure_path_exists(shard)
+                output_path = save_file(file_name, file_lines, shard)
+                stats['converted'] += 1
+
+            report.write('\t'.join((source_name, output_path,
+                                    '{:.4f}'.format(seconds), error or ''))+'\n')
+
+    return stats
+
+def main(args):
+
+    file_exists_or_exit(args.input_path)
+
+    start = time.perf_counter()
+    stats = convert_articles(args.input_path, args.output_directory,
+                             article_format=args.format,
+                             poolsize=args.poolsize,
+                             files_per_shard=args.files_per_shard,
+                             quiet=args.notqdm)
+    elapsed = time.perf_counter() - start
+
+    total = stats['converted'] + stats['failed']
+    print('{} of {} articles converted, {} failed (see {})'.format(stats['converted'],
+                                                                  total,
+                                                                  stats['failed'],
+                                                                  get_report_path(args.output_directory)))
+    if total:
+        print('{:.1f} ms/article in workers, {:.1f} articles/second overall'.format(1000*stats['seconds']/total,
+                                                                                   total/elapsed))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert JATS XML articles to parform files')
+    parser.add_argument('input_path', help='Directory tree or tar archive of XML articles')
+    parser.add_argument('output_directory', help='Output directory for parform files')
+    parser.add_argument('--format', help='Article format (default elife)',
+                        choices=sorted(ARTICLE_FORMATS), default='elife')
+    parser.add_argument('--poolsize',
+                        help='Size of multiprocessing process pool',
+                        type=int,
+                        default=mp.cpu_count())
+    parser.add_argument('--files_per_shard', help='Maximum number of files per output subdirectory (default 10000)',
+                        type=int, default=10000)
+    parser.add_argument('--notqdm', help='Disable tqdm progress bar output',
+                        action='store_true')
+    args = parser.parse_args()
+    main(args)
@@ -4,12 +4,20 @@ parse_medline_xml.py
 
 Parses article abstracts from MEDLINE XML files (can be gzipped)
 
+With --update, applies MEDLINE update files (new, revised and deleted
+citations) incrementally instead: update files newer than the last one applied
+are read in order, and only the abstracts they change are saved, to a new
+delta directory [output_directory]/updates/[last update file]/ with the same
+layout as a full run, plus a list of deleted citations (deleted.txt). The last
+update file applied is recorded in [output_directory]/last_update_file.
+
 Run `python3 -m preprocess.parse_medline_xml -h` for options
 '''
 
 import argparse
 import gzip
 import os
+import shutil
 from glob import glob
 from lxml import etree
 from tqdm import tqdm
@@ -17,6 +25,9 @@ from unidecode import unidecode
 from preprocess.util import (ensure_path_exists,
                              file_exists_or_exit,
                              save_file)
+from preprocess.pmid_doi_index import (PMIDDOIIndex,
+                                       is_index_file,
+                                       iter_pmid_doi_pairs)
 
 def get_root_object(filepath):
 
@@ -104,6 +115,10 @@ def create_filelines(title, abstract):
 def create_pmid_doi_mapping(args, escape_slash=True):
 
     ''' Returns a dictionary that maps PMIDs (strings) to DOIs (strings)
+
+        If args.doiindex is an index built with preprocess.pmid_doi_index,
+        returns a (dict-like) memory-mapped PMIDDOIIndex instead of reading
+        the whole PMC-ids.csv file
     '''
 
     pmid_doi_map = {}
@@ -111,17 +126,171 @@ def create_pmid_doi_mapping(args, escape_slash=True):
     if not args.doiindex:
         return pmid_doi_map
 
-    print('Reading PMC ID mapping file')
-    with open(args.doiindex) as f:
-        for line in tqdm(f):
-            line_split = line.split(',')
-            pmid_column = line_split[9]
-            doi_column = line_split[7]
-            if doi_column and pmid_column:
-                pmid_doi_map[pmid_column] = doi_column.replace('/','%2F')
+    if is_index_file(args.doiindex):
+        print('Using PMID -> DOI index {}'.format(args.doiindex))
+        return PMIDDOIIndex(args.doiindex, escape_slash=escape_slash)
+
+    print('Reading PMC ID mapping file (build an index with preprocess.pmid_doi_index '
+          'to skip this step)')
+    for pmid, doi in iter_pmid_doi_pairs(args.doiindex):
+        pmid_doi_map[pmid] = doi.replace('/', '%2F') if escape_slash else doi
 
     return pmid_doi_map
 
+LAST_UPDATE_FILE = 'last_update_file'
+
+def get_citation_filelines(citation):
+
+    ''' Given a MedlineCitation element, returns a tuple (pmid, file_lines),
+        where file_lines is None if the citation has no abstract or title
+    '''
+
+    has_pmid = citation.find('PMID')
+    pmid = has_pmid.text if has_pmid is not None else None
+
+    abstracts = get_element('AbstractText', citation)
+    if not abstracts:
+        return pmid, None
+
+    d = get_abstract_parent_info(abstracts[0])
+    if not d['title']:
+        return pmid, None
+
+    combined_abstract = combine_all_abstract_text_tags(d['parent_abstract'])
+    return pmid, create_filelines(d['title'], combined_abstract)
+
+def iter_update_records(root):
+
+    ''' Given the root of a MEDLINE update file, yields a tuple
+        (pmid, file_lines) for each citation, in file order, where file_lines
+        is None for deleted citations (DeleteCitation) and citations without
+        an abstract
+    '''
+
+    for element in root.iter('MedlineCitation', 'DeleteCitation'):
+        if element.tag == 'DeleteCitation':
+            for pmid in element.iter('PMID'):
+                yield pmid.text, None
+        else:
+            yield get_citation_filelines(element)
+
+def get_last_update_file(output_directory):
+
+    ''' Returns the name of the last update file applied to
+        output_directory, or None
+    '''
+
+    try:
+        with open(os.path.join(output_directory, LAST_UPDATE_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def set_last_update_file(output_directory, update_file_name):
+
+    # (replace the file, so it is never partially written)
+    path = os.path.join(output_directory, LAST_UPDATE_FILE)
+    with open(path+'.part', 'w') as f:
+        f.write(update_file_name+'\n')
+    os.replace(path+'.part', path)
+
+def get_new_update_files(xml_file_directory, last_update_file):
+
+    ''' Returns update file paths from xml_file_directory sorted by name
+        (MEDLINE update files are numbered in the order they are applied),
+        leaving out files up to and including last_update_file
+    '''
+
+    update_files = sorted(glob(os.path.join(xml_file_directory, '*')),
+                          key=os.path.basename)
+    if last_update_file:
+        update_files = [f for f in update_files
+                        if os.path.basename(f) > last_update_file]
+
+    return update_files
+
+def apply_update_files(update_files, delta_directory, pmid_doi_map):
+
+    ''' Applies update_files (MEDLINE update files, in order) and saves the
+        changed abstracts to delta_directory, in numbered subdirectories like
+        main() (so a citation revised in several update files is only saved
+        once, as of its last revision)
+
+        Citations that are deleted, or revised to have no abstract, are
+        listed in [delta_directory]/deleted.txt (by file name: PMID, or
+        escaped DOI if in pmid_doi_map)
+
+        Returns a tuple (number of files saved, number of files deleted)
+    '''
+
+    saved_paths = {}
+    deleted = set()
+    num_saved = 0
+
+    for update_file in tqdm(update_files):
+        root = get_root_object(update_file)
+        for pmid, file_lines in iter_update_records(root):
+            if not pmid:
+                continue
+
+            file_name = pmid_doi_map.get(pmid, pmid)
+            if file_lines is None:
+                # drop any version saved from an earlier update file
+                if file_name in saved_paths:
+                    os.remove(saved_paths.pop(file_name))
+                deleted.add(file_name)
+                continue
+
+            deleted.discard(file_name)
+            if file_name not in saved_paths:
+                save_dir = os.path.join(delta_directory,
+                                        '{0:0>4}'.format(num_saved//10000),
+                                        'by_doi' if pmid in pmid_doi_map else 'by_pmid')
+                ensure_path_exists(save_dir)
+                saved_paths[file_name] = os.path.join(save_dir, file_name)
+                num_saved += 1
+            save_file(os.path.basename(saved_paths[file_name]), file_lines,
+                      os.path.dirname(saved_paths[file_name]))
+
+    with open(os.path.join(delta_directory, 'deleted.txt'), 'w') as f:
+        f.writelines(file_name+'\n' for file_name in sorted(deleted))
+    with open(os.path.join(delta_directory, 'update_files.txt'), 'w') as f:
+        f.writelines(os.path.basename(update_file)+'\n' for update_file in update_files)
+
+    return len(saved_paths), len(deleted)
+
+def main_update(args):
+
+    ''' Applies update files that haven't been applied to
+        args.output_directory yet (see apply_update_files())
+    '''
+
+    last_update_file = get_last_update_file(args.output_directory)
+    update_files = get_new_update_files(args.xml_file_directory, last_update_file)
+    if not update_files:
+        print('No update files after {} in {}'.format(last_update_file,
+                                                      args.xml_file_directory))
+        return
+
+    pmid_doi_map = create_pmid_doi_mapping(args)
+
+    # (a delta directory left by an interrupted run is replaced)
+    delta_directory = os.path.join(args.output_directory, 'updates',
+                                   os.path.basename(update_files[-1]).split('.')[0])
+    if os.path.isdir(delta_directory):
+        shutil.rmtree(delta_directory)
+    ensure_path_exists(delta_directory)
+
+    print('Applying {} update files ({} to {})...'.format(len(update_files),
+                                                         os.path.basename(update_files[0]),
+                                                         os.path.basename(update_files[-1])))
+    num_saved, num_deleted = apply_update_files(update_files, delta_directory, pmid_doi_map)
+    set_last_update_file(args.output_directory, os.path.basename(update_files[-1]))
+
+    print('{} new or revised files saved to {}'.format(num_saved, delta_directory))
+    print('{} deleted citations listed in {}'.format(num_deleted,
+                                                     os.path.join(delta_directory, 'deleted.txt')))
+
 def main(args):
 
     ensure_path_exists(args.output_directory)
@@ -133,6 +302,10 @@ def main(args):
         # doi_path = os.path.join(args.output_directory, 'by_doi')
         # ensure_path_exists(doi_path)
 
+    if args.update:
+        main_update(args)
+        return
+
     pmid_doi_map = create_pmid_doi_mapping(args)
 
     all_files = glob(os.path.join(args.xml_file_directory, '*'))
@@ -213,6 +386,10 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Parses article abstracts from MEDLINE XML files')
     parser.add_argument('xml_file_directory', help='Directory of MEDLINE XML files')
     parser.add_argument('output_directory', help='Output directory for parsed files')
-    parser.add_argument('--doiindex', help='Map PMIDs to DOIs, if possible (specify path to PMC ID mapping file PMC-ids.csv)')
+    parser.add_argument('--doiindex', help='Map PMIDs to DOIs, if possible (specify path to PMC ID mapping file PMC-ids.csv, '
+                             'or an index built from it with preprocess.pmid_doi_index)')
+    parser.add_argument('--update', action='store_true',
+                        help='Apply MEDLINE update files newer than the last one applied to output_directory, '
+                             'saving only changed abstracts (use a separate output_directory from the baseline\'s)')
     args = parser.parse_args()
     main(args)
\ No newline at end of file
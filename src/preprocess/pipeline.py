@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+'''pipeline.py
+
+Runs the full MEDLINE preprocessing pipeline, from MEDLINE XML files to the
+`[corpus]_[chunk]_combined.tgz` archives read by DeepDive, as a graph of PBS
+jobs over chunks of MEDLINE XML files
+
+First, a single job that doesn't wait for any other job splits the
+(multi-GB) bioconcepts file by PMID, once:
+
+pubtator_split  preprocess.split_pubtator, into [output_directory]/pubtator_split
+
+Stages for each chunk (each stage is a job, held until the stages it depends
+on have finished successfully):
+
+parse         preprocess.parse_medline_xml, and a list of the chunk's PMIDs
+pubtator      preprocess.create_pubtator_subset for the chunk's PMIDs, from
+              the split files that cover them (depends on parse and
+              pubtator_split)
+corenlp       preprocess.prep_corenlp, run locally within the job
+              (depends on pubtator)
+chem_ner      preprocess.chem_ner, with --tmchem (depends on pubtator)
+disease_ner   preprocess.disease_ner, with --dnorm (depends on pubtator)
+package       [corpus]_[chunk]_combined.tgz (depends on all of the above)
+
+and with --deepdive, a final job that runs deepdive/run.sh once every chunk is
+packaged (set data_directory, min_chunk and max_chunk in
+deepdive/bioshovel_config.json to match)
+
+So the bioconcepts file is read through once, while the first chunks are
+parsed, and a chunk's CoreNLP and NER jobs start as soon as its parform files
+exist, while other chunks are still being parsed. Ordering is enforced with PBS
+`afterok` dependencies, or by the local executor (--executor local).
+
+Each job marks its stage done ([output_directory]/chunks/[chunk]/[stage].done,
+or [output_directory]/[stage].done for pubtator_split and deepdive) when it
+succeeds, and stages that are already done aren't run again, so the
+pipeline can be restarted after failures.
+
+usage:
+cd bioshovel/src # this is the parent directory of this script file
+python3 -m preprocess.pipeline [medline_xml_directory] [bioconcepts2pubtator_offsets] [output_directory] --corenlp [path/to/corenlp] --submit
+
+Run `python3 -m preprocess.pipeline -h` for options
+'''
+
+import argparse
+import os
+import sys
+import textwrap
+from collections import OrderedDict
+from glob import glob
+
+from preprocess import prep_corenlp
+from preprocess.util import (ensure_path_exists,
+                             file_exists_or_exit,
+                             shell_command_exists_or_exit)
+
+from preprocess.cluster.executors import (add_executor_arguments,
+                                          get_executor,
+                                          print_job_summary)
+
+# stages run once for all chunks (job (stage, None)), before the chunk stages
+# that depend on them
+SHARED_STAGES = ('pubtator_split',)
+
+# stages run for each chunk, and the stages (of the same chunk, or shared) they
+# depend on
+CHUNK_STAGES = OrderedDict([('parse', ()),
+                            ('pubtator', ('parse', 'pubtator_split')),
+                            ('corenlp', ('pubtator',)),
+                            ('chem_ner', ('pubtator',)),
+                            ('disease_ner', ('pubtator',)),
+                            ('package', ('corenlp', 'chem_ner', 'disease_ner')),
+                            ])
+
+def get_chunk_stages(args):
+
+    ''' Returns CHUNK_STAGES without the stages that args doesn't enable
+        (chem_ner needs --tmchem, disease_ner needs --dnorm)
+    '''
+
+    disabled = set()
+    if not args.tmchem:
+        disabled.add('chem_ner')
+    if not args.dnorm:
+        disabled.add('disease_ner')
+
+    return OrderedDict((stage, tuple(d for d in dependencies if d not in disabled))
+                       for stage, dependencies in CHUNK_STAGES.items()
+                       if stage not in disabled)
+
+def get_dependency_job(dependency, chunk_num):
+    return (dependency, None if dependency in SHARED_STAGES else chunk_num)
+
+def get_job_graph(chunk_stages, chunk_nums, deepdive=False):
+
+    ''' Returns the pipeline's jobs as a list of (job, dependencies) tuples,
+        where each job comes after its dependencies
+
+        A job is a tuple (stage, chunk_num), one for each of chunk_stages (see
+        get_chunk_stages()) and chunk_nums, after a job (stage, None) for each
+        of SHARED_STAGES. With deepdive, the last job is ('deepdive', None),
+        which depends on the last stage of every chunk
+    '''
+
+    job_graph = [((stage, None), []) for stage in SHARED_STAGES]
+    for chunk_num in chunk_nums:
+        for stage, dependencies in chunk_stages.items():
+            job_graph.append(((stage, chunk_num),
+                              [get_dependency_job(dependency, chunk_num)
+                               for dependency in dependencies]))
+
+    if deepdive:
+        last_stage = next(reversed(chunk_stages))
+        job_graph.append((('deepdive', None),
+                          [(last_stage, chunk_num) for chunk_num in chunk_nums]))
+
+    return job_graph
+
+def get_chunk_dir(chunk_num, args):
+    return os.path.join(args.output_directory, 'chunks', '{0:0>4}'.format(chunk_num))
+
+def get_done_path(job, args):
+
+    ''' Returns the path of the file that marks a job's stage as done
+    '''
+
+    stage, chunk_num = job
+    if chunk_num is None:
+        return os.path.join(args.output_directory, stage+'.done')
+    return os.path.join(get_chunk_dir(chunk_num, args), stage+'.done')
+
+def get_archive_path(chunk_num, args):
+
+    ''' Returns the path of a chunk's archive, named to match the glob in
+        deepdive/udf/load_sentences.py
+    '''
+
+    return os.path.join(args.output_directory,
+                        '{}_{}_combined.tgz'.format(args.corpus, chunk_num))
+
+def create_chunks(xml_files, args):
+
+    ''' Divides xml_files (a sorted list of MEDLINE XML files) into chunks of
+        args.files_per_chunk files, and symlinks each chunk's files into
+        [chunk directory]/xml
+
+        (consecutive files are chunked together, so the chunks of a restarted
+        run are the same, and newly added update files make new chunks)
+
+        Returns a list of chunk numbers
+    '''
+
+    chunk_nums = []
+    for chunk_num, start in enumerate(range(0, len(xml_files), args.files_per_chunk)):
+        xml_dir = os.path.join(get_chunk_dir(chunk_num, args), 'xml')
+        ensure_path_exists(xml_dir)
+        for xml_file in xml_files[start:start+args.files_per_chunk]:
+            link_path = os.path.join(xml_dir, os.path.basename(xml_file))
+            if not os.path.lexists(link_path):
+                os.symlink(xml_file, link_path)
+        chunk_nums.append(chunk_num)
+
+    return chunk_nums
+
+def get_job_resources(stage, args):
+
+    ''' Returns PBS resource (#PBS -l) lines for a stage's jobs
+    '''
+
+    if stage == 'corenlp':
+        return prep_corenlp.get_job_resources(args)
+
+    if stage in ('chem_ner', 'disease_ner', 'deepdive'):
+        ppn, memgb, walltime_hours = args.poolsize, args.memgb, 240
+    elif stage == 'pubtator_split':
+        # (reads through the whole bioconcepts file)
+        ppn, memgb, walltime_hours = 1, 4, 24
+    else:
+        ppn, memgb, walltime_hours = 1, 4, 12
+
+    return textwrap.dedent('''
+        #PBS -l nodes=1:ppn={ppn}
+        #PBS -l walltime={walltime_hours}:00:00
+        #PBS -j oe
+        #PBS -l mem={memgb}gb
+        ''').strip('\n').format(ppn=ppn, memgb=memgb, walltime_hours=walltime_hours)
+
+def get_stage_commands(stage, chunk_num, args):
+
+    ''' Returns the lines of a job script (run from bioshovel/src) that run a
+        stage for chunk chunk_num (None for SHARED_STAGES and deepdive)
+    '''
+
+    split_dir = os.path.join(args.output_directory, 'pubtator_split')
+    if stage == 'pubtator_split':
+        return 'python3 -m preprocess.split_pubtator {} {} --notqdm'.format(args.bioconcepts_file,
+                                                                             split_dir)
+
+    if stage == 'deepdive':
+        return textwrap.dedent('''
+            # load all chunk archives into DeepDive
+            cd deepdive
+            ./run.sh
+            ''').strip('\n')
+
+    chunk_dir = get_chunk_dir(chunk_num, args)
+    cust_dict = {'chunk_dir': chunk_dir,
+                 'paragraph_dir': os.path.join(chunk_dir, 'pubtator_subset', 'abstracts'),
+                 'split_dir': split_dir,
+                 'corenlp': args.corenlp,
+                 'corenlp_options': ('--server --servers {} --bioshovel {}'.format(args.servers,
+                                                                                   args.bioshovel)
+                                     if args.server else ''),
+                 'files_per_corenlp_job': args.files_per_corenlp_job,
+                 'tmchem': args.tmchem,
+                 'dnorm': args.dnorm,
+                 'poolsize': args.poolsize,
+                 }
+
+    if stage == 'parse':
+        commands = '''
+            python3 -m preprocess.parse_medline_xml {chunk_dir}/xml {chunk_dir}/medline &&
+            find {chunk_dir}/medline -type f -printf '%f\\n' > {chunk_dir}/pmids.txt
+            '''
+    elif stage == 'pubtator':
+        commands = '''
+            python3 -m preprocess.create_pubtator_subset {chunk_dir}/pmids.txt {split_dir} {chunk_dir}/pubtator_subset
+            '''
+    elif stage == 'corenlp':
+        # run prep_corenlp's job(s) for this chunk within this job
+        commands = '''
+            python3 -m preprocess.prep_corenlp {paragraph_dir} {chunk_dir}/corenlp --corenlp {corenlp} --executor local --max_jobs 1 --submit --files_per_job {files_per_corenlp_job} {corenlp_options}
+            '''
+    elif stage == 'chem_ner':
+        commands = '''
+            mkdir -p {chunk_dir}/logs/chem_ner
+            python3 -m preprocess.chem_ner {paragraph_dir} {chunk_dir}/chem_ner --tmchem {tmchem} --logdir {chunk_dir}/logs/chem_ner --notqdm --poolsize {poolsize}
+            '''
+    elif stage == 'disease_ner':
+        commands = '''
+            mkdir -p {chunk_dir}/logs/disease_ner
+            python3 -m preprocess.disease_ner {paragraph_dir} {chunk_dir}/disease_ner --dnorm {dnorm} --logdir {chunk_dir}/logs/disease_ner --notqdm --poolsize {poolsize}
+            '''
+    elif stage == 'package':
+        # archive directory layout: see deepdive/README.md (load_articles.py)
+        package_name = '{}_{}'.format(args.corpus, chunk_num)
+        package_dir = os.path.join(chunk_dir, 'package', package_name)
+        links = [('input_files', os.path.join(chunk_dir, 'corenlp', 'input_files')),
+                 ('output_files', os.path.join(chunk_dir, 'corenlp', 'output_files')),
+                 ('pubtator', os.path.join(chunk_dir, 'pubtator_subset', 'pubtator'))]
+        for ner_stage in ('chem_ner', 'disease_ner'):
+            if ner_stage in get_chunk_stages(args):
+                links.append((ner_stage, os.path.join(chunk_dir, ner_stage)))
+
+        commands = '\n'.join(['mkdir -p {}'.format(package_dir)] +
+                             ['ln -sfn {} {}'.format(target, os.path.join(package_dir, name))
+                              for name, target in links] +
+                             ['tar -czhf {archive}.part -C {parent_dir} {package_name} &&',
+                              'mv {archive}.part {archive}'])
+        cust_dict.update(archive=get_archive_path(chunk_num, args),
+                         parent_dir=os.path.dirname(package_dir),
+                         package_name=package_name)
+    else:
+        raise ValueError('Unknown pipeline stage: {}'.format(stage))
+
+    return textwrap.dedent(commands).strip('\n').format(**cust_dict)
+
+def create_job_file(job, job_dir, args):
+
+    ''' Creates a PBS job file in job_dir that runs a job's stage, and marks
+        it done if successful (see get_done_path())
+    '''
+
+    stage, chunk_num = job
+    name = stage if chunk_num is None else '{}_chunk{}'.format(stage, chunk_num)
+    cust_dict = {'resources': get_job_resources(stage, args),
+                 'job_name': stage if chunk_num is None else '{}_{}'.format(stage, chunk_num),
+                 'name': name,
+                 'bioshovel_dir': args.bioshovel,
+                 'commands': get_stage_commands(stage, chunk_num, args),
+                 'done_path': get_done_path(job, args),
+                 }
+
+    pbs_jobfile = textwrap.dedent('''
+        #!/bin/bash
+        {resources}
+        #PBS -N "{job_name}"
+        #PBS -o {name}.out
+        #PBS -m n
+
+        # python 3.4+ required
+        module load python/3.5.1
+
+        # move to bioshovel directory and activate venv
+        cd {bioshovel_dir}
+        source venv/bin/activate
+        cd src
+
+        {commands}
+
+        STATUS=$?
+        if [ $STATUS -ne 0 ]; then
+          echo "Pipeline stage {name} failed"; exit $STATUS
+        else
+          touch {done_path}
+          echo "Finished successfully!"
+        fi
+        ''').strip('\n').format(**cust_dict)
+
+    job_file_path = os.path.join(job_dir, name+'.job')
+    with open(job_file_path, 'w') as f:
+        f.write(pbs_jobfile)
+
+    return job_file_path
+
+def submit_jobs(job_graph, job_file_paths, executor):
+
+    ''' Submits the job file of each job in job_graph (see get_job_graph())
+        with the job IDs of its dependencies
+
+        Jobs without a job file in job_file_paths (a dict of job: job file
+        path) are already done, so they aren't submitted and jobs that depend
+        on them don't wait for them
+
+        Returns a dict of job: job ID
+    '''
+
+    job_ids = {}
+    for job, dependencies in job_graph:
+        if job in job_file_paths:
+            job_ids[job] = executor.submit(job_file_paths[job],
+                                           dependencies=[job_ids[d] for d in dependencies if d in job_ids])
+
+    return job_ids
+
+def main(args):
+
+    # ensure that `qsub` command exists on this machine...
+    if args.submit and args.executor == 'pbs':
+        shell_command_exists_or_exit('qsub')
+
+    # make paths absolute so that all other paths are also absolute
+    for arg in ('xml_file_directory', 'bioconcepts_file', 'output_directory',
+                'corenlp', 'tmchem', 'dnorm', 'bioshovel'):
+        if getattr(args, arg):
+            setattr(args, arg, os.path.abspath(getattr(args, arg)))
+
+    file_exists_or_exit(args.xml_file_directory)
+    file_exists_or_exit(args.bioconcepts_file)
+    if args.server:
+        file_exists_or_exit(os.path.join(args.bioshovel, 'src', 'preprocess', 'corenlp_annotate.py'))
+    else:
+        file_exists_or_exit(os.path.join(args.corenlp, 'corenlp.sh'))
+    if args.tmchem:
+        file_exists_or_exit(os.path.join(args.tmchem, 'tmChem.pl'))
+    if args.dnorm:
+        file_exists_or_exit(os.path.join(args.dnorm, 'ApplyDNorm.sh'))
+
+    job_dir = os.path.join(args.output_directory, 'job_files')
+    ensure_path_exists(job_dir)
+
+    xml_files = sorted(glob(os.path.join(args.xml_file_directory, '*')))
+    if not xml_files:
+        print('No MEDLINE XML files found in {}'.format(args.xml_file_directory))
+        sys.exit(1)
+    chunk_nums = create_chunks(xml_files, args)
+
+    chunk_stages = get_chunk_stages(args)
+    job_graph = get_job_graph(chunk_stages, chunk_nums, deepdive=args.deepdive)
+    print('Pipeline for {} MEDLINE XML files in {} chunks, with stages: {}'.format(len(xml_files),
+                                                                                  len(chunk_nums),
+                                                                                  ', '.join(SHARED_STAGES + tuple(chunk_stages))))
+
+    job_file_paths = OrderedDict((job, create_job_file(job, job_dir, args))
+                                 for job, _ in job_graph
+                                 if not os.path.isfile(get_done_path(job, args)))
+    print('Created {} PBS job files in {} ({} jobs already done)'.format(len(job_file_paths),
+                                                                         job_dir,
+                                                                         len(job_graph)-len(job_file_paths)))
+
+    if args.submit:
+        print('{} jobs...'.format('Running' if args.executor == 'local' else
+                                  'Submitting to queue \'{}\''.format(args.queue)))
+        executor = get_executor(args)
+        submit_jobs(job_graph, job_file_paths, executor)
+        results = executor.wait()
+        print_job_summary(results)
+        if any(r.status or r.skipped for r in results):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the MEDLINE preprocessing pipeline (MEDLINE XML to DeepDive input archives) '
+                                                 'as a graph of PBS jobs over chunks of MEDLINE XML files')
+    parser.add_argument('xml_file_directory', help='Directory of MEDLINE XML files')
+    parser.add_argument('bioconcepts_file', help='PubTator bioconcepts2pubtator_offsets download file')
+    parser.add_argument('output_directory', help='Output directory for chunk files, job files and archives')
+    parser.add_argument('--corpus', default='medline',
+                        help='Corpus name, used in archive names ([corpus]_[chunk]_combined.tgz) (default medline)')
+    parser.add_argument('--files_per_chunk', type=int, default=10,
+                        help='Number of MEDLINE XML files per chunk (default 10)')
+    parser.add_argument('--corenlp', help='Absolute path for CoreNLP (specifically, where corenlp.sh is located)',
+                        default=os.getcwd())
+    parser.add_argument('--server', action='store_true',
+                        help='Annotate files with persistent CoreNLP servers (see preprocess.prep_corenlp --server)')
+    parser.add_argument('--servers', type=int, default=1,
+                        help='With --server, number of CoreNLP servers per job (default 1)')
+    parser.add_argument('--files_per_corenlp_job', type=int, default=100000,
+                        help='Number of files per CoreNLP run within a chunk\'s corenlp job '
+                             '(default 100000, so usually one run per chunk)')
+    parser.add_argument('--tmchem', help='Directory where tmChem.pl is located (adds a chem_ner stage)')
+    parser.add_argument('--dnorm', help='Directory where ApplyDNorm.sh is located (adds a disease_ner stage)')
+    parser.add_argument('--poolsize', type=int, default=8,
+                        help='Size of multiprocessing process pool for NER jobs (default 8)')
+    parser.add_argument('--memgb', type=int, default=47,
+                        help='Amount of RAM to allocate per NER (and DeepDive) job (GB) (default 47)')
+    parser.add_argument('--deepdive', action='store_true',
+                        help='Run deepdive/run.sh once all chunks are packaged')
+    parser.add_argument('--bioshovel', help='Path to bioshovel directory (with venv)',
+                        default=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    add_executor_arguments(parser)
+    parser.add_argument('--submit', help='Submit (or with --executor local, run) jobs after creating job files',
+                        action='store_true')
+    args = parser.parse_args()
+    main(args)
@@ -1,17 +1,36 @@
 #!/usr/bin/env python3
 
 # usage:
-# python3 pmc_prettyprint.py [root_directory]
+# python3 -m preprocess.pmc_prettyprint [root_directory]
+# python3 -m preprocess.pmc_prettyprint [root_directory] --poolsize N [--skip mtime|hash|none]
 
 # Create a pretty-printed version
 # of the PubMed Central XML corpus
 #
-# New files will be created with same 
+# New files will be created with same
 # directory structure in pretty_[root_directory]
+#
+# With --poolsize, .nxml files are pretty-printed with lxml by a pool of N
+# processes, and files that are already up to date are skipped: by default
+# those whose output is newer than the input, or with --skip hash, those whose
+# input content hash matches the one recorded (in
+# pretty_[root_directory]/.prettyprint_hashes.tsv) when their output was
+# written
 
+import argparse
+import hashlib
+import multiprocessing as mp
 import os
 import sys
+import time
 from bs4 import BeautifulSoup
+from collections import Counter
+from lxml import etree
+from tqdm import tqdm
+
+from preprocess.util import ensure_path_exists
+
+HASH_MANIFEST_FILENAME = '.prettyprint_hashes.tsv'
 
 def prettify(input_xml_string):
 
@@ -22,6 +41,45 @@ def prettify(input_xml_string):
     soup = BeautifulSoup(input_xml_string, 'html.parser')
     return soup.prettify()
 
+def has_element_only_content(element):
+
+    ''' True if element only contains child elements separated by line breaks
+        (indentation), and no text: e.g. <front>, but not <p> or
+        <p><italic>Homo</italic> <italic>sapiens</italic></p>
+    '''
+
+    if not len(element):
+        return False
+
+    return all(text is None or (not text.strip() and '\n' in text)
+               for text in [element.text]+[child.tail for child in element])
+
+def prettify_lxml(input_xml_bytes):
+
+    ''' returns prettified xml (bytes, UTF-8) using lxml, keeping the XML
+        declaration and DOCTYPE
+
+        only elements with element-only content are re-indented, so text
+        (including whitespace between inline elements) is never changed
+
+        (raises lxml.etree.XMLSyntaxError if the input isn't well-formed XML)
+    '''
+
+    parser = etree.XMLParser(resolve_entities=False, load_dtd=False,
+                             no_network=True)
+    root = etree.fromstring(input_xml_bytes, parser)
+
+    # drop the old indentation of element-only content (lxml only indents
+    # elements without any text, so mixed content is written as it is)
+    for element in root.iter(etree.Element):
+        if has_element_only_content(element):
+            element.text = None
+            for child in element:
+                child.tail = None
+
+    return etree.tostring(root.getroottree(), pretty_print=True,
+                          xml_declaration=True, encoding='UTF-8')
+
 def write_prettified_sibling(input_file, output_file):
 
     ''' reads input_file and writes
@@ -31,17 +89,157 @@ def write_prettified_sibling(input_file, output_file):
     with open(input_file) as i, open(output_file, 'w') as o:
         o.write(prettify(i.read()))
 
-def main():
-    
-    assert len(sys.argv) == 2, 'wrong number of arguments'
-    top_dir = sys.argv[1]
+def is_newer(output_file, input_file):
+
+    ''' True if output_file exists and was modified after input_file
+    '''
+
+    try:
+        return os.path.getmtime(output_file) >= os.path.getmtime(input_file)
+    except FileNotFoundError:
+        return False
+
+def prettify_file(file_args_tuple):
+
+    ''' Worker pool function: pretty-print one file with lxml, unless its
+        output is up to date
+
+        Takes a tuple (input_file, output_file, skip, known_hash), where skip
+        is 'mtime', 'hash' or 'none' and known_hash is the input hash recorded
+        when output_file was last written (or None)
+
+        Returns a tuple (input_file, status, bytes_read, input_hash, error),
+        where status is 'written', 'skipped' or 'failed'
+        (input_hash is only computed with skip='hash')
+    '''
+
+    input_file, output_file, skip, known_hash = file_args_tuple
+
+    try:
+        if skip == 'mtime' and is_newer(output_file, input_file):
+            return input_file, 'skipped', 0, None, None
+
+        with open(input_file, 'rb') as f:
+            input_xml = f.read()
+
+        input_hash = None
+        if skip == 'hash':
+            input_hash = hashlib.sha1(input_xml).hexdigest()
+            if input_hash == known_hash and os.path.exists(output_file):
+                return input_file, 'skipped', len(input_xml), input_hash, None
+
+        pretty_xml = prettify_lxml(input_xml)
+
+        ensure_path_exists(os.path.dirname(output_file))
+        with open(output_file, 'wb') as f:
+            f.write(pretty_xml)
+
+        return input_file, 'written', len(input_xml), input_hash, None
+
+    except Exception as e:
+        return input_file, 'failed', 0, None, repr(e)
+
+def load_hash_manifest(manifest_path):
+
+    ''' Returns {relative input path: input hash} from a hash manifest
+        (later lines override earlier ones)
+    '''
+
+    hashes = {}
+    if not os.path.isfile(manifest_path):
+        return hashes
+
+    with open(manifest_path) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) == 2:
+                hashes[fields[0]] = fields[1]
+
+    return hashes
+
+def iter_nxml_files(top_dir, output_dir):
+
+    ''' Yield (input_file, output_file, relative path) for each .nxml file in
+        the top_dir tree
+    '''
+
+    for root, dirs, files in os.walk(top_dir):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith('.nxml'):
+                input_file = os.path.join(root, filename)
+                relpath = os.path.relpath(input_file, top_dir)
+                yield input_file, os.path.join(output_dir, relpath), relpath
+
+def prettify_tree(top_dir, output_dir, poolsize=mp.cpu_count(), skip='mtime',
+                  quiet=False):
+
+    ''' Pretty-print all .nxml files in the top_dir tree to the same relative
+        paths in output_dir using a process pool (see prettify_file())
+
+        Returns a Counter with the number of 'written', 'skipped' and 'failed'
+        files and the number of 'bytes' read
+    '''
+
+    ensure_path_exists(output_dir)
+    manifest_path = os.path.join(output_dir, HASH_MANIFEST_FILENAME)
+    hashes = load_hash_manifest(manifest_path) if skip == 'hash' else {}
+
+    file_args = ((input_file, output_file, skip, hashes.get(relpath))
+                 for input_file, output_file, relpath in iter_nxml_files(top_dir, output_dir))
+
+    stats = Counter()
+
+    # (the hash manifest is only written with skip='hash')
+    with mp.Pool(poolsize) as pool, open(manifest_path if skip == 'hash' else os.devnull, 'a') as manifest:
+        results = pool.imap_unordered(prettify_file, file_args, chunksize=64)
+        pbar = tqdm(results, unit='files', disable=quiet)
+
+        for input_file, status, nbytes, input_hash, error in pbar:
+            stats[status] += 1
+            stats['bytes'] += nbytes
+
+            if error:
+                print('Failed to prettify {}: {}'.format(input_file, error), file=sys.stderr)
+            elif status == 'written' and input_hash:
+                manifest.write('{}\t{}\n'.format(os.path.relpath(input_file, top_dir), input_hash))
+
+            pbar.set_postfix(written=stats['written'], skipped=stats['skipped'],
+                             failed=stats['failed'], refresh=False)
+
+    return stats
+
+def main(args):
+
+    top_dir = args.root_directory
     prettified_directory_prefix = 'pretty_'
 
+    if args.poolsize:
+        output_dir = args.output_directory or prettified_directory_prefix+top_dir
+
+        start = time.perf_counter()
+        stats = prettify_tree(top_dir, output_dir, poolsize=args.poolsize, skip=args.skip,
+                              quiet=args.notqdm)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+
+        total = stats['written'] + stats['skipped'] + stats['failed']
+        print('{} files written, {} skipped, {} failed in {:.1f}s '
+              '({:.1f} files/s, {:.1f} MB/s read)'.format(stats['written'],
+                                                          stats['skipped'],
+                                                          stats['failed'],
+                                                          elapsed,
+                                                          total/elapsed,
+                                                          stats['bytes']/1e6/elapsed))
+        return
+
     for root, dirs, files in os.walk(top_dir):
         print('Reading directory {}'.format(root))
 
         if any(filename for filename in files if filename.endswith('.nxml')):
-            new_root = prettified_directory_prefix+root
+            if args.output_directory:
+                new_root = os.path.join(args.output_directory, os.path.relpath(root, top_dir))
+            else:
+                new_root = prettified_directory_prefix+root
 
             # check if directory exists and create if necessary
             if not os.path.isdir(new_root):
@@ -51,4 +249,18 @@ def main():
                 write_prettified_sibling(os.path.join(root,filename), os.path.join(new_root,filename))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Create a pretty-printed version of an XML corpus')
+    parser.add_argument('root_directory', help='Root directory of the XML corpus')
+    parser.add_argument('--output_directory',
+                        help='Output directory (default pretty_[root_directory])')
+    parser.add_argument('--poolsize', type=int,
+                        help='Pretty-print .nxml files with lxml using a process pool of this size '
+                             '(default: pretty-print all files one at a time with BeautifulSoup)')
+    parser.add_argument('--skip', choices=('mtime', 'hash', 'none'), default='mtime',
+                        help='With --poolsize, skip files whose output is newer than the input (mtime), '
+                             'or whose input is unchanged since its output was written (hash) '
+                             '(default mtime)')
+    parser.add_argument('--notqdm', help='Disable tqdm progress bar output',
+                        action='store_true')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+'''pmid_doi_index.py
+
+Builds a compact PMID -> DOI index from the PMC ID mapping file
+(PMC-ids.csv, ftp://ftp.ncbi.nlm.nih.gov/pub/pmc/PMC-ids.csv.gz), once, for
+memory-mapped lookups
+
+The index is a binary file with PMIDs sorted, so a PMID is looked up with a
+binary search over the memory-mapped file instead of loading millions of rows
+into a dict:
+
+    8 bytes         MAGIC
+    8 bytes         number of PMIDs n
+    n x int64       PMIDs, sorted
+    (n+1) x int64   offsets of each DOI within the DOI bytes
+    ...             DOI bytes (UTF-8)
+
+(integers in native byte order)
+
+usage:
+cd bioshovel/src # this is the parent directory of this script file
+python3 -m preprocess.pmid_doi_index [path/to/PMC-ids.csv] [path/to/index]
+
+then use the index with `python3 -m preprocess.parse_medline_xml --doiindex [path/to/index]`,
+or from python:
+
+with PMIDDOIIndex(index_path) as index:
+    doi = index.get('17687753')
+'''
+
+import argparse
+import csv
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+from tqdm import tqdm
+
+from preprocess.util import file_exists_or_exit
+
+MAGIC = b'PMIDDOI1'
+HEADER_SIZE = 16
+
+def iter_pmid_doi_pairs(pmc_ids_path, quiet=False):
+
+    ''' Yields (PMID, DOI) string tuples for rows of a PMC-ids.csv file that
+        have both (columns are found by name in the header row)
+    '''
+
+    with open(pmc_ids_path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        pmid_column = header.index('PMID')
+        doi_column = header.index('DOI')
+
+        for row in tqdm(reader, disable=quiet):
+            if len(row) <= max(pmid_column, doi_column):
+                continue
+            pmid, doi = row[pmid_column].strip(), row[doi_column].strip()
+            if pmid and doi:
+                yield pmid, doi
+
+def build_index(pmc_ids_path, index_path, quiet=False):
+
+    ''' Builds a PMID -> DOI index file at index_path from the PMC-ids.csv
+        file at pmc_ids_path (see this module's docstring for the format)
+
+        For PMIDs in more than one row, the last row's DOI is used. Rows with
+        non-numeric PMIDs are skipped
+
+        Returns the number of PMIDs in the index
+    '''
+
+    pmids = array('q')
+    dois = []
+    for pmid, doi in iter_pmid_doi_pairs(pmc_ids_path, quiet=quiet):
+        try:
+            pmids.append(int(pmid))
+        except ValueError:
+            continue
+        dois.append(doi.encode('utf-8'))
+
+    # stable sort, so the last row of each PMID is the last of its run
+    order = sorted(range(len(pmids)), key=pmids.__getitem__)
+    order = [i for n, i in enumerate(order)
+             if n+1 == len(order) or pmids[order[n+1]] != pmids[i]]
+
+    sorted_pmids = array('q', (pmids[i] for i in order))
+    offsets = array('q', [0])
+    for i in order:
+        offsets.append(offsets[-1] + len(dois[i]))
+
+    # write to a temporary file first, so an index is never partially written
+    with open(index_path+'.part', 'wb') as f:
+        f.write(MAGIC)
+        f.write(array('q', [len(sorted_pmids)]).tobytes())
+        f.write(sorted_pmids.tobytes())
+        f.write(offsets.tobytes())
+        for i in order:
+            f.write(dois[i])
+    os.replace(index_path+'.part', index_path)
+
+    return len(sorted_pmids)
+
+def is_index_file(path):
+
+    ''' True if path is a PMID -> DOI index file (rather than a PMC-ids.csv
+        file)
+    '''
+
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class PMIDDOIIndex(object):
+
+    ''' Read-only, dict-like access to a memory-mapped PMID -> DOI index file
+        (PMIDs are strings, like the keys of
+        parse_medline_xml.create_pmid_doi_mapping())
+
+        With escape_slash, DOIs are returned with '/' replaced by '%2F' (for
+        use as file names)
+    '''
+
+    def __init__(self, index_path, escape_slash=False):
+        self.escape_slash = escape_slash
+        self.file = open(index_path, 'rb')
+        self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buf[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError('Not a PMID -> DOI index file: {}'.format(index_path))
+
+        self.view = memoryview(self.buf)
+        self.count = self.view[len(MAGIC):HEADER_SIZE].cast('q')[0]
+        pmids_end = HEADER_SIZE + 8*self.count
+        offsets_end = pmids_end + 8*(self.count+1)
+        self.pmids = self.view[HEADER_SIZE:pmids_end].cast('q')
+        self.offsets = self.view[pmids_end:offsets_end].cast('q')
+        self.dois_start = offsets_end
+
+    def find(self, pmid):
+
+        ''' Returns the position of pmid in the index, or None
+        '''
+
+        try:
+            pmid = int(pmid)
+        except (TypeError, ValueError):
+            return None
+
+        i = bisect_left(self.pmids, pmid)
+        if i < self.count and self.pmids[i] == pmid:
+            return i
+        return None
+
+    def get(self, pmid, default=None):
+        i = self.find(pmid)
+        if i is None:
+            return default
+
+        start = self.dois_start + self.offsets[i]
+        end = self.dois_start + self.offsets[i+1]
+        doi = self.buf[start:end].decode('utf-8')
+        if self.escape_slash:
+            doi = doi.replace('/', '%2F')
+        return doi
+
+    def __getitem__(self, pmid):
+        doi = self.get(pmid)
+        if doi is None:
+            raise KeyError(pmid)
+        return doi
+
+    def __contains__(self, pmid):
+        return self.find(pmid) is not None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        for view in ('pmids', 'offsets', 'view'):
+            if hasattr(self, view):
+                getattr(self, view).release()
+        self.buf.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def main(args):
+
+    file_exists_or_exit(args.pmc_ids_file)
+
+    print('Reading PMC ID mapping file {}'.format(args.pmc_ids_file))
+    count = build_index(args.pmc_ids_file, args.index_file, quiet=args.notqdm)
+    print('Saved index of {} PMIDs to {} ({:.1f} MB)'.format(count,
+                                                            args.index_file,
+                                                            os.path.getsize(args.index_file)/1e6))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a memory-mapped PMID -> DOI index from PMC-ids.csv')
+    parser.add_argument('pmc_ids_file', help='PMC ID mapping file PMC-ids.csv')
+    parser.add_argument('index_file', help='Output index file')
+    parser.add_argument('--notqdm', help='Disable tqdm progress bar output',
+                        action='store_true')
+    args = parser.parse_args()
+    main(args)
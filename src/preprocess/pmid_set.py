@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+'''pmid_set.py
+
+Compact, read-only PMID sets for the subset tools
+(preprocess.create_medline_subset, preprocess.create_pubtator_subset)
+
+A PMID set is a sorted array of unique PMIDs (int64s), searched with binary
+search: 8 bytes per PMID, instead of a Python set of strings. A PMID set file
+(built once from a text file of PMIDs) is memory-mapped, so every process that
+opens it shares the same pages:
+
+    8 bytes         MAGIC
+    8 bytes         number of PMIDs n
+    n x int64       PMIDs, sorted (native byte order)
+
+usage:
+cd bioshovel/src # this is the parent directory of this script file
+python3 -m preprocess.pmid_set [path/to/pmid_file] [path/to/pmid_set_file]
+
+then pass the PMID set file in place of the PMID file, or from python:
+
+with PMIDSet(pmid_set_or_text_file) as pmids:
+    '17687753' in pmids
+'''
+
+import argparse
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+
+from preprocess.util import file_exists_or_exit
+
+MAGIC = b'PMIDSET1'
+HEADER_SIZE = 16
+
+def read_pmid_array(pmid_file):
+
+    ''' Returns a sorted array('q') of the unique PMIDs in a text file (one
+        PMID per line; blank and non-numeric lines are skipped)
+    '''
+
+    pmids = array('q')
+    with open(pmid_file) as f:
+        for line in f:
+            try:
+                pmids.append(int(line))
+            except ValueError:
+                continue
+
+    sorted_pmids = array('q')
+    for pmid in sorted(pmids):
+        if not sorted_pmids or sorted_pmids[-1] != pmid:
+            sorted_pmids.append(pmid)
+
+    return sorted_pmids
+
+def build_pmid_set(pmid_file, set_path):
+
+    ''' Builds a PMID set file at set_path from a text file of PMIDs
+
+        Returns the number of PMIDs in the set
+    '''
+
+    pmids = read_pmid_array(pmid_file)
+    with open(set_path+'.part', 'wb') as f:
+        f.write(MAGIC)
+        f.write(array('q', [len(pmids)]).tobytes())
+        f.write(pmids.tobytes())
+    os.replace(set_path+'.part', set_path)
+
+    return len(pmids)
+
+def is_pmid_set_file(path):
+
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class PMIDSet(object):
+
+    ''' Read-only set of PMIDs from a PMID set file (memory-mapped) or a text
+        file of PMIDs (read into a sorted array)
+
+        Membership tests take PMIDs as ints or strings (strings that aren't
+        PMIDs, like DOI file names, are never members)
+    '''
+
+    def __init__(self, path):
+        self.file = self.buf = None
+        if is_pmid_set_file(path):
+            self.file = open(path, 'rb')
+            self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            count = memoryview(self.buf)[len(MAGIC):HEADER_SIZE].cast('q')[0]
+            self.pmids = memoryview(self.buf)[HEADER_SIZE:HEADER_SIZE+8*count].cast('q')
+        else:
+            self.pmids = read_pmid_array(path)
+
+    def __contains__(self, pmid):
+        try:
+            pmid = int(pmid)
+        except (TypeError, ValueError):
+            return False
+
+        i = bisect_left(self.pmids, pmid)
+        return i < len(self.pmids) and self.pmids[i] == pmid
+
+    def __len__(self):
+        return len(self.pmids)
+
+    def __iter__(self):
+        return iter(self.pmids)
+
+    def close(self):
+        if self.buf is not None:
+            self.pmids.release()
+            self.buf.close()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def main(args):
+
+    file_exists_or_exit(args.pmid_file)
+    count = build_pmid_set(args.pmid_file, args.pmid_set_file)
+    print('Saved set of {} PMIDs to {} ({:.1f} MB)'.format(count,
+                                                          args.pmid_set_file,
+                                                          os.path.getsize(args.pmid_set_file)/1e6))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a memory-mapped PMID set file from a file of PMIDs (one per line)')
+    parser.add_argument('pmid_file', help='File of PMIDs')
+    parser.add_argument('pmid_set_file', help='Output PMID set file')
+    args = parser.parse_args()
+    main(args)
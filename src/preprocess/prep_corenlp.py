@@ -9,7 +9,12 @@ Prepares a corpus in paragraph format for processing with Stanford CoreNLP
 
 For use on a PBS cluster (tested on Scripps Garibaldi cluster)
 
-Submits jobs if --submit flag is used.
+Submits jobs if --submit flag is used (with --executor local, runs them and
+exits with status 1 if any of them fail).
+
+With --server, each job runs preprocess.corenlp_annotate, which loads the
+CoreNLP models once into persistent CoreNLP servers on its node, instead of
+running corenlp.sh (so use larger chunks, see --files_per_job)
 '''
 
 import argparse
@@ -17,68 +22,171 @@ import os
 import sys
 import subprocess
 import textwrap
-from glob import glob
 from tqdm import tqdm
 
-from preprocess.util import (create_n_sublists,
+from preprocess.util import (add_corpus_arguments,
+                             create_n_sublists,
                              ensure_path_exists,
                              file_exists_or_exit,
-                             save_file,
+                             iter_input_files,
+                             parse_shards,
+                             save_file_bytes,
                              shell_command_exists_or_exit)
-from preprocess.reformat import (parform_to_plaintext,
-                                 parse_parform_file)
+from preprocess.reformat import parform_file_to_plaintext
 
-from preprocess.cluster.util import submit_pbs_job
+from preprocess.cluster.executors import (add_executor_arguments,
+                                          get_executor,
+                                          print_job_summary)
+from preprocess.cluster.util import (get_array_range,
+                                     get_array_task_lines,
+                                     write_chunk_manifest)
 
-def create_job_file(input_files, job_dir, output_dir, chunk_num, args):
+def write_filelist(input_files, job_dir, chunk_num):
 
-    ''' Creates a PBS job file in args.output_directory for the given
-        file_list of input files
+    ''' Writes the list of input files for chunk chunk_num to job_dir
+
+        Returns the file list path
     '''
 
     filelist_path = os.path.join(job_dir, 'file_list{}'.format(chunk_num))
     with open(filelist_path, 'w') as f:
         f.writelines(line+'\n' for line in input_files)
 
+    return filelist_path
+
+def get_job_resources(args):
+
+    ''' Returns PBS resource (#PBS -l) lines for a CoreNLP job
+    '''
+
+    # each CoreNLP server (see preprocess.corenlp_annotate) needs a 4gb heap
+    memgb = 4*args.servers+2 if args.server else 8
+
+    return textwrap.dedent('''
+        #PBS -l nodes=1:ppn=8
+        #PBS -l cput=384:00:00
+        #PBS -l walltime=48:00:00
+        #PBS -j oe
+        #PBS -l mem={memgb}gb
+        ''').strip('\n').format(memgb=memgb)
+
+def get_corenlp_commands(output_dir, filelist, args):
+
+    ''' Returns the lines of a job script that run CoreNLP on the files listed
+        in filelist (a path, or a shell variable holding one), saving JSON
+        output to output_dir
+
+        With args.server, files are annotated by CoreNLP servers on the job's
+        node (see preprocess.corenlp_annotate), otherwise with corenlp.sh
+    '''
+
     cust_dict = {'output_dir': output_dir,
-                 'filelist_path': filelist_path,
-                 'chunk_num': chunk_num,
+                 'filelist': filelist,
                  'corenlp_dir': args.corenlp,
-                 'files_for_processing': [os.path.basename(filepath) for filepath in input_files]
+                 'bioshovel_dir': args.bioshovel,
+                 'servers': args.servers,
+                 'threads': 8//args.servers or 1,
+                 }
+
+    if args.server:
+        commands = textwrap.dedent('''
+            # java 8 required for CoreNLP
+            module load java/1.8.0_65
+            # python 3.4+ required
+            module load python/3.5.1
+
+            # move to bioshovel directory and activate venv
+            cd {bioshovel_dir}
+            source venv/bin/activate
+
+            # annotate all files with CoreNLP server(s) on this node
+            cd src
+            python3 -m preprocess.corenlp_annotate {output_dir} --filelist {filelist} --corenlp {corenlp_dir} --servers {servers} --threads {threads} --port 0 --notqdm
+            ''')
+    else:
+        commands = textwrap.dedent('''
+            # java 8 required for CoreNLP
+            module load java/1.8.0_65
+
+            # move to Stanford CoreNLP installation directory
+            cd {corenlp_dir}
+
+            ./corenlp.sh -outputFormat json -outputDirectory {output_dir} -filelist {filelist} -annotators tokenize,ssplit,pos,lemma,ner,parse
+            ''')
+
+    commands += textwrap.dedent('''
+        STATUS=$?
+        if [ $STATUS -ne 0 ]; then
+          echo "CoreNLP failed"; exit $STATUS
+        else
+          echo "Finished successfully!"
+        fi
+        ''')
+
+    return commands.strip('\n').format(**cust_dict)
+
+def create_job_file(input_files, job_dir, output_dir, chunk_num, args):
+
+    ''' Creates a PBS job file in args.output_directory for the given
+        file_list of input files
+    '''
+
+    cust_dict = {'chunk_num': chunk_num,
+                 'resources': get_job_resources(args),
+                 'files_for_processing': [os.path.basename(filepath) for filepath in input_files],
+                 'commands': get_corenlp_commands(output_dir,
+                                                  write_filelist(input_files, job_dir, chunk_num),
+                                                  args),
                  }
 
     pbs_jobfile = textwrap.dedent('''
         #!/bin/bash
-        #PBS -l nodes=1:ppn=8
-        #PBS -l cput=384:00:00
-        #PBS -l walltime=48:00:00
-        #PBS -j oe
-        #PBS -l mem=8gb
+        {resources}
         #PBS -N "corenlp_{chunk_num}"
         #PBS -o corenlp_chunk{chunk_num}.out
         #PBS -m n
-          
+
         echo "############################################################"
         echo "Processing files:"
         echo {files_for_processing}
         echo "############################################################"
 
-        # java 8 required for CoreNLP          
-        module load java/1.8.0_65
+        {commands}
+        ''').strip('\n').format(**cust_dict)
 
-        # move to Stanford CoreNLP installation directory
-        cd {corenlp_dir}
+    job_file_path = os.path.join(job_dir, 'corenlp_chunk{}.job'.format(chunk_num))
+    with open(job_file_path, 'w') as f:
+        f.write(pbs_jobfile)
 
-        ./corenlp.sh -outputFormat json -outputDirectory {output_dir} -filelist {filelist_path} -annotators tokenize,ssplit,pos,lemma,ner,parse
-        STATUS=$?
-        if [ $STATUS -ne 0 ]; then
-          echo "CoreNLP failed"; exit $STATUS
-        else
-          echo "Finished successfully!"
-        fi
+    return job_file_path
+
+def create_array_job_file(job_dir, output_dir, manifest_path, num_chunks, args):
+
+    ''' Creates a PBS array job file in job_dir with one task per chunk in
+        the chunk manifest at manifest_path (lines of chunk number and file
+        list path, see preprocess.cluster.util.write_chunk_manifest())
+    '''
+
+    cust_dict = {'resources': get_job_resources(args),
+                 'array_range': get_array_range(num_chunks, args.max_running),
+                 'array_task_lines': get_array_task_lines(manifest_path, ('CHUNK_NUM', 'FILELIST')),
+                 'commands': get_corenlp_commands(output_dir, '"$FILELIST"', args),
+                 }
+
+    pbs_jobfile = textwrap.dedent('''
+        #!/bin/bash
+        {resources}
+        #PBS -N "corenlp"
+        #PBS -t {array_range}
+        #PBS -m n
+
+        {array_task_lines}
+        echo "Processing chunk $CHUNK_NUM (files listed in $FILELIST)"
+
+        {commands}
         ''').strip('\n').format(**cust_dict)
 
-    job_file_path = os.path.join(job_dir, 'corenlp_chunk{}.job'.format(chunk_num))
+    job_file_path = os.path.join(job_dir, 'corenlp_array.job')
     with open(job_file_path, 'w') as f:
         f.write(pbs_jobfile)
 
@@ -95,12 +203,10 @@ def create_corenlp_input_files(input_files, input_dir):
 
     new_files = []
     for parform_file in input_files:
-        doi, title, body = parse_parform_file(parform_file)
-        plaintext = parform_to_plaintext(title,
-                                         body,
-                                         newlines=True,
-                                         period_following_title=True)
-        new_file_path = save_file(doi, plaintext, input_dir)
+        doi, plaintext = parform_file_to_plaintext(parform_file,
+                                                   newlines=True,
+                                                   period_following_title=True)
+        new_file_path = save_file_bytes(doi, plaintext, input_dir)
         new_files.append(new_file_path)
 
     return new_files
@@ -108,14 +214,19 @@ def create_corenlp_input_files(input_files, input_dir):
 def main(args):
     
     # ensure that `qsub` command exists on this machine...
-    shell_command_exists_or_exit('qsub')
+    if args.executor == 'pbs':
+        shell_command_exists_or_exit('qsub')
 
     # make paths absolute so that all other paths are also absolute
     args.paragraph_path = os.path.abspath(args.paragraph_path)
     args.output_directory = os.path.abspath(args.output_directory)
     args.corenlp = os.path.abspath(args.corenlp)
 
-    file_exists_or_exit(os.path.join(args.corenlp, 'corenlp.sh'))
+    if args.server:
+        args.bioshovel = os.path.abspath(args.bioshovel)
+        file_exists_or_exit(os.path.join(args.bioshovel, 'src', 'preprocess', 'corenlp_annotate.py'))
+    else:
+        file_exists_or_exit(os.path.join(args.corenlp, 'corenlp.sh'))
 
     input_dir = os.path.join(args.output_directory, 'input_files')
     job_dir = os.path.join(args.output_directory, 'job_files')
@@ -123,44 +234,80 @@ def main(args):
     for dirpath in (args.output_directory, input_dir, job_dir, output_dir):
         ensure_path_exists(dirpath)
 
-    all_files = glob(os.path.join(args.paragraph_path, '*'))
-    number_of_chunks = len(all_files)//100
+    all_files = list(iter_input_files(args.paragraph_path,
+                                       shards=parse_shards(args.shards),
+                                       listing_file=args.file_listing))
+    number_of_chunks = max(len(all_files)//args.files_per_job, 1)
     filelist_with_sublists = create_n_sublists(all_files, number_of_chunks)
-    jobs_submitted_success = 0
-    job_file_paths_failed = []
-    print('Creating {} input files in {} groups with matched job files...'.format(len(all_files),
-                                                                                  number_of_chunks))
+    print('Creating {} input files in {} groups with matched {}...'.format(len(all_files),
+                                                                         number_of_chunks,
+                                                                         'array job tasks' if args.array else 'job files'))
     if args.submit:
-        print('and submitting jobs to queue \'{}\'...'.format(args.queue))
-    for chunk_num, subfilelist in enumerate(tqdm(filelist_with_sublists)):
-        new_input_files = create_corenlp_input_files(subfilelist, input_dir)
-        new_job_file_path = create_job_file(new_input_files,
-                                            job_dir,
-                                            output_dir,
-                                            chunk_num,
-                                            args)
+        print('and {} jobs...'.format('running' if args.executor == 'local' else
+                                     'submitting to queue \'{}\''.format(args.queue)))
+    executor = get_executor(args)
+
+    if args.array:
+        # one array job, with a task for each line of the chunk manifest
+        def create_chunks():
+            # (without input files, the one sublist is empty and has no task)
+            for chunk_num, subfilelist in enumerate(tqdm(filter(None, filelist_with_sublists))):
+                new_input_files = create_corenlp_input_files(subfilelist, input_dir)
+                yield chunk_num, write_filelist(new_input_files, job_dir, chunk_num)
+
+        manifest_path = os.path.join(job_dir, 'chunk_manifest.tsv')
+        num_chunks = write_chunk_manifest(manifest_path, create_chunks())
+        if not num_chunks:
+            print('No input files found')
+            return
+
+        job_file_path = create_array_job_file(job_dir, output_dir, manifest_path, num_chunks, args)
+        print('Created PBS array job file {} for {} chunks'.format(job_file_path, num_chunks))
+
         if args.submit:
-            result = submit_pbs_job(new_job_file_path, queue=args.queue)
-            if result:
-                jobs_submitted_success += 1
-            else:
-                job_file_paths_failed.append(new_job_file_path)
+            executor.submit(job_file_path)
+    else:
+        for chunk_num, subfilelist in enumerate(tqdm(filelist_with_sublists)):
+            new_input_files = create_corenlp_input_files(subfilelist, input_dir)
+            new_job_file_path = create_job_file(new_input_files,
+                                                job_dir,
+                                                output_dir,
+                                                chunk_num,
+                                                args)
+            if args.submit:
+                executor.submit(new_job_file_path)
 
-    print('Created {} PBS job files in {}'.format(chunk_num+1, job_dir))
+        print('Created {} PBS job files in {}'.format(chunk_num+1, job_dir))
 
     if args.submit:
-        print('Successfully submitted {} jobs with {} failed submissions'.format(jobs_submitted_success,
-                                                                                 len(job_file_paths_failed)))
-        for path in job_file_paths_failed:
-            print('FAILED TO SUBMIT', path)
+        results = executor.wait()
+        print_job_summary(results)
+        # (so that a pipeline job running prep_corenlp fails too, see preprocess.pipeline)
+        if any(r.status for r in results):
+            sys.exit(1)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Set up files to run Stanford CoreNLP parser on a directory of paragraph-formatted files')
-    parser.add_argument('paragraph_path', help='Directory of parsed paragraph files')
+    parser.add_argument('paragraph_path', help='Directory of parsed paragraph files (or a file listing their paths, one per line)')
     parser.add_argument('output_directory', help='Final output directory')
     parser.add_argument('--corenlp', help='Absolute path for CoreNLP (specifically, where corenlp.sh is located)', default=os.getcwd())
-    parser.add_argument('--queue', help='Cluster queue for job submission', default='new')
-    parser.add_argument('--submit', help='Submit jobs after creating job files', action='store_true')
+    add_executor_arguments(parser)
+    add_corpus_arguments(parser)
+    parser.add_argument('--submit', help='Submit (or with --executor local, run) jobs after creating job files', action='store_true')
+    parser.add_argument('--files_per_job', type=int, default=100,
+                        help='Approximate number of files annotated by each job (default 100)')
+    parser.add_argument('--server', action='store_true',
+                        help='Annotate files with persistent CoreNLP servers (preprocess.corenlp_annotate) '
+                             'instead of corenlp.sh, loading models once per job')
+    parser.add_argument('--servers', type=int, default=1,
+                        help='With --server, number of CoreNLP servers per job (default 1)')
+    parser.add_argument('--bioshovel', help='With --server, path to bioshovel directory (with venv)',
+                        default=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    parser.add_argument('--array', action='store_true',
+                        help='Create (and submit) a single PBS array job with one task per chunk, '
+                             'instead of one job per chunk')
+    parser.add_argument('--max_running', type=int,
+                        help='With --array, maximum number of array tasks running at once')
     args = parser.parse_args()
     main(args)
\ No newline at end of file
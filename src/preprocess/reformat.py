@@ -2,8 +2,14 @@
 
 # functions for reformatting text file formats
 
+import mmap
 import os
 import re
+from contextlib import contextmanager
+from itertools import chain
+
+# label of a parform line, removed by parform_to_plaintext()
+WORD_REGEX = re.compile(rb'\w+')
 
 def parse_parform_file(parsed_article_path):
 
@@ -202,4 +208,203 @@ def pubtator_to_parform(title_line, abstract_text, newlines=False):
         parform_title += '\n'
         parform_abs += '\n'
 
-    return (abs_id, (parform_title, parform_abs))
\ No newline at end of file
+    return (abs_id, (parform_title, parform_abs))
+
+@contextmanager
+def map_file(file_path):
+
+    ''' Context manager that memory-maps the file at file_path (read-only)
+        and yields the map (an empty bytes object for an empty file, which
+        can't be mapped)
+    '''
+
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield buf
+
+def iter_parform_lines(buf, start=0, end=None):
+
+    ''' Yields (line_start, tab_index, line_end) offsets for each line of
+        the parform document in buf[start:end] (a bytes-like object that
+        supports find(), e.g. a memory map), without copying any data
+
+        line_end is the offset of the line's newline (or end), and tab_index
+        is the offset of the line's first tab (-1 if there is none)
+    '''
+
+    if end is None:
+        end = len(buf)
+
+    while start < end:
+        line_end = buf.find(b'\n', start, end)
+        if line_end == -1:
+            line_end = end
+        yield start, buf.find(b'\t', start, line_end), line_end
+        start = line_end + 1
+
+def parform_buffer_to_pubtator(escaped_doi, buf, start=0, end=None):
+
+    ''' Converts the parform document in buf[start:end] (see
+        iter_parform_lines()) to PubTator format, without making a copy of
+        each line
+
+        Returns the same output as
+        parform_to_pubtator(*parse_parform_file(file_path)), but with the file
+        lines joined into one bytes object: (escaped_doi, file_bytes)
+
+        (returns None if the first line isn't a title line)
+    '''
+
+    view = memoryview(buf)
+
+    def without_pipes(a, b):
+        # replace any pipe characters - they interfere with some pubtator tools
+        if buf.find(b'|', a, b) == -1:
+            return view[a:b]
+        return bytes(view[a:b]).replace(b'|', b'')
+
+    def first_field(tab, line_end):
+        # the text between the line's first and second tabs
+        field_end = buf.find(b'\t', tab+1, line_end)
+        return tab+1, field_end if field_end != -1 else line_end
+
+    lines = iter_parform_lines(buf, start, end)
+    title = next(lines, None)
+    if title is None or view[title[0]:title[0]+5] != b'title':
+        print('Not a title line...')
+        return None
+
+    doi = escaped_doi.encode('utf-8')
+    article_title = bytes(view[slice(*first_field(title[1], title[2]))])
+    out = []
+
+    # if there is an abstract line, treat it separately
+    first_line = next(lines, None)
+    if first_line is not None:
+        line_start, tab, line_end = first_line
+        if tab != -1 and without_pipes(line_start, tab) == b'abs':
+            out.extend((doi, b'_a|t|', article_title, b'\n',
+                        doi, b'_a|a|', without_pipes(*first_field(tab, line_end)), b'\n\n'))
+        else:
+            lines = chain([first_line], lines)
+
+    # everything but the paragraph number and content is the same for each
+    # paragraph, so format each one from a template
+    escape = lambda s: s.replace(b'%', b'%%')
+    paragraph_template = (escape(doi) + b'_%d|t|' + escape(article_title) + b'\n' +
+                          escape(doi) + b'_%d|a|%b\n\n')
+
+    for line_num, (line_start, tab, line_end) in enumerate(lines, 1):
+        # allows for tabs in the paragraph content...
+        content = without_pipes(tab+1, line_end) if tab != -1 else b''
+        out.append(paragraph_template % (line_num, line_num, content))
+
+    return escaped_doi, b''.join(out)
+
+def parform_buffer_to_plaintext(buf, start=0, end=None,
+                                newlines=False, period_following_title=False):
+
+    ''' Converts the parform document in buf[start:end] (see
+        iter_parform_lines()) to plaintext, without making a copy of each
+        line
+
+        Returns the same output as parform_to_plaintext(title_line, body, ...)
+        with its lines joined into one bytes object
+    '''
+
+    view = memoryview(buf)
+    separator = b'\n\n' if newlines else b'\n'
+    out = []
+
+    def without_pipes(a, b):
+        if buf.find(b'|', a, b) == -1:
+            return view[a:b]
+        return bytes(view[a:b]).replace(b'|', b'')
+
+    lines = iter_parform_lines(buf, start, end)
+    title = next(lines, None)
+    if title is not None:
+        line_start, tab, line_end = title
+        title_end = buf.find(b'\t', tab+1, line_end)
+        article_title = bytes(view[tab+1:title_end if title_end != -1 else line_end])
+        if period_following_title and not article_title.endswith(b'.'):
+            article_title += b'.' # to help CoreNLP split title from paragraph 1
+        out.append(article_title + separator)
+
+    for line_start, tab, line_end in lines:
+        # strip the line's label (pipes are removed first, like
+        # parform_to_plaintext())
+        if tab != -1 and WORD_REGEX.fullmatch(without_pipes(line_start, tab)):
+            out.append(without_pipes(tab+1, line_end))
+        else:
+            out.append(without_pipes(line_start, line_end))
+        out.append(separator)
+
+    return b''.join(out)
+
+def parform_file_to_pubtator(parsed_article_path):
+
+    ''' Memory-mapped equivalent of
+        parform_to_pubtator(*parse_parform_file(parsed_article_path))
+
+        Returns (escaped_doi, file_bytes), or None if the file has no title line
+    '''
+
+    with map_file(parsed_article_path) as buf:
+        return parform_buffer_to_pubtator(os.path.basename(parsed_article_path), buf)
+
+def parform_file_to_plaintext(parsed_article_path, **kwargs):
+
+    ''' Memory-mapped equivalent of parform_to_plaintext() for the file at
+        parsed_article_path (kwargs are passed to parform_buffer_to_plaintext())
+
+        Returns (escaped_doi, file_bytes)
+    '''
+
+    with map_file(parsed_article_path) as buf:
+        return (os.path.basename(parsed_article_path),
+                parform_buffer_to_plaintext(buf, **kwargs))
+
+def pack_parform_files(file_paths, pack_path):
+
+    ''' Concatenates parform files into a single pack file at pack_path, with
+        an index at pack_path+'.idx' of one line per document:
+
+        escaped_doi\toffset\tlength
+
+        (for reading many small documents from one memory map, see
+        iter_packed_parform())
+
+        Returns the number of documents packed
+    '''
+
+    offset = 0
+    count = 0
+    with open(pack_path, 'wb') as pack, open(pack_path+'.idx', 'w') as index:
+        for file_path in file_paths:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            pack.write(data)
+            index.write('{}\t{}\t{}\n'.format(os.path.basename(file_path), offset, len(data)))
+            offset += len(data)
+            count += 1
+
+    return count
+
+def iter_packed_parform(pack_path):
+
+    ''' Yields (escaped_doi, buf, start, end) for each document in a pack
+        file created by pack_parform_files(), where buf is a memory map of the
+        whole pack file and the document is buf[start:end]
+
+        (buf is only valid until the generator is exhausted or closed)
+    '''
+
+    with open(pack_path+'.idx') as index, map_file(pack_path) as buf:
+        for line in index:
+            escaped_doi, offset, length = line.rstrip('\n').split('\t')
+            start = int(offset)
+            yield escaped_doi, buf, start, start+int(length)
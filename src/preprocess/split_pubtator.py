@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+'''split_pubtator.py
+
+Splits the PubTator bioconcepts2pubtator_offsets download file by PMID, into
+a directory of files that each hold the records of one range of PMIDs, named
+by the first PMID of the range (zero-padded)
+
+preprocess.create_pubtator_subset reads such a directory in place of the
+bioconcepts file, and then only reads the files that cover the PMIDs of its
+subset (see create_pubtator_subset.get_split_files()), so many subsets (like
+the chunks of preprocess.pipeline) cost one pass through the multi-GB
+bioconcepts file instead of one each
+
+usage:
+cd bioshovel/src # this is the parent directory of this script file
+python3 -m preprocess.split_pubtator [bioconcepts2pubtator_offsets] [output_directory]
+'''
+
+import argparse
+import os
+import shutil
+from tqdm import tqdm
+
+from preprocess.create_pubtator_subset import produce_records
+from preprocess.util import file_exists_or_exit
+
+def get_split_file_name(pmid, pmids_per_file):
+    return '{0:0>9}'.format(pmid - pmid % pmids_per_file)
+
+def split_records(records, output_directory, pmids_per_file=1000000):
+
+    ''' Writes records (see create_pubtator_subset.produce_records()) to files
+        in output_directory by PMID, pmids_per_file PMIDs per file (records
+        without a numeric PMID are skipped)
+
+        The files are written in a temporary directory that replaces
+        output_directory once all records are written, so a split directory
+        is always complete
+
+        Returns the number of records written
+    '''
+
+    part_directory = output_directory+'.part'
+    if os.path.isdir(part_directory):
+        # (left by an interrupted split)
+        shutil.rmtree(part_directory)
+    os.makedirs(part_directory)
+
+    split_files = {}
+    count = 0
+    try:
+        for record in records:
+            try:
+                pmid = int(record[0].split('|')[0])
+            except (IndexError, ValueError):
+                continue
+            file_name = get_split_file_name(pmid, pmids_per_file)
+            if file_name not in split_files:
+                split_files[file_name] = open(os.path.join(part_directory, file_name), 'w')
+            split_files[file_name].write('\n'.join(record)+'\n\n')
+            count += 1
+    finally:
+        for f in split_files.values():
+            f.close()
+
+    if os.path.isdir(output_directory):
+        shutil.rmtree(output_directory)
+    os.replace(part_directory, output_directory)
+
+    return count
+
+def main(args):
+
+    file_exists_or_exit(args.bioconcepts_file)
+    count = split_records(tqdm(produce_records(args.bioconcepts_file), disable=args.notqdm),
+                          args.output_directory,
+                          args.pmids_per_file)
+    print('Split {} records into {} files in {}'.format(count,
+                                                         len(os.listdir(args.output_directory)),
+                                                         args.output_directory))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Split the PubTator offsets download into files by PMID range, '
+                                                 'for preprocess.create_pubtator_subset')
+    parser.add_argument('bioconcepts_file', help='PubTator bioconcepts2pubtator_offsets download file')
+    parser.add_argument('output_directory', help='Output directory for the split files')
+    parser.add_argument('--pmids_per_file', type=int, default=1000000,
+                        help='Size of the PMID range of each file (default 1000000)')
+    parser.add_argument('--notqdm', help='Disable tqdm progress bar output', action='store_true')
+    args = parser.parse_args()
+    main(args)
@@ -7,11 +7,8 @@ import logging
 import multiprocessing as mp
 import os
 import psutil
-import shutil
 import subprocess
 import sys
-from glob import iglob
-from pathlib import Path
 from tqdm import tqdm
 
 def save_file(file_name, file_info, directory):
@@ -29,6 +26,20 @@ def save_file(file_name, file_info, directory):
 
     return new_file_path
 
+def save_file_bytes(file_name, file_bytes, directory):
+
+    ''' Saves file_bytes (the whole file contents, e.g. from
+        reformat.parform_file_to_pubtator()) to a new file in directory
+
+        Return path to new file
+    '''
+
+    new_file_path = os.path.join(directory, file_name)
+    with open(new_file_path, 'wb') as f:
+        f.write(file_bytes)
+
+    return new_file_path
+
 def create_n_sublists(full_list, n=10):
 
     ''' Returns a list of n sublists generated from full_list using stride of n
@@ -94,50 +105,247 @@ def ensure_path_exists(path):
     if not os.path.isdir(path):
         os.makedirs(path)
 
+def make_subdirectories(directory, num_files, max_files):
+
+    ''' Creates the numbered subdirectories (0000, 0001, ...) of directory
+        needed for num_files files, with no more than max_files files each
+
+        Returns a list of the subdirectory paths
+    '''
+
+    subdirs = [os.path.join(directory, '{0:0>4}'.format(subdir_num))
+               for subdir_num in range((num_files+max_files-1)//max_files)]
+    for subdir in subdirs:
+        os.makedirs(subdir, exist_ok=True)
+
+    return subdirs
+
 def reorganize_directory(file_path, max_files_per_subdir=1000, quiet=True):
 
     ''' Reorganize a single directory with no subdirectories and a large number
         of files into a number of subdirectories containing those files, with
         no more than max_files_per_subdir files per subdirectory
+
+        (the directory is listed once, all subdirectories are created up front
+        and files are moved with os.rename, since they stay on the same
+        filesystem)
     '''
 
-    # count files using generator and sum in case the directory has a massive
-    # number of files...
-    total_files_in_dir = sum(1 for file_path in iglob(os.path.join(file_path,'*')))
+    file_names = sorted(entry.name for entry in os.scandir(file_path)
+                        if not entry.name.startswith('.') and not entry.is_dir())
 
-    if total_files_in_dir > max_files_per_subdir:
+    if len(file_names) > max_files_per_subdir:
         if not quiet:
             print('Reorganizing output files into batches of {}...'.format(max_files_per_subdir))
-        for file_num, file_path in enumerate(tqdm(iglob(os.path.join(file_path,'*')),
-                                                  total=total_files_in_dir,
-                                                  disable=quiet)):
-            if file_num % max_files_per_subdir == 0:
-                # every n files, create new subdirectory and update current_subdir
-                subdir_name = '{0:0>4}'.format(file_num//max_files_per_subdir)
-                path = Path(file_path)
-                new_dir = path.parent / subdir_name
-                new_dir.mkdir()
-                current_subdir = str(new_dir)
-            shutil.move(file_path, current_subdir)
+        subdirs = make_subdirectories(file_path, len(file_names), max_files_per_subdir)
+        for file_num, file_name in enumerate(tqdm(file_names, disable=quiet)):
+            os.rename(os.path.join(file_path, file_name),
+                      os.path.join(subdirs[file_num//max_files_per_subdir], file_name))
         if not quiet:
             print('Done reorganizing files into subdirectories')
 
+def scandir_files(path, recursive=True, shards=None):
+
+    ''' Yields an os.DirEntry for each file in the directory tree at path,
+        in sorted order (reads each directory once with os.scandir, and uses
+        the file types from the listing instead of stat-ing every path like
+        Path.glob('**/*'))
+
+        Hidden files and directories are skipped (like glob). With
+        recursive=False, only yields files directly in path. With shards (a
+        collection of subdirectory names of path), only yields files in those
+        subdirectories
+    '''
+
+    for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+        if entry.name.startswith('.'):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            if recursive and (shards is None or entry.name in shards):
+                yield from scandir_files(entry.path)
+        elif shards is None and entry.is_file():
+            yield entry
+
+def parse_shards(shards_spec):
+
+    ''' Returns the set of shard (subdirectory) names in shards_spec, a
+        comma-separated list of names or ranges of numbered names, e.g.
+        '0000,0003-0005' (or None if shards_spec is empty)
+    '''
+
+    if not shards_spec:
+        return None
+
+    shards = set()
+    for part in shards_spec.split(','):
+        first, _, last = part.strip().partition('-')
+        if last and first.isdigit() and last.isdigit():
+            shards.update('{0:0>{1}}'.format(n, len(first))
+                          for n in range(int(first), int(last)+1))
+        else:
+            shards.add(part.strip())
+
+    return shards
+
+def get_listing_header(path, recursive):
+
+    ''' Returns the first line of a listing of the directory tree at path
+        (see iter_corpus_files()), which records what the listing is of
+    '''
+
+    return '# file listing: root={} recursive={}\n'.format(os.path.abspath(path), recursive)
+
+def listing_is_current(listing_file, path, recursive):
+
+    ''' Returns True if listing_file (see iter_corpus_files()) is a listing
+        of the directory tree at path that is newer than every directory in
+        the tree, so no files have been added or removed since (a file is
+        added or removed by changing its directory's mtime), or False if it
+        has to be saved again
+
+        Raises ValueError if listing_file is a listing of another directory
+        tree (or of the same one, with another recursive flag)
+    '''
+
+    with open(listing_file) as f:
+        header = f.readline()
+        if not header.startswith('# file listing: '):
+            # (incomplete, or not a listing)
+            return False
+        if header != get_listing_header(path, recursive):
+            raise ValueError('File listing {} is not a listing of {} (recursive={}): {}'.format(listing_file,
+                                                                                               os.path.abspath(path),
+                                                                                               recursive,
+                                                                                               header.strip()))
+
+        # the root, every shard (even one without files) and every
+        # directory of a listed file
+        directories = {''}
+        directories.update(entry.name for entry in os.scandir(path)
+                           if recursive and not entry.name.startswith('.') and
+                           entry.is_dir(follow_symlinks=False))
+        for line in f:
+            directory = os.path.dirname(line.rstrip('\n'))
+            while directory not in directories:
+                directories.add(directory)
+                directory = os.path.dirname(directory)
+
+    listing_mtime = os.path.getmtime(listing_file)
+    try:
+        return all(os.path.getmtime(os.path.join(path, directory)) <= listing_mtime
+                   for directory in directories)
+    except FileNotFoundError:
+        # (a directory was removed)
+        return False
+
+def iter_corpus_files(path, recursive=True, shards=None, listing_file=None):
+
+    ''' Yields the paths of the files in the directory tree at path, lazily
+        (see scandir_files() for recursive and shards)
+
+        With listing_file, the paths are read from that cached listing of the
+        directory tree instead, if it is current (see listing_is_current()),
+        or otherwise saved to it (once all paths have been yielded, so a
+        listing is always complete). A listing is only saved for the whole
+        tree (shards=None), but shards are filtered from it when read
+
+        A listing starts with a header line with the absolute path of the
+        directory tree and recursive, and it can't be read (ValueError) for
+        another directory tree
+    '''
+
+    prefix = os.path.join(path, '')
+    if listing_file and os.path.isfile(listing_file) and \
+       listing_is_current(listing_file, path, recursive):
+        with open(listing_file) as f:
+            next(f)
+            for line in f:
+                relative_path = line.rstrip('\n')
+                if shards is None or relative_path.split(os.sep, 1)[0] in shards:
+                    yield prefix+relative_path
+        return
+
+    listing = None
+    if listing_file and shards is None:
+        listing = open(listing_file+'.part', 'w')
+        listing.write(get_listing_header(path, recursive))
+
+    try:
+        for entry in scandir_files(path, recursive=recursive, shards=shards):
+            if listing:
+                listing.write(entry.path[len(prefix):]+'\n')
+            yield entry.path
+    except BaseException:
+        # (including GeneratorExit, if not all paths were read)
+        if listing:
+            listing.close()
+            os.remove(listing_file+'.part')
+        raise
+
+    if listing:
+        listing.close()
+        os.replace(listing_file+'.part', listing_file)
+
+def add_corpus_arguments(parser):
+
+    ''' Adds --shards and --file_listing arguments to an argparse parser,
+        for iter_corpus_files()
+    '''
+
+    parser.add_argument('--shards',
+                        help='Only read input files in these subdirectories (shards) of the input directory, '
+                             'e.g. 0000,0003-0005')
+    parser.add_argument('--file_listing',
+                        help='Cached listing of input files, read if up to date or saved otherwise '
+                             '(so a huge input directory is only walked once); only for this input directory')
+
 def create_sublist_symlinks(sublist, input_dir, max_files=1000):
 
     ''' Given an input directory input_dir and a list of absolute file paths 
         sublist, create symlinks for all files in sublist in input_dir, with no
         more than max_files files per subdirectory of input_dir
+
+        (None values in sublist, from create_sublists_sized_n(), are skipped)
     '''
 
-    for file_num, file_path in enumerate(sublist):
-        if not file_path:
-            continue
-        if file_num % max_files == 0:
-            subdir_name = '{0:0>4}'.format(file_num//max_files)
-            current_subdir = os.path.join(input_dir, subdir_name)
-            ensure_path_exists(current_subdir)
+    file_paths = [file_path for file_path in sublist if file_path]
+    subdirs = make_subdirectories(input_dir, len(file_paths), max_files)
+    for file_num, file_path in enumerate(file_paths):
+        os.symlink(file_path, os.path.join(subdirs[file_num//max_files],
+                                           os.path.basename(file_path)))
+
+def write_file_list(sublist, file_list_path):
+
+    ''' Writes the file paths in sublist to file_list_path, one per line
+        (None values are skipped), for use in place of a directory of
+        symlinks (see create_sublist_symlinks() and iter_input_files())
+
+        Returns the number of paths written
+    '''
+
+    count = 0
+    with open(file_list_path, 'w') as f:
+        for file_path in sublist:
+            if file_path:
+                f.write(file_path+'\n')
+                count += 1
 
-        subprocess.check_call(['ln', '-s', file_path, '.'], cwd=current_subdir)
+    return count
+
+def iter_input_files(path, shards=None, listing_file=None):
+
+    ''' Yields the paths of the input files at path: either a directory tree
+        (see iter_corpus_files()), or a file list (one path per line, see
+        write_file_list())
+    '''
+
+    if os.path.isfile(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield line.rstrip('\n')
+    else:
+        yield from iter_corpus_files(path, shards=shards, listing_file=listing_file)
 
 def calc_dnorm_num_processes(num_cores=mp.cpu_count(), ram_gb=None):
 
@@ -160,10 +368,13 @@ def get_file_lines_set(file_path_str, typecast=None):
         with trailing newline characters stripped
 
         typecast argument can be int, str, float, etc.
+
+        (for large files of PMIDs, preprocess.pmid_set.PMIDSet uses a
+        fraction of the memory)
     '''
 
     if not typecast:
         typecast = str
 
     with open(file_path_str) as f:
-        return set(typecast(line.rstrip('\n')) for line in f.readlines())
\ No newline at end of file
+        return set(typecast(line.rstrip('\n')) for line in f)
\ No newline at end of file
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+''' Tests for PBS job file execution backends:
+
+    preprocess.cluster.executors
+
+    (PBS submission runs against a fake `qsub` command)
+'''
+
+import argparse
+import os
+import stat
+import tempfile
+import textwrap
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from preprocess import prep_corenlp
+from preprocess.cluster import executors
+
+def write_script(path, contents):
+    with open(path, 'w') as f:
+        f.write(textwrap.dedent(contents).lstrip('\n'))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+class ExecutorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.job_dir = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def job_file(self, name, body):
+        return write_script(os.path.join(self.job_dir, name), '#!/bin/bash\n'+textwrap.dedent(body))
+
+class LocalExecutorTests(ExecutorTestCase):
+
+    def test_jobs_run_with_exit_status_timings_and_output(self):
+        ok = self.job_file('ok.job', '''
+            echo "running in $(pwd)"
+            ''')
+        failing = self.job_file('failing.job', '''
+            exit 3
+            ''')
+
+        executor = executors.LocalExecutor(max_jobs=2)
+        job_ids = [executor.submit(ok), executor.submit(failing)]
+        results = executor.wait()
+
+        self.assertEqual(job_ids, ['local1', 'local2'])
+        self.assertEqual([(r.job_file_path, r.status) for r in results], [(ok, 0), (failing, 3)])
+        self.assertTrue(all(r.seconds >= 0 for r in results))
+        with open(results[0].log_path) as f:
+            self.assertEqual(f.read(), 'running in {}\n'.format(os.path.realpath(self.job_dir)))
+
+    def test_array_job_runs_each_task(self):
+        array_job = self.job_file('array.job', '''
+            #PBS -t 0-3%2
+            echo $PBS_ARRAYID > task_$PBS_ARRAYID.done
+            ''')
+
+        executor = executors.LocalExecutor(max_jobs=4)
+        self.assertEqual(executor.submit(array_job), 'local1[]')
+        results = executor.wait()
+
+        self.assertEqual([(r.task, r.status) for r in results], [(0, 0), (1, 0), (2, 0), (3, 0)])
+        self.assertEqual(sorted(f for f in os.listdir(self.job_dir) if f.endswith('.done')),
+                         ['task_{}.done'.format(i) for i in range(4)])
+
+    def test_concurrency_is_limited(self):
+
+        ''' each job records how many jobs were running when it started
+        '''
+
+        job_files = [self.job_file('job{}.job'.format(i), '''
+            touch running_{0}
+            ls running_* | wc -l > count_{0}
+            sleep 0.2
+            rm running_{0}
+            '''.format(i)) for i in range(6)]
+
+        executor = executors.LocalExecutor(max_jobs=2)
+        for job_file in job_files:
+            executor.submit(job_file)
+        results = executor.wait()
+
+        self.assertTrue(all(r.status == 0 for r in results))
+        counts = []
+        for i in range(6):
+            with open(os.path.join(self.job_dir, 'count_{}'.format(i))) as f:
+                counts.append(int(f.read()))
+        self.assertLessEqual(max(counts), 2)
+
+    def test_non_array_job_has_single_task(self):
+        self.assertEqual(executors.get_array_tasks(self.job_file('single.job', 'echo 1\n')), [None])
+
+class PBSExecutorTests(ExecutorTestCase):
+
+    def setUp(self):
+        super().setUp()
+        bin_dir = os.path.join(self.tmpdir.name, 'bin')
+        os.makedirs(bin_dir)
+        # fake qsub: records its arguments and prints a job ID
+        write_script(os.path.join(bin_dir, 'qsub'), '''
+            #!/bin/bash
+            echo "$@" >> {}
+            echo 1234.cluster
+            '''.format(os.path.join(self.tmpdir.name, 'qsub_calls')))
+        self.path_patch = mock.patch.dict(os.environ,
+                                          {'PATH': bin_dir+os.pathsep+os.environ['PATH']})
+        self.path_patch.start()
+
+    def tearDown(self):
+        self.path_patch.stop()
+        super().tearDown()
+
+    def test_jobs_are_submitted_with_qsub(self):
+        job_file = self.job_file('a.job', 'echo 1\n')
+        executor = executors.PBSExecutor(queue='workq')
+        self.assertEqual(executor.submit(job_file), '1234')
+
+        results = executor.wait()
+        self.assertEqual(results, [executors.JobResult(job_file, '1234', None, None, None, None)])
+        with open(os.path.join(self.tmpdir.name, 'qsub_calls')) as f:
+            self.assertEqual(f.read(), '-q workq a.job\n')
+
+class GetExecutorTests(unittest.TestCase):
+
+    def parse(self, argv):
+        parser = argparse.ArgumentParser()
+        executors.add_executor_arguments(parser)
+        return executors.get_executor(parser.parse_args(argv))
+
+    def test_default_executor_is_pbs(self):
+        executor = self.parse([])
+        self.assertIsInstance(executor, executors.PBSExecutor)
+        self.assertEqual(executor.queue, 'new')
+
+    def test_local_executor(self):
+        executor = self.parse(['--executor', 'local', '--max_jobs', '3'])
+        self.assertIsInstance(executor, executors.LocalExecutor)
+        self.assertEqual(executor.pool._max_workers, 3)
+        executor.wait()
+
+class PrepCoreNLPLocalRunTests(ExecutorTestCase):
+
+    ''' runs preprocess.prep_corenlp end to end with the local executor and a
+        fake corenlp.sh (which writes [input filename].json for each file in
+        its -filelist)
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.corenlp_dir = os.path.join(self.tmpdir.name, 'corenlp')
+        self.paragraph_dir = os.path.join(self.tmpdir.name, 'paragraphs')
+        self.output_directory = os.path.join(self.tmpdir.name, 'corenlp_output')
+        os.makedirs(self.corenlp_dir)
+        os.makedirs(self.paragraph_dir)
+
+        write_script(os.path.join(self.corenlp_dir, 'corenlp.sh'), '''
+            #!/bin/bash
+            while [ $# -gt 0 ]; do
+              case "$1" in
+                -outputDirectory) OUTPUT_DIR="$2"; shift;;
+                -filelist) FILELIST="$2"; shift;;
+              esac
+              shift
+            done
+            while read -r f; do
+              echo '{"sentences": []}' > "$OUTPUT_DIR/$(basename "$f").json"
+            done < "$FILELIST"
+            ''')
+
+        for i in range(6):
+            with open(os.path.join(self.paragraph_dir, '1000{}'.format(i)), 'w') as f:
+                f.write('title\tTitle {}\np\tParagraph.\n'.format(i))
+
+    def run_prep_corenlp(self, array):
+        args = argparse.Namespace(paragraph_path=self.paragraph_dir,
+                                  output_directory=self.output_directory,
+                                  corenlp=self.corenlp_dir,
+                                  executor='local', queue='new', max_jobs=2,
+                                  submit=True, files_per_job=2, server=False,
+                                  servers=1, bioshovel=None, array=array,
+                                  max_running=None, shards=None, file_listing=None)
+        out = StringIO()
+        with redirect_stdout(out), mock.patch('sys.stderr', new=StringIO()):
+            prep_corenlp.main(args)
+        return out.getvalue()
+
+    def assertAllAnnotated(self, out):
+        self.assertEqual(sorted(os.listdir(os.path.join(self.output_directory, 'output_files'))),
+                         ['1000{}.json'.format(i) for i in range(6)])
+        self.assertIn('3 jobs (or array tasks) finished, 0 failed', out)
+
+    def test_jobs_run_locally(self):
+        out = self.run_prep_corenlp(array=False)
+        self.assertAllAnnotated(out)
+        self.assertIn('Successfully submitted 3 jobs', out)
+
+    def test_array_job_runs_locally(self):
+        out = self.run_prep_corenlp(array=True)
+        self.assertAllAnnotated(out)
+        self.assertIn('Successfully submitted 1 jobs', out)
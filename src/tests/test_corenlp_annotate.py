@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+''' Tests for the CoreNLP server-mode annotator:
+
+    preprocess.corenlp_annotate
+
+    (runs against local mock CoreNLP servers)
+'''
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from collections import Counter
+from http.server import (BaseHTTPRequestHandler,
+                         ThreadingHTTPServer)
+
+from preprocess import (corenlp_annotate,
+                        prep_corenlp)
+
+class MockCoreNLPServer(object):
+
+    ''' HTTP server in a background thread that answers CoreNLP annotation
+        requests (POST /?properties=...) with one JSON "sentence" per line of
+        the request text
+
+        Set self.fail_first to answer that many requests with a 500 first, or
+        self.always_fail to answer every request with a 500
+
+        self.requests counts requests, self.max_in_flight records the most
+        concurrent requests seen
+    '''
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.fail_first = 0
+        self.always_fail = False
+        self.requests = 0
+        self.properties = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        mock = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                mock.handle(self)
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+
+    def handle(self, request):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.always_fail or self.requests <= self.fail_first
+
+        try:
+            text = request.rfile.read(int(request.headers['Content-Length'])).decode('utf-8')
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(request.path).query)
+            self.properties.append(json.loads(query['properties'][0]))
+            time.sleep(self.delay)
+
+            if fail:
+                request.send_response(500)
+                request.end_headers()
+                return
+
+            sentences = [{'index': i,
+                          'tokens': [{'index': j+1, 'word': word, 'lemma': word.lower(),
+                                      'pos': 'NN', 'ner': 'O'}
+                                     for j, word in enumerate(line.split())]}
+                         for i, line in enumerate(l for l in text.split('\n') if l.strip())]
+            body = json.dumps({'sentences': sentences}).encode('utf-8')
+
+            request.send_response(200)
+            request.send_header('Content-Type', 'application/json')
+            request.send_header('Content-Length', str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+class CoreNLPAnnotateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = [MockCoreNLPServer(), MockCoreNLPServer()]
+        for server in self.servers:
+            server.start()
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmpdir.name, 'input_files')
+        self.output_dir = os.path.join(self.tmpdir.name, 'output_files')
+        os.makedirs(self.input_dir)
+
+        self.input_files = []
+        for i in range(10):
+            file_path = os.path.join(self.input_dir, '1000{}'.format(i))
+            with open(file_path, 'w') as f:
+                f.write('Title {}.\n\nFirst paragraph of article {}.\n\n'.format(i, i))
+            self.input_files.append(file_path)
+
+        # silence expected annotation failure messages
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        for server in self.servers:
+            server.stop()
+        self.tmpdir.cleanup()
+
+    def annotate(self, **kwargs):
+        kwargs.setdefault('retry_wait', 0.01)
+        return corenlp_annotate.annotate_files(self.input_files,
+                                               self.output_dir,
+                                               [server.url for server in self.servers],
+                                               quiet=True,
+                                               **kwargs)
+
+    def test_output_has_load_sentences_layout(self):
+        stats = self.annotate()
+        self.assertEqual(stats['annotated'], 10)
+
+        # [output_dir]/[input filename].json, like corenlp.sh -outputDirectory
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         sorted(os.path.basename(f)+'.json' for f in self.input_files))
+        with open(os.path.join(self.output_dir, '10003.json')) as f:
+            output = json.load(f, strict=False)
+        self.assertEqual([token['word'] for token in output['sentences'][1]['tokens']],
+                         ['First', 'paragraph', 'of', 'article', '3.'])
+
+    def test_requests_ask_for_json_and_annotators(self):
+        self.annotate(annotators='tokenize,ssplit')
+        properties = self.servers[0].properties[0]
+        self.assertEqual(properties, {'annotators': 'tokenize,ssplit',
+                                      'outputFormat': 'json'})
+
+    def test_requests_are_shared_between_servers(self):
+        self.annotate()
+        self.assertEqual([server.requests for server in self.servers], [5, 5])
+
+    def test_concurrency_is_bounded(self):
+        server = self.servers[0]
+        server.delay = 0.05
+        corenlp_annotate.annotate_files(self.input_files, self.output_dir, [server.url],
+                                        concurrency=3, quiet=True)
+        self.assertEqual(server.requests, 10)
+        self.assertEqual(server.max_in_flight, 3)
+
+    def test_existing_output_is_skipped(self):
+        self.annotate()
+        stats = self.annotate()
+        self.assertEqual(stats, Counter(skipped=10))
+        self.assertEqual(sum(server.requests for server in self.servers), 10)
+
+    def test_failed_request_is_retried(self):
+        self.servers[0].fail_first = 1
+        stats = self.annotate()
+        self.assertEqual(stats['annotated'], 10)
+        self.assertEqual(self.servers[0].requests, 6)
+
+    def test_failed_files_have_no_output(self):
+        self.servers[1].always_fail = True
+        stats = self.annotate(retries=1)
+        self.assertEqual(stats, Counter(annotated=5, failed=5))
+        self.assertEqual(self.servers[1].requests, 10)
+        self.assertEqual(len(os.listdir(self.output_dir)), 5)
+
+class CoreNLPServerTests(unittest.TestCase):
+
+    def test_server_command_preloads_annotators(self):
+        server = corenlp_annotate.CoreNLPServer('/opt/corenlp', port=9001, threads=2)
+        command = server.get_command()
+        self.assertIn('edu.stanford.nlp.pipeline.StanfordCoreNLPServer', command)
+        self.assertEqual(command[command.index('-port')+1], '9001')
+        self.assertEqual(command[command.index('-preload')+1], corenlp_annotate.DEFAULT_ANNOTATORS)
+        self.assertEqual(server.url, 'http://localhost:9001')
+
+    def test_server_is_started_and_stopped(self):
+
+        ''' runs a plain HTTP server in place of CoreNLP
+            (it answers /ready with a 404, like older CoreNLP servers)
+        '''
+
+        class StubServer(corenlp_annotate.CoreNLPServer):
+            def get_command(self):
+                return [sys.executable, '-m', 'http.server', str(self.port), '--bind', '127.0.0.1']
+
+            @property
+            def url(self):
+                return 'http://127.0.0.1:{}'.format(self.port)
+
+        server = StubServer(None, port=corenlp_annotate.get_free_port())
+        with server:
+            self.assertTrue(corenlp_annotate.server_is_ready(server.url))
+        self.assertIsNotNone(server.process.poll())
+
+    def test_server_that_exits_raises(self):
+
+        class ExitingServer(corenlp_annotate.CoreNLPServer):
+            def get_command(self):
+                return [sys.executable, '-c', 'raise SystemExit(3)']
+
+        with self.assertRaises(RuntimeError):
+            with ExitingServer(None, port=corenlp_annotate.get_free_port()) as server:
+                pass
+
+class PrepCoreNLPServerJobTests(unittest.TestCase):
+
+    def test_server_job_file_runs_corenlp_annotate(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            args = argparse.Namespace(corenlp='/opt/corenlp', bioshovel='/opt/bioshovel',
+                                      server=True, servers=2)
+            job_file_path = prep_corenlp.create_job_file(['/input/10001', '/input/10002'],
+                                                         tmpdir, '/output', 3, args)
+            with open(job_file_path) as f:
+                job = f.read()
+
+        self.assertTrue(job.startswith('#!/bin/bash'))
+        self.assertIn('python3 -m preprocess.corenlp_annotate /output --filelist {}'.format(os.path.join(tmpdir, 'file_list3')),
+                      job)
+        self.assertIn('--servers 2 --threads 4', job)
+        self.assertNotIn('corenlp.sh', job)
+
+    def test_default_job_file_runs_corenlp_sh(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            args = argparse.Namespace(corenlp='/opt/corenlp', bioshovel='/opt/bioshovel',
+                                      server=False, servers=1)
+            job_file_path = prep_corenlp.create_job_file(['/input/10001'], tmpdir, '/output', 0, args)
+            with open(job_file_path) as f:
+                job = f.read()
+
+        self.assertTrue(job.startswith('#!/bin/bash'))
+        self.assertIn('./corenlp.sh -outputFormat json -outputDirectory /output', job)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+''' Tests for the streaming corpus file enumerator:
+
+    preprocess.util (scandir_files, iter_corpus_files, parse_shards)
+    preprocess.chem_ner_cluster (--resume)
+'''
+
+import os
+import tempfile
+import time
+import unittest
+
+from preprocess import (chem_ner_cluster,
+                        util)
+
+class CorpusFilesTests(unittest.TestCase):
+
+    ''' a corpus of 25 files in three shards (and a hidden file, and a file
+        outside of the shards)
+    '''
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.corpus_dir = os.path.join(self.tmpdir.name, 'corpus')
+        self.listing_file = os.path.join(self.tmpdir.name, 'corpus.files')
+
+        self.relative_paths = []
+        for i in range(25):
+            shard = '{0:0>4}'.format(i//10)
+            os.makedirs(os.path.join(self.corpus_dir, shard), exist_ok=True)
+            self.relative_paths.append(os.path.join(shard, '100{0:0>2}'.format(i)))
+        self.relative_paths.append('README')
+        self.relative_paths.sort()
+
+        for relative_path in self.relative_paths + ['.hidden']:
+            with open(os.path.join(self.corpus_dir, relative_path), 'w') as f:
+                f.write('title\tTitle\n')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def corpus_paths(self, relative_paths):
+        return [os.path.join(self.corpus_dir, path) for path in relative_paths]
+
+    def test_scandir_files(self):
+        self.assertEqual([entry.path for entry in util.scandir_files(self.corpus_dir)],
+                         self.corpus_paths(self.relative_paths))
+        self.assertEqual([entry.name for entry in util.scandir_files(self.corpus_dir, recursive=False)],
+                         ['README'])
+
+    def test_shards(self):
+        self.assertEqual(util.parse_shards('0000,0002-0004, 0010'),
+                         {'0000', '0002', '0003', '0004', '0010'})
+        self.assertIsNone(util.parse_shards(None))
+
+        paths = list(util.iter_corpus_files(self.corpus_dir, shards=util.parse_shards('0000,0002')))
+        self.assertEqual(paths, self.corpus_paths(path for path in self.relative_paths
+                                                  if path.startswith(('0000', '0002'))))
+
+    def make_listing_outdated(self):
+        # (any change after this is newer than the listing)
+        past = time.time() - 60
+        os.utime(self.listing_file, (past, past))
+
+    def make_corpus_older_than_listing(self):
+        past = os.path.getmtime(self.listing_file) - 60
+        for dirpath, _, _ in os.walk(self.corpus_dir):
+            os.utime(dirpath, (past, past))
+
+    def test_listing_file_is_saved_and_read(self):
+        paths = list(util.iter_corpus_files(self.corpus_dir, listing_file=self.listing_file))
+        self.assertEqual(paths, self.corpus_paths(self.relative_paths))
+        with open(self.listing_file) as f:
+            self.assertEqual(f.read().splitlines(),
+                             ['# file listing: root={} recursive=True'.format(self.corpus_dir)] +
+                             self.relative_paths)
+
+        # the listing is read instead of the directory tree
+        with open(self.listing_file, 'a') as f:
+            f.write(os.path.join('0001', 'only_listed')+'\n')
+        self.assertEqual(list(util.iter_corpus_files(self.corpus_dir, listing_file=self.listing_file)),
+                         paths + [os.path.join(self.corpus_dir, '0001', 'only_listed')])
+        self.assertEqual(list(util.iter_corpus_files(self.corpus_dir,
+                                                     shards={'0001'},
+                                                     listing_file=self.listing_file)),
+                         paths[10:20] + [os.path.join(self.corpus_dir, '0001', 'only_listed')])
+
+    def test_listing_file_is_outdated_by_a_new_shard(self):
+        list(util.iter_corpus_files(self.corpus_dir, listing_file=self.listing_file))
+        self.make_listing_outdated()
+        os.makedirs(os.path.join(self.corpus_dir, '0003'))
+        open(os.path.join(self.corpus_dir, '0003', '10030'), 'w').close()
+
+        paths = list(util.iter_corpus_files(self.corpus_dir, listing_file=self.listing_file))
+        self.assertEqual(paths[-2], os.path.join(self.corpus_dir, '0003', '10030'))
+        with open(self.listing_file) as f:
+            self.assertEqual(len(f.read().splitlines()), 28)
+
+    def test_listing_file_is_outdated_by_files_in_a_shard(self):
+        list(util.iter_corpus_files(self.corpus_dir, listing_file=self.listing_file))
+        self.make_listing_outdated()
+        self.make_corpus_older_than_listing()
+        # (only changes the shard's mtime, not the corpus directory's)
+        open(os.path.join(self.corpus_dir, '0001', '10100'), 'w').close()
+        self.assertLess(os.path.getmtime(self.corpus_dir), os.path.getmtime(self.listing_file))
+
+        paths = list(util.iter_corpus_files(self.corpus_dir, listing_file=self.listing_file))
+        self.assertIn(os.path.join(self.corpus_dir, '0001', '10100'), paths)
+        self.assertEqual(len(paths), 27)
+
+        self.make_listing_outdated()
+        self.make_corpus_older_than_listing()
+        os.remove(os.path.join(self.corpus_dir, '0002', '10020'))
+        paths = list(util.iter_corpus_files(self.corpus_dir, listing_file=self.listing_file))
+        self.assertNotIn(os.path.join(self.corpus_dir, '0002', '10020'), paths)
+        self.assertEqual(len(paths), 26)
+
+    def test_listing_file_of_another_corpus_is_rejected(self):
+        list(util.iter_corpus_files(self.corpus_dir, listing_file=self.listing_file))
+
+        other_corpus_dir = os.path.join(self.tmpdir.name, 'other_corpus')
+        os.makedirs(os.path.join(other_corpus_dir, '0000'))
+        with self.assertRaisesRegex(ValueError, 'not a listing of {}'.format(other_corpus_dir)):
+            list(util.iter_corpus_files(other_corpus_dir, listing_file=self.listing_file))
+        with self.assertRaisesRegex(ValueError, 'recursive=False'):
+            list(util.iter_corpus_files(self.corpus_dir, recursive=False,
+                                        listing_file=self.listing_file))
+
+        # (and the listing isn't replaced)
+        with open(self.listing_file) as f:
+            self.assertEqual(f.readline(),
+                             '# file listing: root={} recursive=True\n'.format(self.corpus_dir))
+
+    def test_partial_listing_is_not_saved(self):
+        paths = util.iter_corpus_files(self.corpus_dir, listing_file=self.listing_file)
+        next(paths)
+        paths.close()
+        self.assertEqual(os.listdir(self.tmpdir.name), ['corpus'])
+
+        # or for a subset of shards
+        list(util.iter_corpus_files(self.corpus_dir, shards={'0000'}, listing_file=self.listing_file))
+        self.assertFalse(os.path.exists(self.listing_file))
+
+    def test_resume_strips_tmchem_suffix(self):
+        self.assertEqual(chem_ner_cluster.strip_suffix('10.1000%2Fjournal.cme.tmChem', '.tmChem'),
+                         '10.1000%2Fjournal.cme')
+        self.assertEqual(chem_ner_cluster.strip_suffix('11250746', '.tmChem'), '11250746')
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+''' Tests for the downloader result caches:
+
+    downloaders.util
+'''
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from downloaders import util
+
+class FakeClock(object):
+
+    ''' Manually advanced replacement for time.time
+    '''
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+class CacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def make_cache(self, **kwargs):
+        return util.Cache(self.tempdir.name, clock=self.clock, **kwargs)
+
+    def test_set_and_get(self):
+        cache = self.make_cache()
+        cache[('journal', '1234-5678')] = ['a', 'b']
+
+        self.assertIn(('journal', '1234-5678'), cache)
+        self.assertEqual(cache[('journal', '1234-5678')], ['a', 'b'])
+        self.assertIsNone(cache.get('other'))
+        self.assertRaises(KeyError, lambda: cache['other'])
+
+    def test_entries_expire_after_ttl(self):
+        cache = self.make_cache(ttl=60)
+        cache['key'] = 1
+
+        self.clock.now += 59
+        self.assertEqual(cache.get('key'), 1)
+
+        self.clock.now += 2
+        self.assertNotIn('key', cache)
+
+    def test_expired_entries_are_evicted_every_n_writes(self):
+        cache = self.make_cache(ttl=60, evict_every=3)
+        cache['old'] = 1
+        self.clock.now += 100
+        cache['new1'] = 2
+        cache['new2'] = 3
+        self.assertEqual(len(cache.entries()), 3)
+
+        cache['new3'] = 4
+        self.assertEqual(len(cache.entries()), 3)
+        self.assertNotIn('old', cache)
+        self.assertEqual(cache.get('new1'), 2)
+
+    def test_eviction_does_not_open_entries(self):
+        cache = self.make_cache(ttl=60)
+        for i in range(5):
+            cache[i] = i
+        self.clock.now += 100
+        cache['new'] = 1
+
+        with mock.patch.object(util.gzip, 'open', side_effect=AssertionError('entry opened')):
+            cache.evict()
+        self.assertEqual([os.path.basename(loc) for _, loc in cache.entries()],
+                         [os.path.basename(cache.path('new'))])
+
+    def test_oldest_entries_beyond_max_entries_are_evicted(self):
+        cache = self.make_cache(max_entries=2)
+        for i in range(4):
+            cache[i] = i
+            self.clock.now += 1
+
+        self.assertEqual(len(cache.entries()), 2)
+        self.assertEqual([cache.get(i) for i in range(4)], [None, None, 2, 3])
+
+    def test_corrupt_entry_is_treated_as_missing(self):
+        cache = self.make_cache()
+        cache['key'] = 1
+        with open(cache.path('key'), 'wb') as fout:
+            fout.write(b'not gzip')
+
+        self.assertNotIn('key', cache)
+
+    def test_writes_leave_no_temporary_files(self):
+        cache = self.make_cache()
+        cache['key'] = list(range(100))
+
+        self.assertEqual(os.listdir(self.tempdir.name), [os.path.basename(cache.path('key'))])
+
+class CachedDecoratorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.calls = []
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def make_function(self, version=1):
+        @util.cached(self.tempdir.name, version=version)
+        def find_articles(journals):
+            self.calls.append(journals)
+            return sorted(journals.values())
+
+        return find_articles
+
+    def test_results_are_cached_per_arguments(self):
+        find_articles = self.make_function()
+
+        self.assertEqual(find_articles({'a': 1, 'b': 2}), [1, 2])
+        self.assertEqual(find_articles({'b': 2, 'a': 1}), [1, 2])
+        self.assertEqual(find_articles({'a': 3}), [3])
+
+        self.assertEqual(self.calls, [{'a': 1, 'b': 2}, {'a': 3}])
+        self.assertTrue(os.path.isdir(os.path.join(self.tempdir.name, 'find_articles')))
+
+    def test_version_bump_invalidates_results(self):
+        self.make_function(version=1)({'a': 1})
+        self.make_function(version=1)({'a': 1})
+        self.make_function(version=2)({'a': 1})
+
+        self.assertEqual(len(self.calls), 2)
@@ -5,7 +5,9 @@ import tempfile
 import textwrap
 import unittest
 from bs4 import BeautifulSoup
-from preprocess import parse_elife_xml
+from lxml import etree
+from preprocess import (parse_elife_lxml,
+                        parse_elife_xml)
 from tests.elife_sample_article import xml_file_string as sample_xml
 
 class ELifeParserTestCase(unittest.TestCase):
@@ -140,3 +142,42 @@ class ELifeParserExtractorTests(ELifeParserTestCase):
         text_found_in_paragraph = text_with_figure_ref in article_paragraphs[3]
 
         self.assertTrue(text_found_in_paragraph)
+
+class ELifeLxmlParserTests(ELifeParserTestCase):
+
+    ''' Checks that the lxml parser functions in preprocess.parse_elife_lxml
+        return exactly the same output as their BeautifulSoup counterparts
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.soup = parse_elife_xml.read_file(self.tmpfile.name)
+        self.tree = parse_elife_lxml.read_file(self.tmpfile.name)
+
+    def test_read_file_returns_lxml_element(self):
+        self.assertIsInstance(self.tree, etree._Element)
+
+    def test_get_doi_matches(self):
+        for escape_slash in (True, False):
+            self.assertEqual(parse_elife_lxml.get_doi(self.tree, escape_slash=escape_slash),
+                             parse_elife_xml.get_doi(self.soup, escape_slash=escape_slash))
+
+    def test_get_title_matches(self):
+        self.assertEqual(parse_elife_lxml.get_title(self.tree),
+                         parse_elife_xml.get_title(self.soup))
+
+    def test_get_abstract_matches(self):
+        self.assertEqual(parse_elife_lxml.get_abstract(self.tree),
+                         parse_elife_xml.get_abstract(self.soup))
+
+    def test_get_exec_summary_matches(self):
+        self.assertEqual(parse_elife_lxml.get_exec_summary(self.tree),
+                         parse_elife_xml.get_exec_summary(self.soup))
+
+    def test_get_main_article_with_references_matches(self):
+        self.assertEqual(parse_elife_lxml.get_main_article(self.tree, keep_references=True),
+                         parse_elife_xml.get_main_article(self.soup, keep_references=True))
+
+    def test_get_main_article_without_references_matches(self):
+        self.assertEqual(parse_elife_lxml.get_main_article(self.tree, keep_references=False),
+                         parse_elife_xml.get_main_article(self.soup, keep_references=False))
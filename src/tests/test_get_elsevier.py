@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+''' Tests for the Elsevier article download pipeline:
+
+    downloaders/get_elsevier.py (async_download_journals)
+
+    (runs against the local aiohttp stub server from tests.test_web_util)
+'''
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from tests import test_web_util
+
+# the downloaders are scripts run from their own directory
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'downloaders'))
+import get_elsevier
+from rate_limit import RateLimiter
+
+class DownloadJournalsTests(test_web_util.WebUtilTestCase):
+
+    ''' two journals (A and B) of two issues with 10 articles each, served as
+        stub server sitemap pages
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.article_dir = os.path.join(self.tmpdir.name, 'articles', 'txt')
+
+        self.patches = [mock.patch.object(get_elsevier, name, new=value) for name, value in (
+            ('RATE_LIMITER', RateLimiter(1000, 100)),
+            ('CACHE_DIR', os.path.join(self.tmpdir.name, 'cache')),
+            ('ARTICLE_DIR', os.path.join(self.tmpdir.name, 'articles', '{}')),
+            ('JOURNAL_SITEMAP_URL', self.server.url('/issue?id={}{}')),
+        )]
+        for patch in self.patches:
+            patch.start()
+
+        self.journals = {'A journal': '0000-0001', 'B journal': '0000-0002'}
+        self.piis = []
+        for title, issn in self.journals.items():
+            journal_id = title[0].lower() + issn.replace('-', '')
+            issue_ids = ['{}-{}'.format(journal_id, issue) for issue in range(2)]
+            self.server.issues[journal_id] = self.sitemap(self.server.url('/issue?id={}'.format(issue_id))
+                                                          for issue_id in issue_ids)
+            for issue_id in issue_ids:
+                piis = ['S{}-{}'.format(issue_id, i) for i in range(10)]
+                self.server.issues[issue_id] = self.sitemap(self.article_url(pii) for pii in piis)
+                self.piis.extend(piis)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def sitemap(self, links):
+        return '<a href="self">self</a>' + ''.join('<a href="{}">link</a>'.format(link)
+                                                   for link in links)
+
+    def article_url(self, pii):
+        return self.server.url('/article?id=article/pii/{}'.format(pii))
+
+    def article_path(self, pii):
+        return os.path.join(self.article_dir, '{}.txt'.format(pii))
+
+    def download(self, **kwargs):
+        return asyncio.run(get_elsevier.async_download_journals(self.journals, 'txt', {},
+                                                                **kwargs))
+
+    def test_articles_are_saved(self):
+        self.server.missing.add('article/pii/' + self.piis[0])
+        stats = self.download(MAX_CONNECTIONS=4)
+
+        self.assertEqual(stats['saved'], 39)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(sorted(os.listdir(self.article_dir)),
+                         sorted('{}.txt'.format(pii) for pii in self.piis[1:]))
+        with open(self.article_path(self.piis[5])) as f:
+            self.assertEqual(f.read(), 'article article/pii/{}\n'.format(self.piis[5]))
+
+    def test_saved_articles_are_skipped(self):
+        os.makedirs(self.article_dir)
+        for pii in self.piis[:15]:
+            open(self.article_path(pii), 'w').close()
+
+        stats = self.download()
+        self.assertEqual((stats['skipped'], stats['saved']), (15, 25))
+        self.assertEqual(sorted(self.server.query_hits),
+                         sorted(['article/pii/' + pii for pii in self.piis[15:]] +
+                                [issue_id for issue_id in self.server.issues]))
+
+        # journals' article links are cached, so only articles are refetched
+        os.remove(self.article_path(self.piis[0]))
+        self.server.query_hits.clear()
+        stats = self.download()
+        self.assertEqual((stats['skipped'], stats['saved']), (39, 1))
+        self.assertEqual(list(self.server.query_hits), ['article/pii/' + self.piis[0]])
+
+    def test_full_queues_make_earlier_stages_wait(self):
+        unblocked = threading.Event()
+        write_article = get_elsevier.write_article
+
+        def blocked_write_article(fname, text):
+            unblocked.wait()
+            write_article(fname, text)
+
+        async def download_while_blocked():
+            task = asyncio.ensure_future(get_elsevier.async_download_journals(
+                self.journals, 'txt', {}, MAX_CONNECTIONS=2, QUEUE_SIZE=2, SAVE_WORKERS=1
+            ))
+            await asyncio.sleep(0.5)
+            fetched = sum(1 for key in self.server.query_hits if key.startswith('article/pii/'))
+            unblocked.set()
+            return fetched, await task
+
+        with mock.patch.object(get_elsevier, 'write_article', new=blocked_write_article):
+            fetched, stats = asyncio.run(download_while_blocked())
+
+        # one article being saved, two in the save queue and one waiting to
+        # be queued by each download worker
+        self.assertGreater(fetched, 0)
+        self.assertLessEqual(fetched, 1 + 2 + 2)
+        self.assertEqual(stats['saved'], 40)
+
+    def test_failed_stage_stops_the_pipeline(self):
+        # a sitemap link without an href can't be parsed
+        self.server.issues['b00000002-1'] = '<a href="self">self</a><a>no link</a>'
+
+        with self.assertRaises(KeyError):
+            asyncio.run(asyncio.wait_for(
+                get_elsevier.async_download_journals(self.journals, 'txt', {}),
+                timeout=10
+            ))
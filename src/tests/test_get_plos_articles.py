@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+''' Tests for resumable concurrent PLOS article downloads:
+
+    downloaders/get_plos_articles.py (save_documents_concurrent)
+
+    (runs against the local aiohttp stub server from tests.test_web_util)
+'''
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+
+from tests import test_web_util
+
+# the downloaders are scripts run from their own directory
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'downloaders'))
+import get_plos_articles
+from rate_limit import RateLimiter
+
+DOIS = ['10.1371/journal.pone.{0:0>7}'.format(i) for i in range(10)]
+
+class Interrupted(Exception):
+    pass
+
+class SaveDocumentsConcurrentTests(test_web_util.WebUtilTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # (failed downloads are logged as CRITICAL)
+        logging.disable(logging.CRITICAL)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data_dir = self.tmpdir.name
+        self.manifest_path = os.path.join(self.tmpdir.name, 'manifest.jsonl')
+        self.base_url = self.server.url('/article?id={doi}')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def save_documents(self, dois=DOIS):
+        return get_plos_articles.save_documents_concurrent(self.base_url, dois,
+                                                           self.data_dir,
+                                                           self.manifest_path,
+                                                           connections=2,
+                                                           rate_limiter=RateLimiter(1000, 100))
+
+    def manifest_lines(self):
+        with open(self.manifest_path) as f:
+            return f.read().splitlines()
+
+    def saved_dois(self):
+        return sorted(name.replace('%2F', '/') for name in os.listdir(self.data_dir)
+                      if name.startswith('10.1371'))
+
+    def test_saves_documents_as_served(self):
+        self.assertEqual(self.save_documents(), 10)
+        self.assertEqual(self.saved_dois(), DOIS)
+        with open(os.path.join(self.data_dir, DOIS[3].replace('/', '%2F'))) as f:
+            self.assertEqual(f.read(), 'article {}'.format(DOIS[3]))
+
+        entry = get_plos_articles.load_manifest(self.manifest_path)[DOIS[3]]
+        self.assertEqual(entry, {'doi': DOIS[3], 'status': 'done',
+                                 'bytes': len('article {}'.format(DOIS[3]))})
+
+    def test_interrupted_run_is_resumed(self):
+        write_manifest_entry = get_plos_articles.write_manifest_entry
+        written = []
+
+        def interrupt_after_four(*args, **kwargs):
+            if len(written) == 4:
+                raise Interrupted()
+            write_manifest_entry(*args, **kwargs)
+            written.append(args[1])
+
+        with mock.patch.object(get_plos_articles, 'write_manifest_entry',
+                               side_effect=interrupt_after_four):
+            with self.assertRaises(Interrupted):
+                self.save_documents()
+        # a run killed while writing leaves a partial last line
+        partial_line = '{"doi": "10.1371/jour'
+        with open(self.manifest_path, 'a') as f:
+            f.write(partial_line)
+
+        self.server.query_hits.clear()
+        self.assertEqual(self.save_documents(), 6)
+
+        # only the DOIs without a 'done' entry were fetched again
+        self.assertEqual(sorted(self.server.query_hits), sorted(set(DOIS) - set(written)))
+        self.assertEqual(set(self.server.query_hits.values()), {1})
+        self.assertEqual(self.saved_dois(), DOIS)
+
+        entries = [json.loads(line) for line in self.manifest_lines()
+                   if line != partial_line]
+        self.assertEqual(Counter(entry['doi'] for entry in entries), Counter(DOIS))
+        self.assertTrue(all(entry['status'] == 'done' for entry in entries))
+
+    def test_failed_and_deleted_documents_are_fetched_again(self):
+        self.server.missing.add(DOIS[0])
+        self.assertEqual(self.save_documents(), 9)
+        self.assertEqual(get_plos_articles.load_manifest(self.manifest_path)[DOIS[0]]['status'],
+                         'failed')
+        os.remove(os.path.join(self.data_dir, DOIS[1].replace('/', '%2F')))
+
+        self.server.missing.clear()
+        self.server.query_hits.clear()
+        self.assertEqual(self.save_documents(), 2)
+        self.assertEqual(sorted(self.server.query_hits), DOIS[:2])
+
+        manifest = get_plos_articles.load_manifest(self.manifest_path)
+        self.assertTrue(all(entry['status'] == 'done' for entry in manifest.values()))
+
+    def test_nothing_is_fetched_when_all_are_done(self):
+        self.save_documents()
+        self.server.query_hits.clear()
+        self.assertEqual(self.save_documents(DOIS + ['not a plos doi']), 0)
+        self.assertFalse(self.server.query_hits)
+        self.assertEqual(len(self.manifest_lines()), 10)
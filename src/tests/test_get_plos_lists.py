@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+''' Tests for checkpointed concurrent crawling of PLOS issue pages:
+
+    downloaders/get_plos_lists.py (crawl_pages, get_failed_urls)
+
+    (runs against the local aiohttp stub server from tests.test_web_util)
+'''
+
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from tests import test_web_util
+
+# the downloaders are scripts run from their own directory
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'downloaders'))
+import get_plos_lists
+from rate_limit import RateLimiter
+
+def issue_html(*dois):
+    return '\n'.join('<p class="article-info">Research Article | {}</p>'.format(doi)
+                     for doi in dois)
+
+# an issue page that parse_issue_dois() can't parse (no '|' separator)
+MALFORMED_ISSUE_HTML = '<p class="article-info">Research Article</p>'
+
+class CrawlPagesTests(test_web_util.WebUtilTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.checkpoint_filename = os.path.join(self.tmpdir.name, 'get_plos_lists_test.done')
+        self.log_filename = os.path.join(self.tmpdir.name, 'get_plos_lists_test.log')
+        self.output_filename = os.path.join(self.tmpdir.name, 'plosgenetics_dois_test.txt')
+
+        # log as get_plos_lists.main() does
+        logging.disable(logging.NOTSET)
+        self.log_handler = logging.FileHandler(self.log_filename)
+        self.log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root_logger = logging.getLogger()
+        self.log_level = root_logger.level
+        root_logger.addHandler(self.log_handler)
+        root_logger.setLevel(logging.WARNING)
+
+        self.rate_limiter = mock.patch.object(get_plos_lists, 'RATE_LIMITER', new=RateLimiter(1000, 100))
+        self.rate_limiter.start()
+
+        for i in range(6):
+            self.server.issues[str(i)] = issue_html('10.1371/journal.pgen.{}a'.format(i),
+                                                    '10.1371/journal.pgen.{}b'.format(i))
+
+    def tearDown(self):
+        self.rate_limiter.stop()
+        root_logger = logging.getLogger()
+        root_logger.removeHandler(self.log_handler)
+        root_logger.setLevel(self.log_level)
+        self.log_handler.close()
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def issue_url(self, issue_id):
+        return self.server.url('/issue?id={}'.format(issue_id))
+
+    def crawl(self, issue_ids):
+        pages = {self.issue_url(issue_id): ('issue', self.output_filename)
+                 for issue_id in issue_ids}
+        with mock.patch('sys.stdout'), mock.patch('sys.stderr'):
+            return get_plos_lists.crawl_pages(pages, self.checkpoint_filename,
+                                              connections=2, poolsize=2)
+
+    def output_dois(self):
+        with open(self.output_filename) as f:
+            return f.read().splitlines()
+
+    def log_lines(self):
+        self.log_handler.flush()
+        with open(self.log_filename) as f:
+            return f.readlines()
+
+    def critical_log_lines(self):
+        return [line for line in self.log_lines() if line.startswith('CRITICAL')]
+
+    def all_dois(self, issue_ids):
+        return sorted('10.1371/journal.pgen.{}{}'.format(i, suffix)
+                      for i in issue_ids for suffix in 'ab')
+
+    def test_checkpointed_pages_are_skipped(self):
+        self.assertEqual(self.crawl(range(3)), 3)
+        self.server.query_hits.clear()
+
+        # resumed with more pages, only the new ones are fetched
+        self.assertEqual(self.crawl(range(6)), 3)
+        self.assertEqual(sorted(self.server.query_hits), ['3', '4', '5'])
+        self.assertEqual(sorted(self.output_dois()), self.all_dois(range(6)))
+        self.assertEqual(len(get_plos_lists.load_checkpoint(self.checkpoint_filename)), 6)
+        self.assertEqual(self.critical_log_lines(), [])
+
+    def test_failed_pages_are_logged_once_and_retried(self):
+        del self.server.issues['1']
+        self.server.issues['2'] = MALFORMED_ISSUE_HTML
+        self.assertEqual(self.crawl(range(4)), 2)
+
+        # one log line for each page that couldn't be fetched or parsed
+        self.assertEqual(len(self.critical_log_lines()), 2)
+        self.assertEqual([line for line in self.log_lines() if self.issue_url(2) in line],
+                         ['CRITICAL:root:URL parse failed after 1 attempts: {}\n'.format(self.issue_url(2))])
+        completed = get_plos_lists.load_checkpoint(self.checkpoint_filename)
+        failed_urls = get_plos_lists.get_failed_urls(self.log_filename, completed)
+        self.assertEqual(sorted(failed_urls), [self.issue_url(1), self.issue_url(2)])
+
+        # retried (as main() does) once the pages are fixed
+        self.server.issues['1'] = issue_html('10.1371/journal.pgen.1a', '10.1371/journal.pgen.1b')
+        self.server.issues['2'] = issue_html('10.1371/journal.pgen.2a', '10.1371/journal.pgen.2b')
+        self.server.query_hits.clear()
+        self.assertEqual(self.crawl(['1', '2']), 2)
+        self.assertEqual(sorted(self.server.query_hits), ['1', '2'])
+        self.assertEqual(sorted(self.output_dois()), self.all_dois(range(4)))
+
+        completed = get_plos_lists.load_checkpoint(self.checkpoint_filename)
+        self.assertEqual(get_plos_lists.get_failed_urls(self.log_filename, completed), [])
+
+    def test_failed_urls_are_listed_once(self):
+        del self.server.issues['1']
+        self.crawl(range(3))
+        self.crawl(range(3))
+        self.assertEqual(len(self.critical_log_lines()), 2)
+        self.assertEqual(get_plos_lists.get_failed_urls(self.log_filename), [self.issue_url(1)])
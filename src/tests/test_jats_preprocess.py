@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+''' Tests for the JATS XML to parform converter:
+
+    preprocess.parse_jats_xml
+'''
+
+import os
+import tarfile
+import tempfile
+import textwrap
+import unittest
+import warnings
+
+from preprocess import (parse_elife_xml,
+                        parse_jats_xml)
+from tests.elife_sample_article import xml_file_string as sample_xml
+
+PMC_SAMPLE_XML = textwrap.dedent('''\
+    <?xml version="1.0" encoding="UTF-8"?>
+    <article article-type="research-article">
+    <front><article-meta>
+    <article-id pub-id-type="pmc">12345</article-id>
+    <title-group><article-title>A <italic>sample</italic> article</article-title></title-group>
+    <abstract><sec><p>First part.</p></sec><sec><p>Second part.</p></sec></abstract>
+    <abstract abstract-type="graphical"><p>Graphical abstract.</p></abstract>
+    </article-meta></front>
+    <body><sec><title>Intro</title><p>Some text <xref ref-type="bibr">(1)</xref>.</p></sec></body>
+    </article>
+    ''')
+
+def get_elife_bs4_lines(file_path):
+
+    ''' parform lines produced for file_path by the BeautifulSoup functions in
+        preprocess.parse_elife_xml
+    '''
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        soup = parse_elife_xml.read_file(file_path)
+
+    lines = [('title', parse_elife_xml.get_title(soup)),
+             ('abs', parse_elife_xml.get_abstract(soup))]
+    lines += [('p', p) for p in parse_elife_xml.get_exec_summary(soup)]
+    lines += [('p', p) for p in parse_elife_xml.get_main_article(soup, keep_references=False)]
+
+    return ['\t'.join(line)+'\n' for line in lines]
+
+class JATSConverterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmpdir.name, 'xml')
+        self.output_dir = os.path.join(self.tmpdir.name, 'paragraphs')
+        os.makedirs(self.input_dir)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_input(self, file_name, xml_string):
+        file_path = os.path.join(self.input_dir, file_name)
+        with open(file_path, 'w') as f:
+            f.write(xml_string)
+        return file_path
+
+    def read_output(self, *path):
+        with open(os.path.join(self.output_dir, *path)) as f:
+            return f.readlines()
+
+    def read_report(self):
+        with open(parse_jats_xml.get_report_path(self.output_dir)) as f:
+            return [line.rstrip('\n').split('\t') for line in f][1:]
+
+class JATSConverterTests(JATSConverterTestCase):
+
+    def test_elife_output_matches_beautifulsoup_parser(self):
+        file_path = self.write_input('elife-13027.xml', sample_xml)
+        stats = parse_jats_xml.convert_articles(self.input_dir, self.output_dir,
+                                                poolsize=1, quiet=True)
+
+        self.assertEqual(stats['converted'], 1)
+        self.assertEqual(self.read_output('0000', '10.7554%2Felife.13027'),
+                         get_elife_bs4_lines(file_path))
+
+    def test_archive_input_matches_directory_input(self):
+        self.write_input('elife-13027.xml', sample_xml)
+        archive_path = os.path.join(self.tmpdir.name, 'articles.tar.gz')
+        with tarfile.open(archive_path, 'w:gz') as tar:
+            tar.add(self.input_dir, arcname='xml')
+
+        parse_jats_xml.convert_articles(self.input_dir, self.output_dir,
+                                        poolsize=1, quiet=True)
+        expected = self.read_output('0000', '10.7554%2Felife.13027')
+
+        self.output_dir += '_from_archive'
+        stats = parse_jats_xml.convert_articles(archive_path, self.output_dir,
+                                                poolsize=1, quiet=True)
+
+        self.assertEqual(stats['converted'], 1)
+        self.assertEqual(self.read_output('0000', '10.7554%2Felife.13027'), expected)
+        self.assertEqual(self.read_report()[0][0], 'xml/elife-13027.xml')
+
+    def test_output_is_sharded(self):
+        for i in range(3):
+            self.write_input('{}.nxml'.format(i),
+                             PMC_SAMPLE_XML.replace('12345', str(i)))
+        parse_jats_xml.convert_articles(self.input_dir, self.output_dir,
+                                        article_format='pmc', poolsize=2,
+                                        files_per_shard=2, quiet=True)
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.output_dir, '0000'))),
+                         ['PMC0', 'PMC1'])
+        self.assertEqual(os.listdir(os.path.join(self.output_dir, '0001')), ['PMC2'])
+
+    def test_failures_are_reported(self):
+        self.write_input('a.xml', sample_xml)
+        self.write_input('b.xml', '<article><front></front></article>')
+        stats = parse_jats_xml.convert_articles(self.input_dir, self.output_dir,
+                                                poolsize=1, quiet=True)
+
+        self.assertEqual((stats['converted'], stats['failed']), (1, 1))
+
+        report = self.read_report()
+        self.assertEqual([row[0] for row in report], ['a.xml', 'b.xml'])
+        self.assertEqual(report[0][3], '')
+        self.assertEqual(report[1][1:2] + report[1][3:], ['', 'no article ID'])
+        float(report[0][2])
+
+class PMCConverterTests(JATSConverterTestCase):
+
+    def test_pmc_article_lines(self):
+        self.write_input('sample.nxml', PMC_SAMPLE_XML)
+        parse_jats_xml.convert_articles(self.input_dir, self.output_dir,
+                                        article_format='pmc', poolsize=1, quiet=True)
+
+        self.assertEqual(self.read_output('0000', 'PMC12345'),
+                         ['title\tA sample article\n',
+                          'abs\tFirst part. Second part.\n',
+                          'p\tSome text.\n'])
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 
+import argparse
+import gzip
 import os
 import tempfile
 import unittest
+from contextlib import redirect_stdout
+from glob import glob
+from io import StringIO
+from unittest import mock
 from lxml import etree
 from preprocess import parse_medline_xml
 from tests.medline_sample_xml import sample_medline_xml as sample_xml
@@ -61,4 +67,91 @@ class XMLParseTests(XMLParseBaseClass):
         correct_pmid = str(17687753)
 
         self.assertEqual(d['title'][:50], correct_title)
-        self.assertEqual(d['pmid'], correct_pmid)
\ No newline at end of file
+        self.assertEqual(d['pmid'], correct_pmid)
+
+
+class MedlineUpdateTests(XMLParseBaseClass):
+
+    ''' applies update files made from the sample citation (with other PMIDs
+        and titles) with parse_medline_xml --update
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.update_dir = os.path.join(self.tempdir.name, 'updatefiles')
+        self.output_dir = os.path.join(self.tempdir.name, 'updates')
+        os.makedirs(self.update_dir)
+
+        self.citation = self.sample_xml[self.sample_xml.index('<MedlineCitation '):
+                                        self.sample_xml.index('</MedlineCitationSet>')]
+
+    def tearDown(self):
+        super().tearDown()
+        self.tempdir.cleanup()
+
+    def write_update_file(self, file_name, citations, deleted_pmids=()):
+
+        ''' citations: list of (pmid, title) tuples
+        '''
+
+        xml = self.sample_xml[:self.sample_xml.index('<MedlineCitation ')]
+        for pmid, title in citations:
+            xml += self.citation.replace('17687753', pmid).replace('[Low level auditory', title)
+        if deleted_pmids:
+            xml += '<DeleteCitation>\n'
+            xml += ''.join('<PMID Version="1">{}</PMID>\n'.format(pmid) for pmid in deleted_pmids)
+            xml += '</DeleteCitation>\n'
+        xml += '</MedlineCitationSet>\n'
+
+        with gzip.open(os.path.join(self.update_dir, file_name), 'wt') as f:
+            f.write(xml)
+
+    def apply_updates(self):
+        args = argparse.Namespace(xml_file_directory=self.update_dir,
+                                  output_directory=self.output_dir,
+                                  doiindex=None, update=True)
+        with redirect_stdout(StringIO()), mock.patch('sys.stderr', new=StringIO()):
+            parse_medline_xml.main(args)
+
+    def read_delta(self, name):
+
+        ''' Returns ({file name: title line} of saved files, deleted file names)
+        '''
+
+        delta_dir = os.path.join(self.output_dir, 'updates', name)
+        saved = {}
+        for file_path in glob(os.path.join(delta_dir, '*', 'by_pmid', '*')):
+            with open(file_path) as f:
+                saved[os.path.basename(file_path)] = f.readline().split('\t')[1][:9]
+        with open(os.path.join(delta_dir, 'deleted.txt')) as f:
+            deleted = f.read().split()
+
+        return saved, deleted
+
+    def test_update_files_are_applied_in_order(self):
+        self.write_update_file('medline16n0813.xml.gz', [('100', 'Version 1'), ('200', 'Version 1')])
+        self.write_update_file('medline16n0814.xml.gz', [('100', 'Version 2'), ('300', 'Version 1')],
+                               deleted_pmids=['200', '400'])
+        self.apply_updates()
+
+        saved, deleted = self.read_delta('medline16n0814')
+        self.assertEqual(saved, {'100': 'Version 2', '300': 'Version 1'})
+        self.assertEqual(deleted, ['200', '400'])
+        self.assertEqual(parse_medline_xml.get_last_update_file(self.output_dir), 'medline16n0814.xml.gz')
+
+    def test_only_new_update_files_are_applied(self):
+        self.write_update_file('medline16n0813.xml.gz', [('100', 'Version 1')])
+        self.apply_updates()
+        self.apply_updates()
+        self.assertEqual(os.listdir(os.path.join(self.output_dir, 'updates')), ['medline16n0813'])
+
+        self.write_update_file('medline16n0814.xml.gz', [('200', 'Version 1')], deleted_pmids=['100'])
+        self.apply_updates()
+        self.assertEqual(self.read_delta('medline16n0814'), ({'200': 'Version 1'}, ['100']))
+
+    def test_citation_deleted_then_readded_is_saved(self):
+        self.write_update_file('medline16n0813.xml.gz', [], deleted_pmids=['100'])
+        self.write_update_file('medline16n0814.xml.gz', [('100', 'Version 2')])
+        self.apply_updates()
+        self.assertEqual(self.read_delta('medline16n0814'), ({'100': 'Version 2'}, []))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+''' Tests for copy, link and archive modes of:
+
+    preprocess.create_medline_subset
+'''
+
+import argparse
+import errno
+import os
+import tarfile
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from preprocess import create_medline_subset
+from preprocess.reformat import iter_packed_parform
+
+PMIDS = ['{}'.format(10000000+i) for i in range(1200)]
+
+class MedlineSubsetTests(unittest.TestCase):
+
+    ''' a MEDLINE tree of 1200 files in two shards, and a subset of every
+        other PMID (600 files)
+    '''
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.medline_dir = os.path.join(self.tmpdir.name, 'medline')
+        self.output_dir = os.path.join(self.tmpdir.name, 'subset')
+        self.pmid_file = os.path.join(self.tmpdir.name, 'pmids.txt')
+
+        for i, pmid in enumerate(PMIDS):
+            shard_dir = os.path.join(self.medline_dir, '{0:0>4}'.format(i//1000), 'by_pmid')
+            os.makedirs(shard_dir, exist_ok=True)
+            with open(os.path.join(shard_dir, pmid), 'w') as f:
+                f.write('title\tTitle {0}\nabs\tAbstract {0}.\n'.format(pmid))
+
+        self.subset = PMIDS[::2]
+        with open(self.pmid_file, 'w') as f:
+            f.write('\n'.join(self.subset)+'\n')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def create_subset(self, **kwargs):
+        args = argparse.Namespace(pmid_file=self.pmid_file,
+                                  medline_paragraph_path=self.medline_dir,
+                                  output_directory=self.output_dir,
+                                  link=None, threads=4, archive=None, notqdm=True)
+        vars(args).update(kwargs)
+        out = StringIO()
+        with redirect_stdout(out), mock.patch('sys.stderr', new=StringIO()):
+            create_medline_subset.main(args)
+        return out.getvalue()
+
+    def subset_files(self):
+        return {name: os.path.join(dirpath, name)
+                for dirpath, _, names in os.walk(self.output_dir)
+                for name in names}
+
+    def assertSubsetCopied(self):
+        files = self.subset_files()
+        self.assertEqual(sorted(files), self.subset)
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['0000'])
+        with open(files[self.subset[-1]]) as f:
+            self.assertEqual(f.readline(), 'title\tTitle {}\n'.format(self.subset[-1]))
+
+    def test_copy(self):
+        out = self.create_subset()
+        self.assertSubsetCopied()
+        self.assertIn('Copied 600 and linked 0 files', out)
+        self.assertEqual(os.stat(self.subset_files()[self.subset[0]]).st_nlink, 1)
+
+    def test_hard_links(self):
+        out = self.create_subset(link='hard')
+        self.assertSubsetCopied()
+        self.assertIn('Copied 0 and linked 600 files', out)
+        self.assertEqual(os.stat(self.subset_files()[self.subset[0]]).st_nlink, 2)
+
+        # again, over the existing links
+        self.create_subset(link='hard')
+        self.assertEqual(os.stat(self.subset_files()[self.subset[0]]).st_nlink, 2)
+
+    def test_reflinks_are_copies_if_unsupported(self):
+        self.create_subset(link='reflink')
+        self.assertSubsetCopied()
+
+    def test_files_are_copied_if_they_cannot_be_linked(self):
+        def cross_device_link(source_path, new_file_path):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        with mock.patch.dict(create_medline_subset.LINK_FUNCTIONS, {'hard': cross_device_link}):
+            out = self.create_subset(link='hard')
+        self.assertSubsetCopied()
+        self.assertIn('Copied 600 and linked 0 files', out)
+
+    def test_tar_archives(self):
+        for archive_format, archive_name in (('tar', 'subset.tar'), ('tgz', 'subset.tar.gz')):
+            out = self.create_subset(archive=archive_format)
+            self.assertIn('Saved 600 files', out)
+            with tarfile.open(os.path.join(self.output_dir, archive_name)) as tar:
+                names = tar.getnames()
+            self.assertEqual(names, [os.path.join('0000', pmid) for pmid in self.subset])
+
+    def test_pack_archive(self):
+        self.create_subset(archive='pack')
+        documents = list(iter_packed_parform(os.path.join(self.output_dir, 'subset.pack')))
+        self.assertEqual([doi for doi, *_ in documents], self.subset)
@@ -11,6 +11,7 @@ import sys
 import tempfile
 import textwrap
 import unittest
+import unittest.mock
 from io import StringIO
 from pathlib import Path
 from queue import Queue
@@ -103,6 +104,62 @@ class NERTempFileTestCase(ReformatTestCase):
         self.assertTrue(body[0].startswith('abs\t'))
         self.assertTrue(all(line.startswith('p\t') for line in body[1:]))
 
+class MappedParformTests(NERTempFileTestCase):
+
+    ''' Tests that the memory-mapped parform converters in reformat give the
+        same output as parse_parform_file + parform_to_pubtator/plaintext
+    '''
+
+    def write_parfile(self, file_string, file_name=None):
+        file_path = os.path.join(self.tmpdir.name, file_name or self.escaped_doi)
+        with open(file_path, 'w') as f:
+            f.write(file_string)
+        return file_path
+
+    def old_pubtator(self, file_path):
+        escaped_doi, file_lines = reformat.parform_to_pubtator(*reformat.parse_parform_file(file_path))
+        return escaped_doi, ''.join(file_lines).encode('utf-8')
+
+    def old_plaintext(self, file_path, **kwargs):
+        escaped_doi, title_line, body = reformat.parse_parform_file(file_path)
+        return escaped_doi, ''.join(reformat.parform_to_plaintext(title_line, body, **kwargs)).encode('utf-8')
+
+    def test_parform_file_to_pubtator_matches_parform_to_pubtator(self):
+        self.assertEqual(reformat.parform_file_to_pubtator(self.filepath),
+                         self.old_pubtator(self.filepath))
+
+    def test_parform_file_to_pubtator_without_abstract_and_with_pipes(self):
+        file_path = self.write_parfile('title\tA|B title\textra\np\tfirst | paragraph\np\tsecond\tparagraph\n')
+        doi, pubtator = reformat.parform_file_to_pubtator(file_path)
+        self.assertEqual((doi, pubtator), self.old_pubtator(file_path))
+        self.assertIn(b'_1|a|first  paragraph\n', pubtator)
+        self.assertIn(b'_2|a|second\tparagraph\n', pubtator)
+
+    def test_parform_file_to_pubtator_returns_None_without_title_line(self):
+        file_path = self.write_parfile('abs\tno title here\n')
+        with unittest.mock.patch('sys.stdout', new=StringIO()):
+            self.assertIsNone(reformat.parform_file_to_pubtator(file_path))
+
+    def test_parform_file_to_plaintext_matches_parform_to_plaintext(self):
+        file_path = self.write_parfile(self.parfile_string.replace('(PRC2)', '(PR|C2)') + 'x|y\tlast line')
+        for kwargs in ({}, {'newlines': True, 'period_following_title': True}):
+            self.assertEqual(reformat.parform_file_to_plaintext(file_path, **kwargs),
+                             self.old_plaintext(file_path, **kwargs))
+
+    def test_empty_file_is_mapped(self):
+        file_path = self.write_parfile('', 'empty')
+        self.assertEqual(reformat.parform_file_to_plaintext(file_path), ('empty', b''))
+
+    def test_packed_parform_files_match_individual_files(self):
+        other_path = self.write_parfile('title\tOther\np\tparagraph\n', 'other')
+        pack_path = os.path.join(self.tmpdir.name, 'pack')
+        reformat.pack_parform_files([self.filepath, other_path], pack_path)
+
+        packed = [(escaped_doi, reformat.parform_buffer_to_pubtator(escaped_doi, buf, start, end))
+                  for escaped_doi, buf, start, end in reformat.iter_packed_parform(pack_path)]
+        self.assertEqual(packed, [(self.escaped_doi, self.old_pubtator(self.filepath)),
+                                  ('other', self.old_pubtator(other_path))])
+
 class ParformToPlaintextTests(ReformatTestCase):
 
     ''' Some tests for the reformat.parform_to_plaintext function
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+''' Tests for PBS array job helpers and array job files:
+
+    preprocess.cluster.util
+    preprocess.chem_ner_cluster
+    preprocess.prep_corenlp
+'''
+
+import argparse
+import os
+import subprocess
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from preprocess import (chem_ner_cluster,
+                        prep_corenlp)
+from preprocess.cluster import util as cluster_util
+from preprocess.cluster.executors import JobResult
+
+class ArrayJobTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.manifest_path = os.path.join(self.tmpdir.name, 'chunk_manifest.tsv')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_task_lines(self, field_names, array_id):
+
+        ''' Runs get_array_task_lines() for self.manifest_path in bash as task
+            array_id and returns the values read for field_names (or raises
+            CalledProcessError)
+        '''
+
+        script = cluster_util.get_array_task_lines(self.manifest_path, field_names)
+        script += '\n' + 'printf "%s\\n" ' + ' '.join('"${}"'.format(name) for name in field_names)
+        out = subprocess.check_output(['bash', '-c', script],
+                                      env=dict(os.environ, PBS_ARRAYID=str(array_id)),
+                                      stderr=subprocess.DEVNULL)
+        return out.decode('utf-8').rstrip('\n').split('\n')
+
+    def assertValidBash(self, job_file_path):
+        subprocess.check_call(['bash', '-n', job_file_path])
+
+class ClusterUtilArrayTests(ArrayJobTestCase):
+
+    def test_manifest_has_one_line_per_chunk(self):
+        num_chunks = cluster_util.write_chunk_manifest(self.manifest_path,
+                                                       ((i, '/input/sublist_{}'.format(i)) for i in range(3)))
+        self.assertEqual(num_chunks, 3)
+        with open(self.manifest_path) as f:
+            self.assertEqual(f.readlines(), ['0\t/input/sublist_0\n',
+                                             '1\t/input/sublist_1\n',
+                                             '2\t/input/sublist_2\n'])
+
+    def test_array_range(self):
+        self.assertEqual(cluster_util.get_array_range(10), '0-9')
+        self.assertEqual(cluster_util.get_array_range(10, max_running=4), '0-9%4')
+
+    def test_task_reads_its_chunk_from_manifest(self):
+        cluster_util.write_chunk_manifest(self.manifest_path,
+                                          [(0, '/input/a', '/output/a'),
+                                           (1, '/input/with space', '/output/b')])
+        fields = ('CHUNK_NUM', 'INPUT_DIR', 'OUTPUT_DIR')
+        self.assertEqual(self.run_task_lines(fields, 0), ['0', '/input/a', '/output/a'])
+        self.assertEqual(self.run_task_lines(fields, 1), ['1', '/input/with space', '/output/b'])
+
+    def test_task_without_chunk_fails(self):
+        cluster_util.write_chunk_manifest(self.manifest_path, [(0, '/input/a')])
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.run_task_lines(('CHUNK_NUM', 'INPUT_DIR'), 1)
+
+class ChemNERClusterArrayTests(ArrayJobTestCase):
+
+    def test_array_job_file(self):
+        args = argparse.Namespace(max_running=None, bioshovel='/opt/bioshovel',
+                                  tmchem='/opt/tmChem', poolsize=8, memgb=47)
+        job_file_path = chem_ner_cluster.create_array_job_file(self.tmpdir.name, self.manifest_path,
+                                                               250, args)
+        with open(job_file_path) as f:
+            job = f.read()
+
+        self.assertTrue(job.startswith('#!/bin/bash\n'))
+        self.assertIn('#PBS -t 0-249\n', job)
+        self.assertIn(self.manifest_path, job)
+        self.assertIn('python3 -m preprocess.chem_ner "$INPUT_DIR" "$OUTPUT_DIR" --tmchem /opt/tmChem --logdir "$LOG_DIR"',
+                      job)
+        self.assertValidBash(job_file_path)
+
+    def test_failed_job_exits_nonzero(self):
+        paragraph_dir = os.path.join(self.tmpdir.name, 'paragraphs')
+        tmchem_dir = os.path.join(self.tmpdir.name, 'tmChem')
+        for path in (paragraph_dir, tmchem_dir):
+            os.makedirs(path)
+        open(os.path.join(paragraph_dir, '10001'), 'w').close()
+        open(os.path.join(tmchem_dir, 'tmChem.pl'), 'w').close()
+
+        args = argparse.Namespace(paragraph_path=paragraph_dir,
+                                  output_directory=os.path.join(self.tmpdir.name, 'output'),
+                                  tmchem=tmchem_dir, logdir=os.path.join(self.tmpdir.name, 'logs'),
+                                  bioshovel='/opt/bioshovel', shards=None, file_listing=None,
+                                  file_lists=False, nfiles=500, poolsize=1, memgb=4,
+                                  array=False, max_running=None, resume=None,
+                                  executor='local', queue='new', max_jobs=1, submit=True)
+        with mock.patch.object(chem_ner_cluster, 'get_executor') as get_executor, \
+             redirect_stdout(StringIO()), mock.patch('sys.stderr', new=StringIO()):
+            get_executor.return_value.wait.return_value = [JobResult('chem_ner_chunk0.job', '1', None,
+                                                                     1, 0.1, None)]
+            with self.assertRaises(SystemExit) as cm:
+                chem_ner_cluster.main(args)
+        self.assertEqual(cm.exception.code, 1)
+
+class PrepCoreNLPArrayTests(ArrayJobTestCase):
+
+    def create_array_job(self, **kwargs):
+        args = argparse.Namespace(corenlp='/opt/corenlp', bioshovel='/opt/bioshovel',
+                                  server=False, servers=1, max_running=20)
+        vars(args).update(kwargs)
+        job_file_path = prep_corenlp.create_array_job_file(self.tmpdir.name, '/output', self.manifest_path,
+                                                           1000, args)
+        self.assertValidBash(job_file_path)
+        with open(job_file_path) as f:
+            return f.read()
+
+    def test_array_job_file_runs_corenlp_sh_on_task_filelist(self):
+        job = self.create_array_job()
+        self.assertIn('#PBS -t 0-999%20\n', job)
+        self.assertIn('./corenlp.sh -outputFormat json -outputDirectory /output -filelist "$FILELIST"', job)
+
+    def test_server_array_job_file_runs_corenlp_annotate(self):
+        job = self.create_array_job(server=True)
+        self.assertIn('python3 -m preprocess.corenlp_annotate /output --filelist "$FILELIST"', job)
+        self.assertNotIn('corenlp.sh', job)
+
+    def test_array_job_is_not_created_without_input_files(self):
+        paragraph_dir = os.path.join(self.tmpdir.name, 'paragraphs')
+        corenlp_dir = os.path.join(self.tmpdir.name, 'corenlp')
+        output_dir = os.path.join(self.tmpdir.name, 'output')
+        for path in (paragraph_dir, corenlp_dir):
+            os.makedirs(path)
+        open(os.path.join(corenlp_dir, 'corenlp.sh'), 'w').close()
+
+        args = argparse.Namespace(paragraph_path=paragraph_dir, output_directory=output_dir,
+                                  corenlp=corenlp_dir, server=False, servers=1,
+                                  files_per_job=100, array=True, max_running=None,
+                                  shards=None, file_listing=None,
+                                  executor='local', queue='new', max_jobs=1, submit=True)
+        out = StringIO()
+        with mock.patch.object(prep_corenlp, 'get_executor') as get_executor, \
+             redirect_stdout(out), mock.patch('sys.stderr', new=StringIO()):
+            prep_corenlp.main(args)
+
+        self.assertIn('No input files found', out.getvalue())
+        self.assertFalse(get_executor.return_value.submit.called)
+        self.assertEqual(os.listdir(os.path.join(output_dir, 'job_files')), ['chunk_manifest.tsv'])
+
+    def test_single_job_files_are_valid_bash(self):
+        for server in (False, True):
+            args = argparse.Namespace(corenlp='/opt/corenlp', bioshovel='/opt/bioshovel',
+                                      server=server, servers=1)
+            self.assertValidBash(prep_corenlp.create_job_file(['/input/10001'], self.tmpdir.name,
+                                                              '/output', 0, args))
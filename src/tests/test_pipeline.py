@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+''' Tests for job dependencies and the preprocessing pipeline:
+
+    preprocess.cluster.util
+    preprocess.cluster.executors
+    preprocess.pipeline
+
+    (the pipeline runs end to end with the local executor, on sample MEDLINE
+    XML and a fake corenlp.sh)
+'''
+
+import argparse
+import os
+import tarfile
+import unittest
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from preprocess import pipeline
+from preprocess.cluster import executors
+from preprocess.cluster import util as cluster_util
+from tests import test_cluster_executors
+from tests.medline_sample_xml import sample_medline_xml
+from tests.test_cluster_executors import write_script
+
+PMIDS = ('17687753', '17687754')
+
+class PBSDependencyTests(unittest.TestCase):
+
+    def test_dependency_waits_for_jobs_and_array_jobs(self):
+        self.assertEqual(cluster_util.get_pbs_dependency(['12', '13']), 'afterok:12:13')
+        self.assertEqual(cluster_util.get_pbs_dependency(['12', '14[]']), 'afterok:12,afterokarray:14[]')
+
+class PBSExecutorDependencyTests(test_cluster_executors.PBSExecutorTests):
+
+    def qsub_calls(self):
+        with open(os.path.join(self.tmpdir.name, 'qsub_calls')) as f:
+            return f.read()
+
+    def test_jobs_are_submitted_with_afterok_dependency(self):
+        executor = executors.PBSExecutor()
+        job_id = executor.submit(self.job_file('a.job', 'echo 1\n'))
+        executor.submit(self.job_file('b.job', 'echo 2\n'), dependencies=[job_id])
+        self.assertEqual(self.qsub_calls(), '-q new a.job\n'
+                                            '-q new -W depend=afterok:1234 b.job\n')
+
+    def test_job_with_unsubmitted_dependency_is_not_submitted(self):
+        executor = executors.PBSExecutor()
+        self.assertIsNone(executor.submit(self.job_file('b.job', 'echo 2\n'), dependencies=[None]))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'qsub_calls')))
+        self.assertEqual([r.job_id for r in executor.wait()], [None])
+
+class LocalExecutorDependencyTests(test_cluster_executors.ExecutorTestCase):
+
+    def test_job_runs_after_its_dependencies(self):
+        first = self.job_file('first.job', '''
+            sleep 0.2
+            touch first.done
+            ''')
+        second = self.job_file('second.job', '''
+            test -f first.done
+            ''')
+
+        executor = executors.LocalExecutor(max_jobs=2)
+        job_id = executor.submit(first)
+        executor.submit(second, dependencies=[job_id])
+        results = executor.wait()
+
+        self.assertEqual([(r.job_file_path, r.status, r.skipped) for r in results],
+                         [(first, 0, False), (second, 0, False)])
+
+    def test_jobs_after_a_failed_job_are_skipped(self):
+        failing = self.job_file('failing.job', 'exit 2\n')
+        dependent = self.job_file('dependent.job', 'touch dependent.done\n')
+        independent = self.job_file('independent.job', 'echo 1\n')
+
+        executor = executors.LocalExecutor(max_jobs=1)
+        job_id = executor.submit(failing)
+        dependent_id = executor.submit(dependent, dependencies=[job_id])
+        executor.submit(dependent, dependencies=[dependent_id])
+        executor.submit(independent)
+        results = executor.wait()
+
+        self.assertEqual([(r.status, r.skipped) for r in results],
+                         [(2, False), (None, True), (None, True), (0, False)])
+        self.assertFalse(os.path.exists(os.path.join(self.job_dir, 'dependent.done')))
+
+        out = StringIO()
+        with redirect_stdout(out):
+            executors.print_job_summary(results)
+        self.assertIn('2 jobs (or array tasks) not run because a job they depend on failed', out.getvalue())
+
+    def test_job_waits_for_every_array_task(self):
+        array_job = self.job_file('array.job', '''
+            #PBS -t 0-2
+            sleep 0.$PBS_ARRAYID
+            touch task_$PBS_ARRAYID.done
+            ''')
+        dependent = self.job_file('dependent.job', '''
+            test -f task_0.done -a -f task_1.done -a -f task_2.done
+            ''')
+
+        executor = executors.LocalExecutor(max_jobs=4)
+        executor.submit(dependent, dependencies=[executor.submit(array_job)])
+        self.assertEqual([r.status for r in executor.wait()], [0, 0, 0, 0])
+
+class JobGraphTests(unittest.TestCase):
+
+    def get_chunk_stages(self, tmchem=None, dnorm=None):
+        return pipeline.get_chunk_stages(argparse.Namespace(tmchem=tmchem, dnorm=dnorm))
+
+    def test_ner_stages_are_optional(self):
+        self.assertEqual(self.get_chunk_stages(),
+                         OrderedDict([('parse', ()),
+                                      ('pubtator', ('parse', 'pubtator_split')),
+                                      ('corenlp', ('pubtator',)),
+                                      ('package', ('corenlp',))]))
+        self.assertEqual(self.get_chunk_stages(tmchem='/opt/tmChem', dnorm='/opt/DNorm')['package'],
+                         ('corenlp', 'chem_ner', 'disease_ner'))
+
+    def test_graph_is_per_chunk_with_deepdive_last(self):
+        job_graph = pipeline.get_job_graph(self.get_chunk_stages(tmchem='/opt/tmChem'), [0, 1],
+                                           deepdive=True)
+        jobs = [job for job, _ in job_graph]
+        self.assertEqual(len(jobs), 12)
+        self.assertEqual(dict(job_graph)[('chem_ner', 1)], [('pubtator', 1)])
+        self.assertEqual(job_graph[-1], (('deepdive', None), [('package', 0), ('package', 1)]))
+        # every job comes after its dependencies
+        for i, (job, dependencies) in enumerate(job_graph):
+            self.assertTrue(all(d in jobs[:i] for d in dependencies))
+
+    def test_bioconcepts_file_is_split_once_without_waiting_for_chunks(self):
+        job_graph = pipeline.get_job_graph(self.get_chunk_stages(), [0, 1, 2])
+        self.assertEqual(job_graph[0], (('pubtator_split', None), []))
+        self.assertEqual([job for job, _ in job_graph if job[0] == 'pubtator_split'],
+                         [('pubtator_split', None)])
+        # a chunk's jobs only wait for the split and that chunk's jobs
+        self.assertEqual(dict(job_graph)[('pubtator', 2)], [('parse', 2), ('pubtator_split', None)])
+        for (stage, chunk_num), dependencies in job_graph:
+            if chunk_num is not None:
+                self.assertTrue(all(d in (chunk_num, None) for _, d in dependencies))
+
+    def test_done_jobs_are_not_submitted_or_waited_for(self):
+        job_graph = pipeline.get_job_graph(self.get_chunk_stages(), [0])
+        job_file_paths = {job: '{}.job'.format(job[0]) for job, _ in job_graph if job[0] != 'parse'}
+
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda job_file_path, dependencies: job_file_path+'_id'
+        job_ids = pipeline.submit_jobs(job_graph, job_file_paths, executor)
+
+        self.assertEqual(executor.submit.call_args_list,
+                         [mock.call('pubtator_split.job', dependencies=[]),
+                          mock.call('pubtator.job', dependencies=['pubtator_split.job_id']),
+                          mock.call('corenlp.job', dependencies=['pubtator.job_id']),
+                          mock.call('package.job', dependencies=['corenlp.job_id'])])
+        self.assertNotIn(('parse', 0), job_ids)
+
+class PipelineLocalRunTests(test_cluster_executors.ExecutorTestCase):
+
+    ''' runs preprocess.pipeline end to end with the local executor on two
+        MEDLINE XML files (one chunk each), with a fake corenlp.sh
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.xml_dir = os.path.join(self.tmpdir.name, 'medline')
+        self.corenlp_dir = os.path.join(self.tmpdir.name, 'corenlp')
+        self.output_directory = os.path.join(self.tmpdir.name, 'pipeline')
+        self.bioconcepts_file = os.path.join(self.tmpdir.name, 'bioconcepts2pubtator_offsets')
+        os.makedirs(self.xml_dir)
+        os.makedirs(self.corenlp_dir)
+
+        with open(self.bioconcepts_file, 'w') as bioconcepts:
+            for i, pmid in enumerate(PMIDS):
+                with open(os.path.join(self.xml_dir, 'medline16n000{}.xml'.format(i+1)), 'w') as f:
+                    f.write(sample_medline_xml.replace(PMIDS[0], pmid))
+                bioconcepts.write('{0}|t|Title {0}\n'
+                                  '{0}|a|Abstract of {0}.\n'
+                                  '{0}\t0\t5\tTitle\tChemical\tMESH:D000001\n\n'.format(pmid))
+
+        self.write_corenlp('''
+            echo '{"sentences": []}' > "$OUTPUT_DIR/$(basename "$f").json"
+            ''')
+
+    def write_corenlp(self, command):
+
+        ''' fake corenlp.sh, runs command for each file $f in its -filelist
+        '''
+
+        write_script(os.path.join(self.corenlp_dir, 'corenlp.sh'), '''
+            #!/bin/bash
+            while [ $# -gt 0 ]; do
+              case "$1" in
+                -outputDirectory) OUTPUT_DIR="$2"; shift;;
+                -filelist) FILELIST="$2"; shift;;
+              esac
+              shift
+            done
+            while read -r f; do
+              {}
+            done < "$FILELIST"
+            '''.format(command.strip()))
+
+    def run_pipeline(self):
+
+        ''' Returns (exit status, output)
+        '''
+
+        args = argparse.Namespace(xml_file_directory=self.xml_dir,
+                                  bioconcepts_file=self.bioconcepts_file,
+                                  output_directory=self.output_directory,
+                                  corpus='medline', files_per_chunk=1,
+                                  corenlp=self.corenlp_dir, server=False, servers=1,
+                                  files_per_corenlp_job=100000,
+                                  tmchem=None, dnorm=None, poolsize=1, memgb=4,
+                                  deepdive=False,
+                                  bioshovel=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                  executor='local', queue='new', max_jobs=2,
+                                  submit=True)
+        out = StringIO()
+        status = 0
+        with redirect_stdout(out):
+            try:
+                pipeline.main(args)
+            except SystemExit as e:
+                status = e.code
+        return status, out.getvalue()
+
+    def test_chunks_are_packaged_for_deepdive(self):
+        status, out = self.run_pipeline()
+        self.assertEqual(status, 0, out)
+        self.assertIn('9 jobs (or array tasks) finished, 0 failed', out)
+
+        for i, pmid in enumerate(PMIDS):
+            with tarfile.open(os.path.join(self.output_directory, 'medline_{}_combined.tgz'.format(i))) as tgz:
+                self.assertEqual(sorted(name for name in tgz.getnames() if tgz.getmember(name).isfile()),
+                                 ['medline_{}/input_files/{}'.format(i, pmid),
+                                  'medline_{}/output_files/{}.json'.format(i, pmid),
+                                  'medline_{}/pubtator/{}'.format(i, pmid)])
+
+        # nothing left to run
+        status, out = self.run_pipeline()
+        self.assertEqual(status, 0)
+        self.assertIn('Created 0 PBS job files', out)
+
+    def test_failed_stage_is_rerun_on_restart(self):
+        self.write_corenlp('exit 1')
+        status, out = self.run_pipeline()
+        self.assertEqual(status, 1)
+        self.assertIn('2 jobs (or array tasks) not run because a job they depend on failed', out)
+        self.assertFalse(any(name.endswith('.tgz') for name in os.listdir(self.output_directory)))
+
+        self.write_corenlp('''
+            echo '{"sentences": []}' > "$OUTPUT_DIR/$(basename "$f").json"
+            ''')
+        status, out = self.run_pipeline()
+        self.assertEqual(status, 0, out)
+        self.assertIn('Created 4 PBS job files', out)
+        self.assertTrue(os.path.isfile(os.path.join(self.output_directory, 'medline_1_combined.tgz')))
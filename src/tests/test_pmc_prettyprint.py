@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+''' Tests for the PubMed Central XML pretty-printer:
+
+    preprocess.pmc_prettyprint
+'''
+
+import os
+import tempfile
+import time
+import unittest
+
+from lxml import etree
+from preprocess import pmc_prettyprint
+
+SAMPLE_NXML = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<!DOCTYPE article PUBLIC "-//NLM//DTD JATS (Z39.96) Journal Archiving and Interchange DTD v1.0 20120330//EN" "JATS-archivearticle1.dtd">\n'
+               '<article><front><article-meta><article-id pub-id-type="pmc">1</article-id>'
+               '</article-meta></front><body><p>Some <italic>text</italic>.</p></body></article>')
+
+MIXED_CONTENT_NXML = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<article>\n<front><article-meta><title-group>'
+                      '<article-title>Genes of <italic>Homo</italic> <italic>sapiens</italic></article-title>'
+                      '</title-group></article-meta></front>\n'
+                      '<body><p><italic>Homo</italic> <italic>sapiens</italic>\n<bold>and</bold> '
+                      '<italic>Mus musculus</italic></p><p>H<sub>2</sub>O <xref ref-type="bibr">1</xref>.</p></body>\n'
+                      '</article>')
+
+class PrettifyLxmlTests(unittest.TestCase):
+
+    def test_prettify_lxml_keeps_declaration_and_doctype(self):
+        pretty = pmc_prettyprint.prettify_lxml(SAMPLE_NXML.encode('utf-8')).decode('utf-8')
+        lines = pretty.splitlines()
+
+        self.assertTrue(lines[0].startswith('<?xml'))
+        self.assertTrue(lines[1].startswith('<!DOCTYPE article'))
+        self.assertIn('  <front>', lines)
+
+    def test_prettify_lxml_keeps_mixed_content_text(self):
+        original = etree.fromstring(MIXED_CONTENT_NXML.encode('utf-8'))
+        pretty_xml = pmc_prettyprint.prettify_lxml(MIXED_CONTENT_NXML.encode('utf-8'))
+        pretty = etree.fromstring(pretty_xml)
+
+        for tag in ('article-title', 'p'):
+            self.assertEqual([''.join(element.itertext()) for element in pretty.iter(tag)],
+                             [''.join(element.itertext()) for element in original.iter(tag)])
+        self.assertIn('<italic>Homo</italic> <italic>sapiens</italic>', pretty_xml.decode('utf-8'))
+
+        # only indentation is added between elements
+        self.assertEqual(''.join(''.join(pretty.itertext()).split()),
+                         ''.join(''.join(original.itertext()).split()))
+
+    def test_prettify_lxml_reindents_indented_input(self):
+        pretty = pmc_prettyprint.prettify_lxml(SAMPLE_NXML.encode('utf-8'))
+        self.assertEqual(pmc_prettyprint.prettify_lxml(MIXED_CONTENT_NXML.replace('<front>', '<front>\n    ').encode('utf-8')),
+                         pmc_prettyprint.prettify_lxml(MIXED_CONTENT_NXML.encode('utf-8')))
+        self.assertEqual(pmc_prettyprint.prettify_lxml(pretty), pretty)
+
+class PrettifyTreeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmpdir.name, 'pmc')
+        self.output_dir = os.path.join(self.tmpdir.name, 'pretty_pmc')
+        self.input_files = []
+        for journal in ('J_A', 'J_B'):
+            os.makedirs(os.path.join(self.input_dir, journal))
+            for i in range(2):
+                file_path = os.path.join(self.input_dir, journal, '{}.nxml'.format(i))
+                self.write(file_path, SAMPLE_NXML)
+                self.input_files.append(file_path)
+
+        # not .nxml
+        self.write(os.path.join(self.input_dir, 'J_A', 'figure.jpg'), 'binary')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, file_path, text):
+        with open(file_path, 'w') as f:
+            f.write(text)
+
+    def set_mtime(self, file_path, offset):
+        mtime = time.time() + offset
+        os.utime(file_path, (mtime, mtime))
+
+    def run_tree(self, skip='mtime'):
+        return pmc_prettyprint.prettify_tree(self.input_dir, self.output_dir,
+                                             poolsize=2, skip=skip, quiet=True)
+
+    def test_writes_nxml_files_with_same_layout(self):
+        stats = self.run_tree()
+
+        self.assertEqual(stats['written'], 4)
+        self.assertTrue(os.path.isfile(os.path.join(self.output_dir, 'J_B', '1.nxml')))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, 'J_A', 'figure.jpg')))
+
+    def test_mtime_skips_up_to_date_outputs(self):
+        self.run_tree()
+
+        # make one input newer than its output
+        self.set_mtime(self.input_files[0], 60)
+        stats = self.run_tree()
+
+        self.assertEqual((stats['written'], stats['skipped']), (1, 3))
+
+    def test_hash_skips_unchanged_inputs(self):
+        self.run_tree(skip='hash')
+
+        # touching a file doesn't change its hash
+        self.set_mtime(self.input_files[0], 60)
+        self.write(self.input_files[1], SAMPLE_NXML.replace('text', 'new text'))
+        stats = self.run_tree(skip='hash')
+
+        self.assertEqual((stats['written'], stats['skipped']), (1, 3))
+
+    def test_malformed_files_are_counted_as_failed(self):
+        self.write(self.input_files[0], '<article><front></article>')
+        stats = self.run_tree(skip='none')
+
+        self.assertEqual((stats['written'], stats['failed']), (3, 1))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+''' Tests for the memory-mapped PMID -> DOI index:
+
+    preprocess.pmid_doi_index
+    preprocess.parse_medline_xml (create_pmid_doi_mapping)
+'''
+
+import argparse
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from preprocess import (parse_medline_xml,
+                        pmid_doi_index)
+
+PMC_IDS_CSV = '''Journal Title,ISSN,eISSN,Year,Volume,Issue,Page,DOI,PMCID,PMID,Manuscript Id,Release Date
+Breast Cancer Res,1465-5411,1465-542X,2000,3,1,55,10.1186/bcr271,PMC13900,11250746,,live
+"Nucleic Acids Res, Special Issue",0305-1048,1362-4962,2000,28,1,1,10.1093/nar/28.1.1,PMC102409,10592168,,live
+Genome Biol,1474-7596,1474-760X,2001,2,1,,,PMC17486,11178279,,live
+Genome Biol,1474-7596,1474-760X,2001,2,1,,10.1186/gb-2001-2-1-reviews0001,PMC150440,,,live
+PLoS Biol,1544-9173,1545-7885,2003,1,1,E1,10.1371/journal.pbio.0000001,PMC212688,14551903,,live
+PLoS Biol,1544-9173,1545-7885,2003,1,1,E1,10.1371/journal.pbio.0000001.v2,PMC212689,14551903,,live
+'''
+
+class PMIDDOIIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmpdir.name, 'PMC-ids.csv')
+        self.index_path = os.path.join(self.tmpdir.name, 'PMC-ids.idx')
+        with open(self.csv_path, 'w') as f:
+            f.write(PMC_IDS_CSV)
+        self.count = pmid_doi_index.build_index(self.csv_path, self.index_path, quiet=True)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_quoted_commas_are_parsed(self):
+        self.assertIn(('10592168', '10.1093/nar/28.1.1'),
+                      list(pmid_doi_index.iter_pmid_doi_pairs(self.csv_path, quiet=True)))
+
+    def test_lookups(self):
+        with pmid_doi_index.PMIDDOIIndex(self.index_path) as index:
+            self.assertEqual(len(index), self.count)
+            self.assertEqual(index.get('11250746'), '10.1186/bcr271')
+            self.assertEqual(index['10592168'], '10.1093/nar/28.1.1')
+            # rows without a DOI or PMID aren't indexed
+            self.assertNotIn('11178279', index)
+            self.assertIsNone(index.get('12345678'))
+            self.assertEqual(index.get('not a pmid', 'default'), 'default')
+            with self.assertRaises(KeyError):
+                index['1']
+
+    def test_last_row_of_a_pmid_is_used(self):
+        self.assertEqual(self.count, 3)
+        with pmid_doi_index.PMIDDOIIndex(self.index_path) as index:
+            self.assertEqual(index.get('14551903'), '10.1371/journal.pbio.0000001.v2')
+
+    def test_lookup_over_many_pmids(self):
+        with open(self.csv_path, 'w') as f:
+            f.write('DOI,PMID\n')
+            for pmid in range(5000, 0, -7):
+                f.write('10.1000/{0},{0}\n'.format(pmid))
+        pmid_doi_index.build_index(self.csv_path, self.index_path, quiet=True)
+
+        with pmid_doi_index.PMIDDOIIndex(self.index_path, escape_slash=True) as index:
+            for pmid in range(1, 5001):
+                self.assertEqual(index.get(str(pmid)),
+                                 '10.1000%2F{}'.format(pmid) if (5000-pmid) % 7 == 0 else None)
+
+    def test_csv_file_is_not_an_index(self):
+        self.assertTrue(pmid_doi_index.is_index_file(self.index_path))
+        self.assertFalse(pmid_doi_index.is_index_file(self.csv_path))
+        with self.assertRaises(ValueError):
+            pmid_doi_index.PMIDDOIIndex(self.csv_path)
+
+    def test_parse_medline_xml_mapping_from_index_or_csv(self):
+        for doiindex in (self.index_path, self.csv_path):
+            with redirect_stdout(StringIO()), mock.patch('sys.stderr', new=StringIO()):
+                pmid_doi_map = parse_medline_xml.create_pmid_doi_mapping(argparse.Namespace(doiindex=doiindex))
+            self.assertEqual(pmid_doi_map.get('11250746'), '10.1186%2Fbcr271')
+            self.assertEqual(pmid_doi_map.get('10592168'), '10.1093%2Fnar%2F28.1.1')
+            self.assertIsNone(pmid_doi_map.get('11178279'))
+            if doiindex == self.index_path:
+                pmid_doi_map.close()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+''' Tests for compact PMID sets and the subset tools that use them:
+
+    preprocess.pmid_set
+    preprocess.create_medline_subset
+    preprocess.create_pubtator_subset (from a split bioconcepts file)
+    preprocess.split_pubtator
+'''
+
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from preprocess import (create_medline_subset,
+                        create_pubtator_subset,
+                        pmid_set,
+                        split_pubtator)
+
+PMIDS = ['17687753', '10592168', '', '11250746', 'not a pmid', '10592168']
+
+def contains_all(args):
+    set_path, pmids = args
+    with pmid_set.PMIDSet(set_path) as pmids_of_interest:
+        return all(pmid in pmids_of_interest for pmid in pmids)
+
+class PMIDSetTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pmid_file = os.path.join(self.tmpdir.name, 'pmids.txt')
+        self.set_path = os.path.join(self.tmpdir.name, 'pmids.set')
+        with open(self.pmid_file, 'w') as f:
+            f.write('\n'.join(PMIDS)+'\n')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assertHasPMIDs(self, pmids):
+        self.assertEqual(list(pmids), [10592168, 11250746, 17687753])
+        self.assertIn('17687753', pmids)
+        self.assertIn(10592168, pmids)
+        self.assertNotIn('17687754', pmids)
+        self.assertNotIn('10.1371%2Fjournal.pbio.0000001', pmids)
+        self.assertNotIn(0, pmids)
+
+    def test_text_file(self):
+        self.assertFalse(pmid_set.is_pmid_set_file(self.pmid_file))
+        with pmid_set.PMIDSet(self.pmid_file) as pmids:
+            self.assertHasPMIDs(pmids)
+
+    def test_set_file(self):
+        self.assertEqual(pmid_set.build_pmid_set(self.pmid_file, self.set_path), 3)
+        self.assertEqual(os.path.getsize(self.set_path), pmid_set.HEADER_SIZE+3*8)
+        with pmid_set.PMIDSet(self.set_path) as pmids:
+            self.assertHasPMIDs(pmids)
+
+    def test_set_file_shared_by_pool_processes(self):
+        pmid_set.build_pmid_set(self.pmid_file, self.set_path)
+        with mp.Pool(2) as pool:
+            results = pool.map(contains_all, [(self.set_path, ['17687753', '11250746']),
+                                              (self.set_path, ['10592168', '1'])])
+        self.assertEqual(results, [True, False])
+
+    def test_medline_subset(self):
+        medline_dir = os.path.join(self.tmpdir.name, 'medline', '0000', 'by_pmid')
+        output_dir = os.path.join(self.tmpdir.name, 'subset')
+        os.makedirs(medline_dir)
+        for pmid in ('17687753', '17687754', '11250746'):
+            with open(os.path.join(medline_dir, pmid), 'w') as f:
+                f.write('title\tTitle {}\n'.format(pmid))
+        pmid_set.build_pmid_set(self.pmid_file, self.set_path)
+
+        args = argparse.Namespace(pmid_file=self.set_path,
+                                  medline_paragraph_path=os.path.join(self.tmpdir.name, 'medline'),
+                                  output_directory=output_dir,
+                                  link=None, threads=2, archive=None, notqdm=True)
+        with redirect_stdout(StringIO()), mock.patch('sys.stderr', new=StringIO()):
+            create_medline_subset.main(args)
+        self.assertEqual(sorted(os.listdir(os.path.join(output_dir, '0000'))),
+                         ['11250746', '17687753'])
+
+    def test_pubtator_subset_from_split_files(self):
+        bioconcepts_file = os.path.join(self.tmpdir.name, 'bioconcepts2pubtator_offsets')
+        split_dir = os.path.join(self.tmpdir.name, 'split')
+        output_dir = os.path.join(self.tmpdir.name, 'subset')
+        with open(bioconcepts_file, 'w') as f:
+            for pmid in ('17687754', '10592168', '11250746', '17687753', '24000000'):
+                f.write('{0}|t|Title {0}\n'
+                        '{0}|a|Abstract of {0}.\n'
+                        '{0}\t0\t5\tTitle\tChemical\tMESH:D000001\n\n'.format(pmid))
+
+        records = create_pubtator_subset.produce_records(bioconcepts_file)
+        self.assertEqual(split_pubtator.split_records(records, split_dir, pmids_per_file=1000000), 5)
+        self.assertEqual(sorted(os.listdir(split_dir)),
+                         ['010000000', '011000000', '017000000', '024000000'])
+        with open(os.path.join(split_dir, '017000000')) as f:
+            self.assertEqual(f.read().count('|t|'), 2)
+
+        # only the split files with PMIDs of the subset are read
+        with pmid_set.PMIDSet(self.pmid_file) as pmids:
+            self.assertEqual(create_pubtator_subset.get_split_files(split_dir, pmids),
+                             [os.path.join(split_dir, name)
+                              for name in ('010000000', '011000000', '017000000')])
+
+        args = argparse.Namespace(pmid_file=self.pmid_file, bioconcepts_file=split_dir,
+                                  output_directory=output_dir, c=False)
+        with redirect_stdout(StringIO()), mock.patch('sys.stderr', new=StringIO()):
+            create_pubtator_subset.main(args)
+        for subdir in ('pubtator', 'abstracts'):
+            self.assertEqual(sorted(os.listdir(os.path.join(output_dir, subdir))),
+                             ['10592168', '11250746', '17687753'])
+        with open(os.path.join(output_dir, 'pubtator', '17687753')) as f:
+            self.assertEqual(f.read().splitlines(),
+                             ['17687753|t|Title 17687753',
+                              '17687753|a|Abstract of 17687753.',
+                              '17687753\t0\t5\tTitle\tChemical\tMESH:D000001'])
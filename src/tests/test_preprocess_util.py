@@ -122,6 +122,49 @@ class UtilTestCase(unittest.TestCase):
             self.assertEqual(num_dirs, 5)
             self.assertEqual(num_files, 10)
 
+    def test_reorganize_directory_skips_small_directories(self):
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            for i in range(3):
+                open(os.path.join(tmpdirname, 'test{}'.format(i)), 'w').close()
+            util.reorganize_directory(tmpdirname, max_files_per_subdir=3)
+            self.assertEqual(sorted(os.listdir(tmpdirname)), ['test0', 'test1', 'test2'])
+
+    def test_create_sublist_symlinks(self):
+
+        ''' create_sublist_symlinks() should link each file in a sublist
+            (skipping None filler values) into subdirectories of no more than
+            max_files files
+        '''
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            sublist = []
+            for i in range(5):
+                file_path = os.path.join(tmpdirname, 'test{}'.format(i))
+                open(file_path, 'w').close()
+                sublist.append(file_path)
+            sublist_dir = os.path.join(tmpdirname, 'sublist_0000')
+            os.mkdir(sublist_dir)
+
+            util.create_sublist_symlinks(sublist+[None, None], sublist_dir, max_files=2)
+            self.assertEqual(sorted(os.listdir(sublist_dir)), ['0000', '0001', '0002'])
+            self.assertEqual(sorted(os.listdir(os.path.join(sublist_dir, '0001'))), ['test2', 'test3'])
+            link_path = os.path.join(sublist_dir, '0002', 'test4')
+            self.assertTrue(os.path.islink(link_path))
+            self.assertEqual(os.readlink(link_path), sublist[4])
+
+    def test_file_list_in_place_of_a_directory(self):
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            sublist = [os.path.join(tmpdirname, 'test{}'.format(i)) for i in range(3)]
+            for file_path in sublist:
+                open(file_path, 'w').close()
+            file_list_path = os.path.join(tmpdirname, 'sublist_0000.txt')
+
+            self.assertEqual(util.write_file_list(sublist+[None], file_list_path), 3)
+            self.assertEqual(list(util.iter_input_files(file_list_path)), sublist)
+            self.assertEqual(list(util.iter_input_files(tmpdirname)), [file_list_path]+sublist)
+
     def test_calc_dnorm_num_processes(self):
 
         ''' test that the number of processes is returned correctly, given
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+''' Tests for the downloader rate limiter:
+
+    downloaders.rate_limit
+'''
+
+import unittest
+
+from downloaders import rate_limit
+
+class FakeClock(object):
+
+    ''' Manually advanced replacement for time.monotonic
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TokenBucketTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = rate_limit.TokenBucket(2, 3, clock=self.clock)
+
+    def test_burst_requests_do_not_wait(self):
+        delays = [self.bucket.reserve() for _ in range(3)]
+        self.assertEqual(delays, [0, 0, 0])
+
+    def test_requests_beyond_burst_are_queued_at_rate(self):
+        for _ in range(3):
+            self.bucket.reserve()
+
+        # 2 requests/second -> each extra request waits another 0.5s
+        self.assertAlmostEqual(self.bucket.reserve(), 0.5)
+        self.assertAlmostEqual(self.bucket.reserve(), 1.0)
+
+    def test_tokens_refill_over_time(self):
+        for _ in range(3):
+            self.bucket.reserve()
+        self.clock.now += 1.0
+        self.assertEqual(self.bucket.reserve(), 0)
+        self.assertEqual(self.bucket.reserve(), 0)
+        self.assertGreater(self.bucket.reserve(), 0)
+
+    def test_slow_down_and_recover(self):
+        self.bucket.slow_down()
+        self.assertEqual(self.bucket.rate, 1)
+
+        # bucket is drained after slowing down
+        self.assertAlmostEqual(self.bucket.reserve(), 1.0)
+
+        for _ in range(20):
+            self.bucket.speed_up()
+        self.assertEqual(self.bucket.rate, 2)
+
+    def test_rate_never_drops_below_min_rate(self):
+        for _ in range(20):
+            self.bucket.slow_down()
+        self.assertEqual(self.bucket.rate, self.bucket.min_rate)
+
+class RateLimiterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = rate_limit.RateLimiter(1, 1, host_limits={'fast.org': (10, 5)})
+
+    def test_hosts_have_separate_buckets(self):
+        self.assertEqual(self.limiter.reserve('http://slow.org/a'), 0)
+        self.assertGreater(self.limiter.reserve('http://slow.org/b'), 0)
+        self.assertEqual(self.limiter.reserve('http://fast.org/a'), 0)
+
+    def test_host_limits_are_used(self):
+        bucket = self.limiter.get_bucket('http://fast.org/page?id=1')
+        self.assertEqual((bucket.rate, bucket.burst), (10, 5))
+
+    def test_report_slows_down_on_429_and_503(self):
+        for status in (429, 503):
+            self.limiter.report('http://fast.org/', status)
+        self.assertEqual(self.limiter.get_bucket('http://fast.org/').rate, 2.5)
+
+    def test_report_ignores_other_errors(self):
+        self.limiter.report('http://fast.org/', 404)
+        self.assertEqual(self.limiter.get_bucket('http://fast.org/').rate, 10)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+''' Tests for asynchronous webscraping helpers:
+
+    downloaders.web_util
+
+    (runs against a local aiohttp stub server)
+'''
+
+import asyncio
+import logging
+import threading
+import unittest
+from collections import Counter
+
+from aiohttp import web
+
+from downloaders import (rate_limit,
+                         web_util)
+
+class StubServer(object):
+
+    ''' aiohttp server running in a background thread on a free local port
+
+        Routes:
+        /page/{name}    returns 'page {name}'
+        /json           returns {"ok": true}
+        /flaky          returns 503 on the first request, then 'recovered'
+        /missing        always returns 404
+        /notjson        returns a body that isn't JSON
+        /notutf8        returns a body that isn't UTF-8
+        /article?id=    returns 'article {id}' with an ETag (or 404 for ids
+                        in self.missing)
+        /issue?id=      returns the HTML in self.issues[id] (or 404)
+
+        self.query_hits counts /article and /issue requests per id
+
+        self.hits counts requests per path
+    '''
+
+    def __init__(self):
+        self.hits = Counter()
+        self.query_hits = Counter()
+        self.missing = set()
+        self.issues = {}
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    async def handle(self, request):
+        path = request.path
+        self.hits[path] += 1
+        if path.startswith('/page/'):
+            return web.Response(text='page {}'.format(request.match_info['name']))
+        if path == '/json':
+            return web.json_response({'ok': True})
+        if path == '/flaky' and self.hits[path] == 1:
+            return web.Response(status=503)
+        if path == '/flaky':
+            return web.Response(text='recovered')
+        if path == '/article':
+            article_id = request.query['id']
+            self.query_hits[article_id] += 1
+            if article_id in self.missing:
+                return web.Response(status=404)
+            return web.Response(text='article {}'.format(article_id),
+                                headers={'ETag': '"{}"'.format(len(article_id))})
+        if path == '/issue':
+            issue_id = request.query['id']
+            self.query_hits[issue_id] += 1
+            if issue_id not in self.issues:
+                return web.Response(status=404)
+            return web.Response(text=self.issues[issue_id], content_type='text/html')
+        if path == '/notjson':
+            return web.Response(text='<html>Service unavailable</html>')
+        if path == '/notutf8':
+            return web.Response(body=b'caf\xe9')
+        return web.Response(status=404)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.router.add_get('/page/{name}', self.handle)
+        app.router.add_get('/{name}', self.handle)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+
+    def start(self):
+        self.thread.start()
+        self.started.wait()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def url(self, path):
+        return 'http://127.0.0.1:{}{}'.format(self.port, path)
+
+class WebUtilTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer()
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.hits.clear()
+        self.server.query_hits.clear()
+        self.server.missing.clear()
+        self.server.issues.clear()
+        # silence expected fetch failure warnings
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+class FetchAndMapTests(WebUtilTestCase):
+
+    def test_fetch_and_map_returns_mapped_results(self):
+        data = {i: (self.server.url('/page/{}'.format(i)), None) for i in range(20)}
+        res = web_util.fetch_and_map(lambda key, text: text.upper(), data,
+                                     MAX_CONNECTIONS=4, progress=False)
+        self.assertEqual(res, {i: 'PAGE {}'.format(i) for i in range(20)})
+
+    def test_fetch_and_map_json(self):
+        data = {'a': (self.server.url('/json'), None)}
+        res = web_util.fetch_and_map(lambda key, json: json['ok'], data,
+                                     rettype='json', progress=False)
+        self.assertEqual(res, {'a': True})
+
+    def test_fetch_and_map_raw(self):
+        data = {'a': (self.server.url('/page/a'), None)}
+        res = web_util.fetch_and_map(lambda key, raw: raw, data,
+                                     rettype='raw', progress=False)
+        content, headers = res['a']
+        self.assertEqual(content, b'page a')
+        self.assertIn('Content-Type', headers)
+
+    def test_fetch_and_map_accepts_iterable_of_pairs(self):
+        data = ((i, (self.server.url('/page/{}'.format(i)), None)) for i in range(5))
+        res = web_util.fetch_and_map(lambda key, text: text, data, progress=False)
+        self.assertEqual(len(res), 5)
+
+    def test_fetch_and_map_streams_to_callback(self):
+        data = {i: (self.server.url('/page/{}'.format(i)), None) for i in range(10)}
+        streamed = {}
+        res = web_util.fetch_and_map(lambda key, text: text, data,
+                                     callback=streamed.__setitem__,
+                                     progress=False)
+        self.assertIsNone(res)
+        self.assertEqual(len(streamed), 10)
+        self.assertEqual(streamed[3], 'page 3')
+
+    def test_retryable_error_is_retried(self):
+        data = {'flaky': (self.server.url('/flaky'), None)}
+        res = web_util.fetch_and_map(lambda key, text: text, data,
+                                     RETRY_WAIT_TIME=0.01, progress=False)
+        self.assertEqual(res, {'flaky': 'recovered'})
+        self.assertEqual(self.server.hits['/flaky'], 2)
+
+    def test_client_error_is_not_retried(self):
+        data = {'missing': (self.server.url('/missing'), None),
+                'found': (self.server.url('/page/x'), None)}
+        res = web_util.fetch_and_map(lambda key, text: text, data,
+                                     RETRY_WAIT_TIME=0.01, progress=False)
+        self.assertEqual(res, {'found': 'page x'})
+        self.assertEqual(self.server.hits['/missing'], 1)
+
+    def test_undecodable_body_is_a_failed_fetch(self):
+        for path, found_path, rettype in (('/notjson', '/json', 'json'),
+                                          ('/notutf8', '/page/x', 'text')):
+            data = {'bad': (self.server.url(path), None),
+                    'found': (self.server.url(found_path), None)}
+            res = web_util.fetch_and_map(lambda key, body: body, data,
+                                         rettype=rettype, RETRY_WAIT_TIME=0.01,
+                                         progress=False)
+            self.assertEqual(list(res), ['found'])
+            self.assertEqual(self.server.hits[path], 1)
+
+    def test_rate_limiter_slows_down_on_503(self):
+        limiter = rate_limit.RateLimiter(100, 10)
+        data = {'flaky': (self.server.url('/flaky'), None)}
+        res = web_util.fetch_and_map(lambda key, text: text, data,
+                                     RETRY_WAIT_TIME=0.01,
+                                     rate_limiter=limiter,
+                                     progress=False)
+        self.assertEqual(res, {'flaky': 'recovered'})
+
+        # halved after the 503, then recovered by 10% after the success
+        bucket = limiter.get_bucket(self.server.url('/flaky'))
+        self.assertAlmostEqual(bucket.rate, 60)
+
+class BackoffTests(unittest.TestCase):
+
+    def test_backoff_delay_is_bounded(self):
+        for attempt in range(10):
+            delay = web_util.backoff_delay(attempt, 0.1, 2)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(2, 0.1 * 2 ** attempt))